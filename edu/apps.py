@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EduConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'edu'
+
+    def ready(self):
+        # الأعمدة المشتقة على Question (edu/visibility.py)
+        import edu.signals  # noqa
@@ -0,0 +1,180 @@
+# edu/management/commands/curriculum_visibility.py
+"""
+الأعمدة المشتقة على Question / Lesson / FlashCard (+ LessonProgress / FavoriteLesson) (edu/visibility.py):
+
+    python manage.py curriculum_visibility backfill --batch-size 5000
+    python manage.py curriculum_visibility backfill --kinds lesson,flashcard
+    python manage.py curriculum_visibility status                  # كام صف قيمه مش متزامنة
+    python manage.py curriculum_visibility explain --year y3       # EXPLAIN ANALYZE: الـ OR القديم vs الأعمدة
+    python manage.py curriculum_visibility explain --synthetic 500000
+
+explain: نفس استعلامات StudentQuestions (count + أول صفحة بترتيب الـ id) مرة بفلاتر الـ
+joins القديمة ومرة بـ resolved_year / is_visible. --synthetic بيضيف أسئلة وهمية موزعة على
+الدروس / الموديولات الموجودة جوه transaction وبيعملها rollback فى الآخر.
+
+آخر قياس (PostgreSQL 16، 500k سؤال وهمى على 5 سنين / 40 موديول / 600 درس، year y1):
+
+    sources                        legacy OR joins         resolved columns
+    qbank,exam_review,old_exam     count 656.6 ms          count 60.2 ms   (bitmap على resolved_year)
+                                   page   16.6 ms          page   0.08 ms  (pkey + filter)
+    qbank                          count 366.5 ms          count 47.7 ms   (edu_q_visible_year_src_id)
+                                   page    1.6 ms          page   0.10 ms  (edu_q_visible_year_src_id)
+
+القديم: Parallel Seq Scan على edu_question كله + 9 hash joins والـ OR بيتفلتر بعد الـ joins.
+"""
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q
+
+from edu.models import FlashCard, Lesson, Question, Year
+from edu.visibility import KINDS, refresh_range, stale
+
+_SYNTHETIC_SQL = """
+    WITH l AS (SELECT array_agg(id) AS a FROM edu_lesson),
+         m AS (SELECT array_agg(id) AS a FROM edu_module)
+    INSERT INTO edu_question (text, question_type, source_type, exam_kind, exam_year, grade, part_type,
+                              is_tbl, is_flipped, created_at, is_visible, lesson_id, module_id)
+    SELECT 'synthetic #' || g,
+           CASE WHEN g %% 5 = 0 THEN 'written' ELSE 'mcq' END,
+           (ARRAY['qbank', 'exam_review', 'old_exam'])[1 + g %% 3],
+           'none',
+           CASE WHEN g %% 3 = 0 THEN (2015 + g %% 10)::text END,
+           'na', 'theoretical', FALSE, FALSE, now(), FALSE,
+           CASE WHEN l.a IS NOT NULL AND g %% 3 <> 0 THEN l.a[1 + g %% cardinality(l.a)] END,
+           CASE WHEN l.a IS NULL OR g %% 3 = 0 THEN m.a[1 + g %% cardinality(m.a)] END
+    FROM generate_series(1, %s) AS g, l, m
+"""
+
+
+def _legacy(year):
+    """فلاتر StudentQuestions قبل الأعمدة المشتقة."""
+    return Question.objects.filter(
+        Q(lesson__subject__module__semester__year=year) |
+        Q(subject__module__semester__year=year) |
+        Q(module__semester__year=year) |
+        Q(year__code=year.code)
+    ).filter(
+        Q(lesson__subject__module__is_ready=True) |
+        Q(subject__module__is_ready=True) |
+        Q(module__is_ready=True)
+    )
+
+
+def _denormalized(year):
+    return Question.objects.filter(resolved_year=year, is_visible=True)
+
+
+_MODELS = {"question": Question, "lesson": Lesson, "flashcard": FlashCard}
+
+
+class Command(BaseCommand):
+    help = "Backfill resolved_year / is_visible on questions, lessons and flashcards, check drift, or EXPLAIN the student filters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["backfill", "status", "explain"])
+        parser.add_argument("--kinds", default=",".join(KINDS), help="backfill / status: question,lesson,flashcard")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--year", default=None, help="كود السنة (الافتراضى: أكتر سنة فيها أسئلة)")
+        parser.add_argument("--sources", default="qbank,exam_review,old_exam")
+        parser.add_argument("--synthetic", type=int, default=0, help="explain على N سؤال وهمى (rollback فى الآخر)")
+        parser.add_argument("--plans", action="store_true", help="اطبع الـ plans كاملة")
+
+    def handle(self, *args, **opts):
+        getattr(self, f"_{opts['action']}")(opts)
+
+    def _kinds(self, opts):
+        kinds = [k for k in opts["kinds"].split(",") if k]
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            raise CommandError(f"Unknown kinds: {', '.join(sorted(unknown))}")
+        return kinds
+
+    def _backfill(self, opts):
+        for kind in self._kinds(opts):
+            model = _MODELS[kind]
+            bounds = model.objects.aggregate(lo=Min("id"), hi=Max("id"))
+            if bounds["lo"] is None:
+                self.stdout.write(f"no {kind} rows")
+                continue
+            step = max(1, opts["batch_size"])
+            changed = 0
+            t0 = time.perf_counter()
+            for start in range(bounds["lo"], bounds["hi"] + 1, step):
+                with transaction.atomic():
+                    changed += len(refresh_range(kind, start, start + step))
+                self.stdout.write(f"\r{kind} {min(start + step - 1, bounds['hi'])}/{bounds['hi']}  changed {changed}",
+                                  ending="")
+                self.stdout.flush()
+            self.stdout.write("")
+            self.stdout.write(self.style.SUCCESS(f"{changed} {kind} rows updated in {time.perf_counter() - t0:.1f}s"))
+
+    def _status(self, opts):
+        for kind in self._kinds(opts):
+            totals = _MODELS[kind].objects.aggregate(total=Count("id"), visible=Count("id", filter=Q(is_visible=True)))
+            out = stale(kind)   # lesson: + LessonProgress / FavoriteLesson
+            line = f"{kind:<10} {totals['total']:>8} rows  {totals['visible']:>8} visible  "
+            if out:
+                self.stdout.write(line + self.style.WARNING(f"{out} out of sync → curriculum_visibility backfill"))
+            else:
+                self.stdout.write(line + self.style.SUCCESS("in sync"))
+
+    def _explain(self, opts):
+        with transaction.atomic():
+            if opts["synthetic"]:
+                self._seed(opts["synthetic"])
+            year = self._year(opts["year"])
+            sources = [s for s in opts["sources"].split(",") if s]
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"year {year.code}  sources {','.join(sources)}  rows {Question.objects.count()}"
+            ))
+            for label, qs in (("legacy OR joins", _legacy(year)), ("resolved columns", _denormalized(year))):
+                qs = qs.filter(source_type__in=sources, is_tbl=False, is_flipped=False)
+                self._report(label, "count", qs.order_by(), opts["plans"], count=True)
+                self._report(label, "page", qs.order_by("id")[:20], opts["plans"])
+            transaction.set_rollback(True)   # الـ synthetic rows ما تتحفظش
+
+    def _seed(self, n):
+        if connection.vendor != "postgresql":
+            raise CommandError("--synthetic needs PostgreSQL")
+        first = (Question.objects.aggregate(hi=Max("id"))["hi"] or 0) + 1
+        t0 = time.perf_counter()
+        with connection.cursor() as cur:
+            cur.execute("SELECT count(*) FROM edu_module")
+            if not cur.fetchone()[0]:
+                raise CommandError("--synthetic needs at least one module")
+            cur.execute(_SYNTHETIC_SQL, [n])
+            cur.execute("SELECT max(id) FROM edu_question")
+            last = cur.fetchone()[0]
+            refresh_range("question", first, last + 1)
+            cur.execute("ANALYZE edu_question")
+        self.stdout.write(f"seeded {n} synthetic questions in {time.perf_counter() - t0:.1f}s (rolled back at the end)")
+
+    def _year(self, code):
+        if code:
+            year = Year.objects.filter(code=code).first()
+            if year is None:
+                raise CommandError(f"Year {code!r} not found")
+            return year
+        top = (Question.objects.exclude(resolved_year=None).values("resolved_year")
+               .annotate(n=Count("id")).order_by("-n").first())
+        if top is None:
+            raise CommandError("No questions with a resolved year; run backfill or pass --year")
+        return Year.objects.get(pk=top["resolved_year"])
+
+    def _report(self, label, kind, qs, show_plan, count=False):
+        sql, params = qs.query.sql_with_params()
+        if count:
+            sql = f"SELECT count(*) FROM ({sql}) sub"
+        with connection.cursor() as cur:
+            cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+            plan = "\n".join(r[0] for r in cur.fetchall())
+        ms = re.search(r"Execution Time: ([\d.]+) ms", plan)
+        buffers = re.search(r"Buffers: shared hit=(\d+)(?: read=(\d+))?", plan)
+        pages = (int(buffers.group(1)) + int(buffers.group(2) or 0)) if buffers else 0
+        self.stdout.write(f"  {label:<17} {kind:<5}  {float(ms.group(1)) if ms else 0:9.2f} ms  "
+                          f"{pages:>8} buffers  {plan.splitlines()[0].split('  (')[0].strip()}")
+        if show_plan:
+            self.stdout.write(plan)
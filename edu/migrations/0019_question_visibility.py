@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu', '0018_module_is_ready'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='is_visible',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='resolved_module',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.module'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='resolved_year',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.year'),
+        ),
+        # backfill (نفس edu/visibility.py)؛ بعد كده Question.save / edu/signals.py بيظبطوها
+        migrations.RunSQL(
+            sql="""
+                UPDATE edu_question q
+                SET resolved_year_id = r.year_id, resolved_module_id = r.module_id, is_visible = r.visible
+                FROM (
+                    SELECT q2.id,
+                           COALESCE(lsem.year_id, ssem.year_id, msem.year_id, q2.year_id) AS year_id,
+                           COALESCE(ls.module_id, s.module_id, q2.module_id) AS module_id,
+                           (COALESCE(lm.is_ready, FALSE) OR COALESCE(sm.is_ready, FALSE)
+                            OR COALESCE(m.is_ready, FALSE)) AS visible
+                    FROM edu_question q2
+                    LEFT JOIN edu_lesson l ON l.id = q2.lesson_id
+                    LEFT JOIN edu_subject ls ON ls.id = l.subject_id
+                    LEFT JOIN edu_module lm ON lm.id = ls.module_id
+                    LEFT JOIN edu_semester lsem ON lsem.id = lm.semester_id
+                    LEFT JOIN edu_subject s ON s.id = q2.subject_id
+                    LEFT JOIN edu_module sm ON sm.id = s.module_id
+                    LEFT JOIN edu_semester ssem ON ssem.id = sm.semester_id
+                    LEFT JOIN edu_module m ON m.id = q2.module_id
+                    LEFT JOIN edu_semester msem ON msem.id = m.semester_id
+                ) r
+                WHERE q.id = r.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['resolved_year', 'source_type', 'id'], name='edu_q_visible_year_src_id'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['module', 'exam_year'], name='edu_q_visible_module_examyr'),
+        ),
+    ]
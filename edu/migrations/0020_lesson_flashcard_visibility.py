@@ -0,0 +1,113 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu', '0019_question_visibility'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favoritelesson',
+            name='is_visible',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='favoritelesson',
+            name='resolved_year',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.year'),
+        ),
+        migrations.AddField(
+            model_name='flashcard',
+            name='is_visible',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='flashcard',
+            name='resolved_year',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.year'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='is_visible',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='resolved_year',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.year'),
+        ),
+        migrations.AddField(
+            model_name='lessonprogress',
+            name='is_visible',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lessonprogress',
+            name='resolved_year',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.year'),
+        ),
+        # backfill (نفس edu/visibility.py): الدروس، بعدين النسخ فى progress / favorites، بعدين الكروت
+        migrations.RunSQL(
+            sql="""
+                UPDATE edu_lesson l
+                SET resolved_year_id = sem.year_id, is_visible = m.is_ready
+                FROM edu_subject s
+                JOIN edu_module m ON m.id = s.module_id
+                JOIN edu_semester sem ON sem.id = m.semester_id
+                WHERE s.id = l.subject_id;
+
+                UPDATE edu_lessonprogress t
+                SET resolved_year_id = l.resolved_year_id, is_visible = l.is_visible
+                FROM edu_lesson l WHERE l.id = t.lesson_id;
+
+                UPDATE edu_favoritelesson t
+                SET resolved_year_id = l.resolved_year_id, is_visible = l.is_visible
+                FROM edu_lesson l WHERE l.id = t.lesson_id;
+
+                UPDATE edu_flashcard f
+                SET resolved_year_id = r.resolved_year_id, is_visible = r.is_visible
+                FROM (
+                    SELECT f2.id,
+                           COALESCE(lsem.year_id, ssem.year_id) AS resolved_year_id,
+                           (COALESCE(lm.is_ready, FALSE) OR COALESCE(sm.is_ready, FALSE)) AS is_visible
+                    FROM edu_flashcard f2
+                    LEFT JOIN edu_lesson l ON l.id = f2.lesson_id
+                    LEFT JOIN edu_subject ls ON ls.id = l.subject_id
+                    LEFT JOIN edu_module lm ON lm.id = ls.module_id
+                    LEFT JOIN edu_semester lsem ON lsem.id = lm.semester_id
+                    LEFT JOIN edu_subject s ON s.id = f2.subject_id
+                    LEFT JOIN edu_module sm ON sm.id = s.module_id
+                    LEFT JOIN edu_semester ssem ON ssem.id = sm.semester_id
+                ) r
+                WHERE f.id = r.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='favoritelesson',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['user', 'resolved_year', 'created_at'], name='edu_fav_visible_user_year'),
+        ),
+        migrations.AddIndex(
+            model_name='flashcard',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['resolved_year', 'owner_type', 'owner'], name='edu_fc_visible_year_owner'),
+        ),
+        migrations.AddIndex(
+            model_name='flashcard',
+            index=models.Index(fields=['owner', 'resolved_year'], name='edu_fc_owner_year'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['resolved_year', 'subject', 'order'], name='edu_lesson_visible_year_subj'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonprogress',
+            index=models.Index(fields=['user', 'resolved_year', 'is_done'], name='edu_lp_user_year_done'),
+        ),
+    ]
@@ -131,8 +131,19 @@ class Lesson(models.Model):
     ) 
     order = models.PositiveIntegerField(default=1, db_index=True)
 
+    # مشتقة (edu/visibility.py): سنة الـ subject → module → semester، وهل الموديول جاهز
+    resolved_year = models.ForeignKey(
+        "edu.Year", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+",
+    )
+    is_visible = models.BooleanField(default=False, editable=False)
+
     class Meta:
         unique_together = ("subject", "title")
+        indexes = [
+            # StudentLessons / MaterialsHome: سنة الطالب + المادة
+            models.Index(fields=["resolved_year", "subject", "order"], condition=models.Q(is_visible=True),
+                         name="edu_lesson_visible_year_subj"),
+        ]
         ordering = [
             "subject__module__semester__year__order",
             "subject__module__semester__order",
@@ -142,6 +153,13 @@ class Lesson(models.Model):
             "id",
         ]
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .visibility import refresh
+        changed = refresh("lesson", "lesson", [self.pk])   # بيحدّث LessonProgress / FavoriteLesson كمان
+        if changed:
+            _, self.resolved_year_id, self.is_visible = changed[0]
+
     def __str__(self):
         return f"{self.subject} / {self.title}"
 
@@ -154,12 +172,24 @@ class LessonProgress(models.Model):
     is_done = models.BooleanField(default=True)
     completed_at = models.DateTimeField(auto_now_add=True)
 
+    # نسخة من الـ Lesson (edu/visibility.py) علشان قوايم الطالب ما تعملش join
+    resolved_year = models.ForeignKey(
+        "edu.Year", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+",
+    )
+    is_visible = models.BooleanField(default=False, editable=False)
+
     class Meta:
         unique_together = ("user", "lesson")
         indexes = [
             models.Index(fields=["user", "lesson"]),
+            models.Index(fields=["user", "resolved_year", "is_done"], name="edu_lp_user_year_done"),
         ]
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.resolved_year_id, self.is_visible = self.lesson.resolved_year_id, self.lesson.is_visible
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user} -> {self.lesson} (done={self.is_done})"
 
@@ -218,12 +248,30 @@ class FlashCard(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # مشتقة (edu/visibility.py): سنة الـ lesson أو الـ subject، وهل الموديول جاهز
+    resolved_year = models.ForeignKey(
+        "edu.Year", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+",
+    )
+    is_visible = models.BooleanField(default=False, editable=False)
+
     class Meta:
         ordering = ["order", "-updated_at", "-id"]
         indexes = [
         models.Index(fields=["owner_type", "owner"]),
+        # FlashCardListCreate: سنة الطالب + Admin / كروته
+        models.Index(fields=["resolved_year", "owner_type", "owner"], condition=models.Q(is_visible=True),
+                     name="edu_fc_visible_year_owner"),
+        # FlashcardCountView
+        models.Index(fields=["owner", "resolved_year"], name="edu_fc_owner_year"),
          ]
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .visibility import refresh
+        changed = refresh("flashcard", "flashcard", [self.pk])
+        if changed:
+            _, self.resolved_year_id, self.is_visible = changed[0]
+
     def __str__(self):
         who = "Admin" if self.owner_type == "admin" else f"User:{self.owner_id}"
         target = self.lesson_id or self.subject_id or "-"
@@ -354,7 +402,31 @@ class Question(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # مشتقة (edu/visibility.py): سنة / موديول المسار الفعلى، وهل الموديول جاهز
+    resolved_year = models.ForeignKey(
+        "edu.Year", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+",
+    )
+    resolved_module = models.ForeignKey(
+        "edu.Module", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+",
+    )
+    is_visible = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            # StudentQuestions / Detail / Attempt / Reveal: سنة الطالب + المصادر المسموحة، بترتيب الـ id
+            models.Index(fields=["resolved_year", "source_type", "id"], condition=models.Q(is_visible=True),
+                         name="edu_q_visible_year_src_id"),
+            # ExamYearsView: موديول + سنين الامتحانات
+            models.Index(fields=["module", "exam_year"], condition=models.Q(is_visible=True),
+                         name="edu_q_visible_module_examyr"),
+        ]
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .visibility import refresh
+        changed = refresh("question", "question", [self.pk])   # [] لو القيم زى ما هى
+        if changed:
+            _, self.resolved_year_id, self.resolved_module_id, self.is_visible = changed[0]
 
     def __str__(self):
         return f"{self.get_question_type_display()} | {self.get_source_type_display()} | {self.text[:50]}"
@@ -385,14 +457,27 @@ class FavoriteLesson(models.Model):
     lesson = models.ForeignKey("edu.Lesson", on_delete=models.CASCADE, related_name="favorited_by")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # نسخة من الـ Lesson (edu/visibility.py)
+    resolved_year = models.ForeignKey(
+        "edu.Year", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+",
+    )
+    is_visible = models.BooleanField(default=False, editable=False)
+
     class Meta:
         unique_together = ("user", "lesson")
         indexes = [
             models.Index(fields=["user", "lesson"]),
             models.Index(fields=["user", "created_at"]),
+            models.Index(fields=["user", "resolved_year", "created_at"], condition=models.Q(is_visible=True),
+                         name="edu_fav_visible_user_year"),
         ]
         ordering = ["-created_at", "-id"]
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.resolved_year_id, self.is_visible = self.lesson.resolved_year_id, self.lesson.is_visible
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user_id} ♥ {self.lesson_id}"
     
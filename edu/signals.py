@@ -0,0 +1,37 @@
+# edu/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+
+from .models import Lesson, Module, Semester, Subject
+from .visibility import refresh_tree
+
+# موديول اتقفل / اتفتح، أو حاجة اتنقلت فى الشجرة → resolved_year / is_visible بتوع
+# الأسئلة والدروس والكروت (UPDATE واحد لكل جدول)
+_WATCHED = {
+    Module: (("is_ready", "semester_id"), "module"),
+    Semester: (("year_id",), "semester"),
+    Subject: (("module_id",), "subject"),
+    Lesson: (("subject_id",), "lesson"),
+}
+
+
+def _mark_visibility_changed(sender, instance, **kwargs):
+    fields, _ = _WATCHED[sender]
+    if not instance.pk:
+        instance._visibility_changed = False
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+    instance._visibility_changed = old is not None and old != tuple(getattr(instance, f) for f in fields)
+
+
+def _refresh_visibility(sender, instance, **kwargs):
+    if not getattr(instance, "_visibility_changed", False):
+        return
+    instance._visibility_changed = False
+    _, by = _WATCHED[sender]
+    transaction.on_commit(lambda pk=instance.pk: refresh_tree(by, [pk]))
+
+
+for _model in _WATCHED:
+    pre_save.connect(_mark_visibility_changed, sender=_model, dispatch_uid=f"edu_mark_visibility_{_model.__name__}")
+    post_save.connect(_refresh_visibility, sender=_model, dispatch_uid=f"edu_refresh_visibility_{_model.__name__}")
@@ -1,3 +1,64 @@
 from django.test import TestCase
 
-# Create your tests here.
+from edu.management.commands.curriculum_visibility import _denormalized, _legacy
+from edu.models import Lesson, Module, Question, Semester, Subject, Year
+from edu.visibility import stale
+
+
+class QuestionVisibilityTests(TestCase):
+    def setUp(self):
+        self.y1 = Year.objects.create(code="y1", name="Year 1", order=1)
+        self.y2 = Year.objects.create(code="y2", name="Year 2", order=2)
+        sem1 = Semester.objects.create(year=self.y1, name="Semester 1")
+        sem2 = Semester.objects.create(year=self.y2, name="Semester 1")
+        self.ready = Module.objects.create(semester=sem1, name="Cardio", is_ready=True)
+        self.closed = Module.objects.create(semester=sem2, name="Renal", is_ready=False)
+        self.subject = Subject.objects.create(module=self.ready, name="Physiology")
+        self.lesson = Lesson.objects.create(subject=self.subject, title="Heart cycle")
+
+    def _question(self, **links):
+        return Question.objects.create(text="q", question_type="mcq", source_type="qbank", **links)
+
+    def test_save_resolves_first_path(self):
+        q = self._question(lesson=self.lesson, module=self.closed)   # الدرس قبل الموديول
+        self.assertEqual((q.resolved_year_id, q.resolved_module_id, q.is_visible), (self.y1.id, self.ready.id, True))
+
+        q = self._question(year=self.y2)
+        self.assertEqual((q.resolved_year_id, q.resolved_module_id, q.is_visible), (self.y2.id, None, False))
+
+    def test_opening_and_closing_module_updates_questions(self):
+        q = self._question(module=self.closed)
+        self.assertFalse(q.is_visible)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.closed.is_ready = True
+            self.closed.save()
+        q.refresh_from_db()
+        self.assertTrue(q.is_visible)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ready.is_ready = False
+            self.ready.save()
+        self.assertFalse(Question.objects.get(pk=self._question(lesson=self.lesson).pk).is_visible)
+        self.assertEqual(stale("question"), 0)
+
+    def test_moving_subject_changes_year(self):
+        q = self._question(subject=self.subject)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subject.module = self.closed
+            self.subject.save()
+        q.refresh_from_db()
+        self.assertEqual((q.resolved_year_id, q.resolved_module_id, q.is_visible), (self.y2.id, self.closed.id, False))
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).resolved_year_id, self.y2.id)
+
+    def test_columns_match_legacy_filters(self):
+        self._question(lesson=self.lesson)
+        self._question(subject=self.subject)
+        self._question(module=self.ready)
+        self._question(module=self.closed)
+        self._question(year=self.y1)   # مفيش موديول → مش ظاهر فى الاتنين
+        for year in (self.y1, self.y2):
+            self.assertEqual(
+                set(_legacy(year).values_list("id", flat=True)),
+                set(_denormalized(year).values_list("id", flat=True)),
+            )
@@ -3,7 +3,6 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Q
 from .policy import can_view_questions, sources_allowed ,can_view_lesson_content ,flashcard_visibility_q,can_use_flashcards ,  get_policy
 from .models import Year, Semester, Module, Subject, Chapter, Lesson ,Question ,FlashCard,FavoriteLesson ,LessonProgress,PlannerTask,QuestionOption
 from .serializers import (
@@ -30,6 +29,14 @@ def _get_user_year(request):
         return None
 
 
+def _visible_questions(year):
+    """
+    أسئلة سنة الطالب اللى موديولها جاهز: على الأعمدة المشتقة (edu/visibility.py)
+    بدل OR على مسارات lesson / subject / module / year.
+    """
+    return Question.objects.filter(resolved_year=year, is_visible=True)
+
+
 # helpers صغنونة لتحويل سترينج لـ Boolean
 def _to_bool_param(v: str | None):
     if v is None:
@@ -131,14 +138,14 @@ class StudentLessons(APIView):
 
         subject_id = request.query_params.get("subject_id")
         chapter_id = request.query_params.get("chapter_id")   # NEW
-        qs = Lesson.objects.filter(subject__module__semester__year=year,subject__module__is_ready=True)
+        qs = Lesson.objects.filter(resolved_year=year, is_visible=True)   # أعمدة مشتقة (edu/visibility.py)
         
         
         if subject_id:
-            qs = qs.filter(subject_id=subject_id, subject__module__semester__year=year)
+            qs = qs.filter(subject_id=subject_id)
          # NEW: فلترة بالشابتر (اختيارية)
         if chapter_id:
-            qs = qs.filter(chapter_id=chapter_id, subject__module__semester__year=year)
+            qs = qs.filter(chapter_id=chapter_id)
             
         part_type = request.query_params.get("part_type")
         if part_type in ("theoretical", "practical"):
@@ -159,7 +166,7 @@ class LessonDetail(APIView):
         try:
             obj = (Lesson.objects
        .select_related("subject", "chapter")
-       .get(pk=pk, subject__module__semester__year=year,subject__module__is_ready=True))
+       .get(pk=pk, resolved_year=year, is_visible=True))
             
         except Lesson.DoesNotExist:
             return Response({"detail": "Lesson not found"}, status=404)
@@ -238,20 +245,8 @@ class StudentQuestions(APIView):
         flipped_val   = _to_bool_param(flipped_param)
         incorrect_only_val = _to_bool_param(incorrect_only_param)
 
-        qs = Question.objects.all()
-
-        # قصر حسب سنّة المستخدم
-        q_filters = Q()
-        q_filters |= Q(lesson__subject__module__semester__year=year)
-        q_filters |= Q(subject__module__semester__year=year)
-        q_filters |= Q(module__semester__year=year)
-        q_filters |= Q(year__code=year.code)
-        qs = qs.filter(q_filters)
-        qs = qs.filter(
-            Q(lesson__subject__module__is_ready=True) |
-            Q(subject__module__is_ready=True) |
-            Q(module__is_ready=True)
-        )
+        # قصر حسب سنّة المستخدم + الموديول جاهز
+        qs = _visible_questions(year)
 
         # فلاتر اختيارية
         if lesson_id:
@@ -390,21 +385,9 @@ class StudentQuestionDetail(APIView):
 
         try:
             obj = (
-                Question.objects.filter(
-                    # سنة المستخدم
-                    Q(lesson__subject__module__semester__year=year) |
-                    Q(subject__module__semester__year=year) |
-                    Q(module__semester__year=year) |
-                    Q(year__code=year.code),
-                    # مصادر مسموحة حسب الخطة
-                    source_type__in=list(sources_allowed(request.user))
-                )
-                # ✅ الموديول لازم يكون جاهز (أي مسار ربط)
-                .filter(
-                    Q(lesson__subject__module__is_ready=True) |
-                    Q(subject__module__is_ready=True) |
-                    Q(module__is_ready=True)
-                )
+                # سنة المستخدم + الموديول جاهز، ومصادر مسموحة حسب الخطة
+                _visible_questions(year)
+                .filter(source_type__in=list(sources_allowed(request.user)))
                 .get(pk=pk)
             )
         except Question.DoesNotExist:
@@ -437,22 +420,8 @@ class ExamYearsView(APIView):
         if not module_id:
             return Response({"detail": "module_id is required"}, status=400)
 
-        qs = Question.objects.all()
-
-        # قصر حسب سنة المستخدم (نفس منطق StudentQuestions)
-        q_filters = Q()
-        q_filters |= Q(lesson__subject__module__semester__year=year)
-        q_filters |= Q(subject__module__semester__year=year)
-        q_filters |= Q(module__semester__year=year)
-        q_filters |= Q(year__code=year.code)
-        qs = qs.filter(q_filters)
-
-        # الموديول لازم يكون جاهز
-        qs = qs.filter(
-            Q(lesson__subject__module__is_ready=True) |
-            Q(subject__module__is_ready=True) |
-            Q(module__is_ready=True)
-        )
+        # قصر حسب سنة المستخدم + الموديول جاهز (نفس منطق StudentQuestions)
+        qs = _visible_questions(year)
 
         # فلتر بالموديول المطلوب
         qs = qs.filter(module_id=module_id)
@@ -510,18 +479,8 @@ class FlashCardListCreate(APIView):
         lesson_id  = request.query_params.get("lesson_id")
         subject_id = request.query_params.get("subject_id")
 
-        qs = FlashCard.objects.all()
-
-        # قصر على سنة الطالب عبر علاقات lesson/subject
-        year_filter = (
-            Q(lesson__subject__module__semester__year=year) |
-            Q(subject__module__semester__year=year)
-        )
-        qs = qs.filter(year_filter)
-        qs = qs.filter(
-            Q(lesson__subject__module__is_ready=True) |
-            Q(subject__module__is_ready=True)
-        )
+        # قصر على سنة الطالب + الموديول جاهز (أعمدة مشتقة من lesson/subject، edu/visibility.py)
+        qs = FlashCard.objects.filter(resolved_year=year, is_visible=True)
 
         # فلاتر سياقية
         if lesson_id:
@@ -565,12 +524,12 @@ class FlashCardListCreate(APIView):
         if not year:
             return Response({"detail": "Year not set for user"}, status=400)
 
-        if lesson and lesson.subject.module.semester.year_id != year.id:
+        if lesson and lesson.resolved_year_id != year.id:
             return Response({"detail": "Lesson not in your year"}, status=403)
         if subject and subject.module.semester.year_id != year.id:
             return Response({"detail": "Subject not in your year"}, status=403)
 
-        if lesson and not lesson.subject.module.is_ready:
+        if lesson and not lesson.is_visible:
             return Response({"detail": "Module is not ready yet"}, status=403)
         if subject and not subject.module.is_ready:
             return Response({"detail": "Module is not ready yet"}, status=403)
@@ -618,7 +577,7 @@ class FlashCardDetail(APIView):
         if not year:
             return Response({"detail": "Year not set for user"}, status=400)
 
-        if lesson and lesson.subject.module.semester.year_id != year.id:
+        if lesson and lesson.resolved_year_id != year.id:
             return Response({"detail": "Lesson not in your year"}, status=403)
         if subject and subject.module.semester.year_id != year.id:
             return Response({"detail": "Subject not in your year"}, status=403)
@@ -661,12 +620,7 @@ class FavoriteLessonList(APIView):
         if not year:
             return Response({"total": 0, "items": []}, status=200)
 
-        qs = (FavoriteLesson.objects
-              .filter(user=request.user,
-                      lesson__subject__module__semester__year=year)
-              .filter(
-                lesson__subject__module__is_ready=True   # ✅
-            ))
+        qs = FavoriteLesson.objects.filter(user=request.user, resolved_year=year, is_visible=True)   # ✅ من غير join
 
 
         # pagination البسيطة
@@ -697,8 +651,7 @@ class FavoriteLessonIDs(APIView):
             return Response({"ids": []}, status=200)
 
         ids = (FavoriteLesson.objects
-               .filter(user=request.user,
-                       lesson__subject__module__semester__year=year , lesson__subject__module__is_ready=True)
+               .filter(user=request.user, resolved_year=year, is_visible=True)
                .values_list("lesson_id", flat=True))
         return Response({"ids": list(ids)}, status=200)
 
@@ -721,11 +674,11 @@ class FavoriteLessonAdd(APIView):
             return Response({"detail": "No study year set for user"}, status=400)
 
         try:
-            lesson = Lesson.objects.get(pk=lesson_id, subject__module__semester__year=year)
+            lesson = Lesson.objects.get(pk=lesson_id, resolved_year=year)
         except Lesson.DoesNotExist:
             return Response({"detail": "Lesson not found in your year"}, status=404)
 
-        if not lesson.subject.module.is_ready:
+        if not lesson.is_visible:
             return Response({"detail": "Module is not ready yet"}, status=403)
         
         obj, created = FavoriteLesson.objects.get_or_create(user=request.user, lesson=lesson)
@@ -752,8 +705,8 @@ class FavoriteLessonRemove(APIView):
         deleted, _ = (FavoriteLesson.objects
                       .filter(user=request.user,
                               lesson_id=lesson_id,
-                              lesson__subject__module__semester__year=year,
-                              lesson__subject__module__is_ready=True )
+                              resolved_year=year,
+                              is_visible=True)
                       .delete())
         record_activity(request.user)
         return Response({"deleted": bool(deleted)}, status=200)
@@ -774,10 +727,8 @@ class FlashcardCountView(APIView):
 
         qs = FlashCard.objects.filter(
             owner_type="user",
-            owner=request.user
-        ).filter(
-            Q(lesson__subject__module__semester__year=year) |
-            Q(subject__module__semester__year=year)
+            owner=request.user,
+            resolved_year=year,
         )
 
         # (اختياري) نفس فلاتر الليست لو حبيت تستخدمها
@@ -797,7 +748,7 @@ class LessonMarkDoneView(APIView):
 
     def post(self, request, lesson_id):
         try:
-            lesson = Lesson.objects.get(pk=lesson_id ,subject__module__is_ready=True)
+            lesson = Lesson.objects.get(pk=lesson_id, is_visible=True)
         except Lesson.DoesNotExist:
             return Response({"detail": "Lesson not found"}, status=404)
 
@@ -824,11 +775,7 @@ class LessonProgressIDs(APIView):
         if not year:
             return Response({"ids": []}, status=200)
 
-        qs = (LessonProgress.objects
-              .filter(user=request.user, is_done=True,
-                      lesson__subject__module__semester__year=year).filter(
-    lesson__subject__module__is_ready=True   # ✅
-))
+        qs = LessonProgress.objects.filter(user=request.user, is_done=True, resolved_year=year, is_visible=True)   # ✅
 
         subject_id = request.query_params.get("subject_id")
         if subject_id:
@@ -856,8 +803,8 @@ class LessonProgressList(APIView):
             .filter(
                 user=request.user,
                 is_done=True,
-                lesson__subject__module__semester__year=year,
-                lesson__subject__module__is_ready=True,  # ✅ نفس منطق الباقى
+                resolved_year=year,
+                is_visible=True,  # ✅ نفس منطق الباقى
             )
         )
 
@@ -902,9 +849,8 @@ class LessonProgressCountView(APIView):
 
         qs = LessonProgress.objects.filter(
             user=request.user,
-            is_done=True
-        ).filter(
-            Q(lesson__subject__module__semester__year=year)
+            is_done=True,
+            resolved_year=year,
         )
 
         subject_id = request.query_params.get("subject_id")
@@ -1061,21 +1007,9 @@ class QuestionAttemptCreate(APIView):
         year = _get_user_year(request)
         try:
             q = (
-                Question.objects.filter(
-                    # سنة المستخدم
-                    Q(lesson__subject__module__semester__year=year) |
-                    Q(subject__module__semester__year=year) |
-                    Q(module__semester__year=year) |
-                    Q(year__code=year.code),
-                    # مصادر مسموحة
-                    source_type__in=list(sources_allowed(request.user))
-                )
-                # ✅ لازم الموديول يكون جاهز
-                .filter(
-                    Q(lesson__subject__module__is_ready=True) |
-                    Q(subject__module__is_ready=True) |
-                    Q(module__is_ready=True)
-                )
+                # سنة المستخدم + الموديول جاهز، ومصادر مسموحة
+                _visible_questions(year)
+                .filter(source_type__in=list(sources_allowed(request.user)))
                 .get(pk=pk)
             )
         except Question.DoesNotExist:
@@ -1131,21 +1065,9 @@ class QuestionReveal(APIView):
         year = _get_user_year(request)
         try:
             q = (
-                Question.objects.filter(
-                    # سنة المستخدم
-                    Q(lesson__subject__module__semester__year=year) |
-                    Q(subject__module__semester__year=year) |
-                    Q(module__semester__year=year) |
-                    Q(year__code=year.code),
-                    # مصادر مسموحة
-                    source_type__in=list(sources_allowed(request.user))
-                )
-                # ✅ لازم الموديول يكون جاهز
-                .filter(
-                    Q(lesson__subject__module__is_ready=True) |
-                    Q(subject__module__is_ready=True) |
-                    Q(module__is_ready=True)
-                )
+                # سنة المستخدم + الموديول جاهز، ومصادر مسموحة
+                _visible_questions(year)
+                .filter(source_type__in=list(sources_allowed(request.user)))
                 .get(pk=pk)
             )
         except Question.DoesNotExist:
@@ -1266,11 +1188,7 @@ class HomeDashboardView(APIView):
         if year:
             fav_qs = (
                 FavoriteLesson.objects
-                .filter(
-                    user=user,
-                    lesson__subject__module__semester__year=year,
-                    lesson__subject__module__is_ready=True,
-                )
+                .filter(user=user, resolved_year=year, is_visible=True)
             )
             fav_lessons_total = fav_qs.count()
 
@@ -1280,8 +1198,8 @@ class HomeDashboardView(APIView):
                 .filter(
                     user=user,
                     is_done=True,
-                    lesson__subject__module__semester__year=year,
-                    lesson__subject__module__is_ready=True,
+                    resolved_year=year,
+                    is_visible=True,
                 )
                 .order_by("-id")
                 .first()
@@ -1394,10 +1312,10 @@ class MaterialsHomeView(APIView):
             # ===== 4) Lessons (لو chapter متختار) =====
             if chapter_id:
                 lessons_qs = Lesson.objects.filter(
-                    subject__module__semester__year=year,
+                    resolved_year=year,
+                    is_visible=True,
                     subject_id=subject_id,
                     chapter_id=chapter_id,
-                    subject__module__is_ready=True,
                 )
                 if part_type in ("theoretical", "practical"):
                     lessons_qs = lessons_qs.filter(part_type=part_type)
@@ -1406,11 +1324,7 @@ class MaterialsHomeView(APIView):
         # ===== 5) favorites ids (نفس منطق FavoriteLessonIDs) =====
         fav_qs = (
             FavoriteLesson.objects
-            .filter(
-                user=user,
-                lesson__subject__module__semester__year=year,
-                lesson__subject__module__is_ready=True,
-            )
+            .filter(user=user, resolved_year=year, is_visible=True)
         )
         favorite_ids = list(fav_qs.values_list("lesson_id", flat=True))
 
@@ -1422,8 +1336,8 @@ class MaterialsHomeView(APIView):
                 .filter(
                     user=user,
                     is_done=True,
-                    lesson__subject__module__semester__year=year,
-                    lesson__subject__module__is_ready=True,
+                    resolved_year=year,
+                    is_visible=True,
                     lesson__subject_id=subject_id,
                 )
             )
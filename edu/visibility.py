@@ -0,0 +1,178 @@
+# edu/visibility.py
+"""
+أعمدة مشتقة علشان فلاتر الطالب تبقى على أعمدة عليها index بدل joins لحد Year
+و OR على module.is_ready:
+
+    Question    resolved_year / resolved_module / is_visible
+                (أول مسار موجود: lesson، subject، module، year؛ visible = أى موديول is_ready)
+    Lesson      resolved_year / is_visible   ← subject → module → semester
+    FlashCard   resolved_year / is_visible   ← lesson أو subject
+    LessonProgress / FavoriteLesson           ← نسخة من الـ Lesson بتاعهم
+
+بتتحدث من save() بتاع كل model، ومن edu/signals.py لما موديول يتقفل/يتفتح أو حاجة
+تتنقل فى الشجرة (UPDATE واحد لكل جدول)، وبالـ batch من:
+    python manage.py curriculum_visibility backfill
+"""
+from django.db import connection
+
+_QUESTION_SQL = """
+    SELECT q2.id,
+           COALESCE(lsem.year_id, ssem.year_id, msem.year_id, q2.year_id) AS resolved_year_id,
+           COALESCE(ls.module_id, s.module_id, q2.module_id) AS resolved_module_id,
+           (COALESCE(lm.is_ready, FALSE) OR COALESCE(sm.is_ready, FALSE) OR COALESCE(m.is_ready, FALSE)) AS is_visible
+    FROM edu_question q2
+    LEFT JOIN edu_lesson l ON l.id = q2.lesson_id
+    LEFT JOIN edu_subject ls ON ls.id = l.subject_id
+    LEFT JOIN edu_module lm ON lm.id = ls.module_id
+    LEFT JOIN edu_semester lsem ON lsem.id = lm.semester_id
+    LEFT JOIN edu_subject s ON s.id = q2.subject_id
+    LEFT JOIN edu_module sm ON sm.id = s.module_id
+    LEFT JOIN edu_semester ssem ON ssem.id = sm.semester_id
+    LEFT JOIN edu_module m ON m.id = q2.module_id
+    LEFT JOIN edu_semester msem ON msem.id = m.semester_id
+    WHERE {where}
+"""
+
+_LESSON_SQL = """
+    SELECT l2.id, sem.year_id AS resolved_year_id, m.is_ready AS is_visible
+    FROM edu_lesson l2
+    JOIN edu_subject s ON s.id = l2.subject_id
+    JOIN edu_module m ON m.id = s.module_id
+    JOIN edu_semester sem ON sem.id = m.semester_id
+    WHERE {where}
+"""
+
+_FLASHCARD_SQL = """
+    SELECT f2.id,
+           COALESCE(lsem.year_id, ssem.year_id) AS resolved_year_id,
+           (COALESCE(lm.is_ready, FALSE) OR COALESCE(sm.is_ready, FALSE)) AS is_visible
+    FROM edu_flashcard f2
+    LEFT JOIN edu_lesson l ON l.id = f2.lesson_id
+    LEFT JOIN edu_subject ls ON ls.id = l.subject_id
+    LEFT JOIN edu_module lm ON lm.id = ls.module_id
+    LEFT JOIN edu_semester lsem ON lsem.id = lm.semester_id
+    LEFT JOIN edu_subject s ON s.id = f2.subject_id
+    LEFT JOIN edu_module sm ON sm.id = s.module_id
+    LEFT JOIN edu_semester ssem ON ssem.id = sm.semester_id
+    WHERE {where}
+"""
+
+# kind → (table, alias فى الـ SELECT, الأعمدة, SQL, فلاتر by)
+_KINDS = {
+    "question": ("edu_question", "q2", ("resolved_year_id", "resolved_module_id", "is_visible"), _QUESTION_SQL, {
+        "question": "q2.id = ANY(%(ids)s)",
+        "lesson": "q2.lesson_id = ANY(%(ids)s)",
+        "subject": "(ls.id = ANY(%(ids)s) OR s.id = ANY(%(ids)s))",
+        "module": "(lm.id = ANY(%(ids)s) OR sm.id = ANY(%(ids)s) OR m.id = ANY(%(ids)s))",
+        "semester": "(lm.semester_id = ANY(%(ids)s) OR sm.semester_id = ANY(%(ids)s) OR m.semester_id = ANY(%(ids)s))",
+        "year": "(lsem.year_id = ANY(%(ids)s) OR ssem.year_id = ANY(%(ids)s) OR msem.year_id = ANY(%(ids)s)"
+                " OR q2.year_id = ANY(%(ids)s))",
+    }),
+    "lesson": ("edu_lesson", "l2", ("resolved_year_id", "is_visible"), _LESSON_SQL, {
+        "lesson": "l2.id = ANY(%(ids)s)",
+        "subject": "l2.subject_id = ANY(%(ids)s)",
+        "module": "s.module_id = ANY(%(ids)s)",
+        "semester": "m.semester_id = ANY(%(ids)s)",
+        "year": "sem.year_id = ANY(%(ids)s)",
+    }),
+    "flashcard": ("edu_flashcard", "f2", ("resolved_year_id", "is_visible"), _FLASHCARD_SQL, {
+        "flashcard": "f2.id = ANY(%(ids)s)",
+        "lesson": "f2.lesson_id = ANY(%(ids)s)",
+        "subject": "(ls.id = ANY(%(ids)s) OR s.id = ANY(%(ids)s))",
+        "module": "(lm.id = ANY(%(ids)s) OR sm.id = ANY(%(ids)s))",
+        "semester": "(lm.semester_id = ANY(%(ids)s) OR sm.semester_id = ANY(%(ids)s))",
+        "year": "(lsem.year_id = ANY(%(ids)s) OR ssem.year_id = ANY(%(ids)s))",
+    }),
+}
+
+KINDS = tuple(_KINDS)
+
+# الجداول اللى بتاخد resolved_year / is_visible من الـ Lesson بتاعها
+_LESSON_COPIES = ("edu_lessonprogress", "edu_favoritelesson")
+
+
+def resolved_sql(kind, where="TRUE"):
+    """الـ SELECT اللى بيحسب القيم الصح (id + الأعمدة)، للـ refresh وللـ drift check."""
+    return _KINDS[kind][3].format(where=where)
+
+
+def _changed(cols, left, right):
+    return " OR ".join(f"{left}.{c} IS DISTINCT FROM {right}.{c}" for c in cols)
+
+
+def _refresh(kind, where, params, copies=None):
+    table, _, cols, _, _ = _KINDS[kind]
+    sql = (
+        f"UPDATE {table} t SET {', '.join(f'{c} = r.{c}' for c in cols)} "
+        f"FROM ({resolved_sql(kind, where)}) r "
+        f"WHERE t.id = r.id AND ({_changed(cols, 't', 'r')}) "
+        f"RETURNING t.id, {', '.join(f't.{c}' for c in cols)}"
+    )
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    if kind == "lesson":
+        if copies is None and rows:
+            copies = ("l.id = ANY(%(ids)s)", {"ids": [r[0] for r in rows]})
+        if copies:
+            _copy_from_lessons(*copies)
+    return rows
+
+
+def _copy_from_lessons(where, params):
+    with connection.cursor() as cur:
+        for table in _LESSON_COPIES:
+            cur.execute(
+                f"UPDATE {table} t SET resolved_year_id = l.resolved_year_id, is_visible = l.is_visible "
+                f"FROM edu_lesson l WHERE t.lesson_id = l.id AND {where} "
+                f"AND ({_changed(('resolved_year_id', 'is_visible'), 't', 'l')})",
+                params,
+            )
+
+
+def refresh(kind, by=None, ids=None):
+    """
+    UPDATE واحد لصفوف kind (question / lesson / flashcard) المربوطة بالـ ids
+    (by: نفس الـ kind أو lesson / subject / module / semester / year)؛ None = الكل.
+    بيرجّع [(id, *الأعمدة)] للصفوف اللى اتغيرت بس. الدروس اللى اتغيرت بتتنسخ
+    لـ LessonProgress / FavoriteLesson فى نفس الخطوة.
+    """
+    if by is None:
+        return _refresh(kind, "TRUE", {})
+    return _refresh(kind, _KINDS[kind][4][by], {"ids": list(ids or [])})
+
+
+def refresh_range(kind, start, end):
+    """
+    للـ backfill بالـ batch: id فى [start, end). للدروس النسخ بتتظبط للـ range كله
+    (مش بس اللى اتغير) علشان أى drift فيهم يتصلح.
+    """
+    alias = _KINDS[kind][1]
+    params = {"start": start, "end": end}
+    copies = ("l.id >= %(start)s AND l.id < %(end)s", params) if kind == "lesson" else None
+    return _refresh(kind, f"{alias}.id >= %(start)s AND {alias}.id < %(end)s", params, copies)
+
+
+def refresh_tree(by, ids):
+    """حاجة فى الشجرة اتغيرت (موديول اتقفل، subject اتنقل، ...) → كل الجداول المشتقة."""
+    return {kind: len(refresh(kind, by, ids)) for kind in KINDS if by in _KINDS[kind][4]}
+
+
+def stale(kind):
+    """عدد الصفوف اللى قيمها مش متزامنة."""
+    table, _, cols, _, _ = _KINDS[kind]
+    with connection.cursor() as cur:
+        cur.execute(
+            f"SELECT count(*) FROM {table} t JOIN ({resolved_sql(kind)}) r ON r.id = t.id "
+            f"WHERE {_changed(cols, 't', 'r')}"
+        )
+        count = cur.fetchone()[0]
+        if kind == "lesson":
+            for copy in _LESSON_COPIES:
+                cur.execute(
+                    f"SELECT count(*) FROM {copy} t JOIN edu_lesson l ON l.id = t.lesson_id "
+                    f"WHERE {_changed(('resolved_year_id', 'is_visible'), 't', 'l')}"
+                )
+                count += cur.fetchone()[0]
+    return count
+
@@ -0,0 +1,223 @@
+# medical_project/http_pool.py
+"""
+Session واحدة (keep-alive) لكل worker لكل النداءات الخارجية:
+web → API (لو WEB_API_TRANSPORT=http) و Gemini.
+
+- pool size / retries مع backoff / timeout لكل host من الـ settings.
+- السيشن بتتعمل lazily وبتتربط بالـ pid، فبعد fork بتاع gunicorn --preload
+  كل worker بياخد connections خاصة بيه.
+- pool_stats(): عدد الطلبات، الـ connections الجديدة (والباقى reuse)،
+  ووقت الـ TCP connect و TLS handshake.
+- get_async_client(): نفس الفكرة للـ async views (httpx.AsyncClient لكل event loop).
+"""
+import asyncio
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (3.05, 10)
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,
+    "new_connections": 0,
+    "connect_ms_total": 0.0,
+    "tls_handshakes": 0,
+    "tls_handshake_ms_total": 0.0,
+}
+
+
+def _record(**deltas):
+    with _stats_lock:
+        for k, v in deltas.items():
+            _stats[k] += v
+
+
+# ---- connections بتقيس وقت الفتح ----
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        _record(new_connections=1, connect_ms_total=(time.perf_counter() - t0) * 1000)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    _tcp_s = 0.0
+
+    def _new_conn(self):
+        t0 = time.perf_counter()
+        sock = super()._new_conn()
+        self._tcp_s = time.perf_counter() - t0
+        return sock
+
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        total = time.perf_counter() - t0
+        _record(
+            new_connections=1,
+            connect_ms_total=self._tcp_s * 1000,
+            tls_handshakes=1,
+            tls_handshake_ms_total=max(0.0, total - self._tcp_s) * 1000,
+        )
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _PoolAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+# ---- timeouts لكل host ----
+
+def host_timeout(url):
+    host = (urlsplit(url).hostname or "").lower()
+    timeouts = getattr(settings, "HTTP_POOL_TIMEOUTS", {}) or {}
+    t = timeouts.get(host, timeouts.get("default", DEFAULT_TIMEOUT))
+    return tuple(t) if isinstance(t, (list, tuple)) else t
+
+
+class PooledSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = host_timeout(url)
+        _record(requests=1)
+        return super().request(method, url, **kwargs)
+
+
+def _build_session():
+    retries = Retry(
+        total=getattr(settings, "HTTP_POOL_RETRIES", 2),
+        backoff_factor=getattr(settings, "HTTP_POOL_BACKOFF", 0.3),
+        status_forcelist=(429, 502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    size = getattr(settings, "HTTP_POOL_SIZE", 20)
+    adapter = _PoolAdapter(pool_connections=size, pool_maxsize=size, max_retries=retries)
+    s = PooledSession()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def get_session():
+    """السيشن المشتركة للـ worker الحالى."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def pool_stats():
+    with _stats_lock:
+        data = dict(_stats)
+    data["reused_connections"] = max(0, data["requests"] - data["new_connections"])
+    data["reuse_ratio"] = round(data["reused_connections"] / data["requests"], 4) if data["requests"] else 0.0
+    data["tls_handshake_ms_avg"] = (
+        round(data["tls_handshake_ms_total"] / data["tls_handshakes"], 2) if data["tls_handshakes"] else 0.0
+    )
+    data["pid"] = os.getpid()
+    return data
+
+
+# ---- async (ASGI) ----
+
+_async_clients = {}  # (pid, id(loop)) -> httpx.AsyncClient
+
+
+class _PooledAsyncClient(httpx.AsyncClient):
+    async def request(self, method, url, **kwargs):
+        if kwargs.get("timeout", httpx.USE_CLIENT_DEFAULT) in (None, httpx.USE_CLIENT_DEFAULT):
+            connect, read = _split_timeout(host_timeout(str(url)))
+            kwargs["timeout"] = httpx.Timeout(read, connect=connect)
+        return await super().request(method, url, **kwargs)
+
+    def stream(self, method, url, **kwargs):
+        if kwargs.get("timeout", httpx.USE_CLIENT_DEFAULT) in (None, httpx.USE_CLIENT_DEFAULT):
+            connect, read = _split_timeout(host_timeout(str(url)))
+            kwargs["timeout"] = httpx.Timeout(read, connect=connect)
+        return super().stream(method, url, **kwargs)
+
+
+class _TimedAsyncTransport(httpx.AsyncHTTPTransport):
+    """
+    زى _TimedHTTPSConnection للـ httpx: الطلبات (حتى client.send(stream=True))، الـ connections
+    الجديدة ووقت الـ TCP / TLS من الـ trace extension بتاع httpcore.
+    """
+
+    async def handle_async_request(self, request):
+        _record(requests=1)
+        started = {}
+
+        async def trace(name, info):
+            step, _, event = name.rpartition(".")
+            if event == "started":
+                started[step] = time.perf_counter()
+            elif event == "complete" and step in started:
+                ms = (time.perf_counter() - started.pop(step)) * 1000
+                if step == "connection.connect_tcp":
+                    _record(new_connections=1, connect_ms_total=ms)
+                elif step == "connection.start_tls":
+                    _record(tls_handshakes=1, tls_handshake_ms_total=ms)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        return await super().handle_async_request(request)
+
+
+def _split_timeout(t):
+    if isinstance(t, (list, tuple)):
+        return t[0], t[1]
+    return t, t
+
+
+def get_async_client():
+    """
+    الـ AsyncClient المشترك للـ event loop الحالى (uvicorn worker = loop واحد).
+    connections مربوطة بالـ loop، فلازم client لكل loop.
+    """
+    key = (os.getpid(), id(asyncio.get_running_loop()))
+    client = _async_clients.get(key)
+    if client is None or client.is_closed:
+        size = getattr(settings, "HTTP_POOL_SIZE", 20)
+        # httpx بيتجاهل limits= بتاعة الـ client لما transport= يتبعت، فالحدود على الـ transport
+        client = _PooledAsyncClient(
+            transport=_TimedAsyncTransport(
+                retries=getattr(settings, "HTTP_POOL_RETRIES", 2),
+                limits=httpx.Limits(
+                    max_connections=getattr(settings, "HTTP_POOL_ASYNC_MAX_CONNECTIONS", 100),
+                    max_keepalive_connections=size,
+                ),
+            ),
+        )
+        _async_clients[key] = client
+    return client
@@ -277,9 +277,88 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # === Environment / RAG settings ===
 GOOGLE_API_KEY= config("GOOGLE_API_KEY")
-FAISS_INDEX_FILE   = config("FAISS_INDEX_FILE", default=os.path.join(BASE_DIR, "faiss_index.index"))
 GEMINI_EMBED_MODEL = config("GEMINI_EMBED_MODEL", default="text-embedding-004")   # بُعد 768
 GEMINI_GEN_MODEL   = config("GEMINI_GEN_MODEL", default="gemini-2.5-flash-lite")
+# الـ stand-in المحلى للـ benchmarks: python manage.py gemini_stub → http://127.0.0.1:8765
+GEMINI_API_BASE    = config("GEMINI_API_BASE", default="https://generativelanguage.googleapis.com")
+
+# بحث pgvector (rag_ai/index.py) — الافتراضى لو الطلب ما بعتش probes / ef_search
+RAG_IVFFLAT_PROBES = config("RAG_IVFFLAT_PROBES", cast=int, default=10)
+RAG_HNSW_EF_SEARCH = config("RAG_HNSW_EF_SEARCH", cast=int, default=40)
+# عمود البحث: embedding_vec (float32) أو embedding_half (halfvec) بعد rag_index backfill + build + report
+RAG_VECTOR_COLUMN = config("RAG_VECTOR_COLUMN", default="embedding_vec")
+# migration 0009: انسخ الـ bytea و faiss_id القديمة لـ rag_ai_chunk_legacy_embedding قبل الـ drop
+RAG_ARCHIVE_LEGACY_EMBEDDINGS = config("RAG_ARCHIVE_LEGACY_EMBEDDINGS", cast=bool, default=False)
+# البحث المحدود بسنة الطالب (AskApiV1Simple)، و iterative scan للـ filter ("" / relaxed_order / strict_order، pgvector >= 0.8)
+RAG_SCOPE_BY_YEAR = config("RAG_SCOPE_BY_YEAR", cast=bool, default=True)
+# الـ chunks اللى من غير year_id (قبل ما الـ tags تتملى) بتدخل فى بحث السنة؛ اقفلها بعد re-ingest
+# علشان الـ partial index بتاع السنة يشتغل
+RAG_SCOPE_INCLUDE_UNTAGGED = config("RAG_SCOPE_INCLUDE_UNTAGGED", cast=bool, default=True)
+RAG_ITERATIVE_SCAN = config("RAG_ITERATIVE_SCAN", default="")
+# "mmap": البحث exact جوه الـ process من export (python manage.py rag_mmap build) بدل pgvector
+RAG_SEARCH_BACKEND = config("RAG_SEARCH_BACKEND", default="pgvector")
+RAG_MMAP_DIR = config("RAG_MMAP_DIR", default=str(BASE_DIR / "rag_mmap"))
+RAG_MMAP_DTYPE = config("RAG_MMAP_DTYPE", default="float16")                      # float16 / float32
+RAG_MMAP_RELOAD_SECONDS = config("RAG_MMAP_RELOAD_SECONDS", cast=float, default=5.0)  # كل قد ايه نبص على build جديد
+
+# تجميع الـ context (rag_ai/context.py): ميزانية tokens (0 = حسب الموديل)، MMR، وتقدير الـ tokens
+RAG_CONTEXT_TOKENS = config("RAG_CONTEXT_TOKENS", cast=int, default=0)
+RAG_CONTEXT_MAX_SHARE = config("RAG_CONTEXT_MAX_SHARE", cast=float, default=0.5)   # أقصى نسبة لـ chunk واحد
+RAG_CONTEXT_DEDUPE_SIM = config("RAG_CONTEXT_DEDUPE_SIM", cast=float, default=0.97)
+RAG_MMR_LAMBDA = config("RAG_MMR_LAMBDA", cast=float, default=0.7)                # 1 = relevance بس
+RAG_CHARS_PER_TOKEN = config("RAG_CHARS_PER_TOKEN", cast=float, default=4.0)
+
+# بعد حفظ درس (content / pdf اتغيروا) الـ chunks بتاعته بتتحدث فى الخلفية (rag_ai/signals.py)
+RAG_SYNC_ON_SAVE = config("RAG_SYNC_ON_SAVE", cast=bool, default=True)
+
+# AskApiV1Batch: أقصى عدد أسئلة فى الطلب، وكام توليد Gemini فى نفس الوقت
+RAG_BATCH_MAX_QUESTIONS = config("RAG_BATCH_MAX_QUESTIONS", cast=int, default=50)
+RAG_BATCH_CONCURRENCY = config("RAG_BATCH_CONCURRENCY", cast=int, default=4)
+
+# المحادثات على السيرفر (rag_ai/conversations.py): كام دور بيدخل الـ prompt، وكام دور زيادة قبل التلخيص
+RAG_CONVERSATION_WINDOW = config("RAG_CONVERSATION_WINDOW", cast=int, default=10)
+RAG_CONVERSATION_COMPACT_EVERY = config("RAG_CONVERSATION_COMPACT_EVERY", cast=int, default=6)
+
+# كاش embeddings الأسئلة (rag_ai/embed_cache.py)
+EMBED_CACHE_SIZE = config("EMBED_CACHE_SIZE", cast=int, default=2048)             # عناصر لكل worker (0 = مقفول)
+EMBED_CACHE_TTL  = config("EMBED_CACHE_TTL", cast=int, default=7 * 24 * 3600)     # ثوانى
+EMBED_CACHE_SHARED_ALIAS = config("EMBED_CACHE_SHARED_ALIAS", default="")         # alias فى CACHES للكاش المشترك
+
+# كاش الإجابات الدلالى لـ AskApiV1Simple (rag_ai/answer_cache.py)
+ANSWER_CACHE_ENABLED      = config("ANSWER_CACHE_ENABLED", cast=bool, default=True)
+ANSWER_CACHE_THRESHOLD    = config("ANSWER_CACHE_THRESHOLD", cast=float, default=0.95)   # cosine similarity
+ANSWER_CACHE_TTL          = config("ANSWER_CACHE_TTL", cast=int, default=24 * 3600)
+ANSWER_CACHE_MAX_ENTRIES  = config("ANSWER_CACHE_MAX_ENTRIES", cast=int, default=5000)
+ANSWER_CACHE_WITH_HISTORY = config("ANSWER_CACHE_WITH_HISTORY", cast=bool, default=False)  # False = أسئلة من غير history بس
+
+# single-flight لـ AskApiV1Simple (rag_ai/single_flight.py): نفس السؤال فى نفس الوقت → حساب واحد
+SINGLE_FLIGHT_ENABLED      = config("SINGLE_FLIGHT_ENABLED", cast=bool, default=True)
+SINGLE_FLIGHT_SHARED_ALIAS = config("SINGLE_FLIGHT_SHARED_ALIAS", default="")   # alias فى CACHES للـ lock / result بين الـ workers
+SINGLE_FLIGHT_WAIT         = config("SINGLE_FLIGHT_WAIT", cast=float, default=45.0)    # ثوانى قبل ما الـ follower يحسب بنفسه
+SINGLE_FLIGHT_POLL         = config("SINGLE_FLIGHT_POLL", cast=float, default=0.05)
+SINGLE_FLIGHT_RESULT_TTL   = config("SINGLE_FLIGHT_RESULT_TTL", cast=int, default=10)
+
+# الحماية حوالين Gemini (rag_ai/resilience.py): bulkhead، circuit breaker، hedging، وميزانية الوقت
+GEMINI_MAX_CONCURRENCY   = config("GEMINI_MAX_CONCURRENCY", cast=int, default=8)      # نداءات فى نفس الوقت لكل process
+GEMINI_BULKHEAD_WAIT     = config("GEMINI_BULKHEAD_WAIT", cast=float, default=0.5)    # ثوانى نستنى مكان قبل fast-fail
+GEMINI_BREAKER_FAILURES  = config("GEMINI_BREAKER_FAILURES", cast=int, default=5)     # فشل ورا بعض قبل ما يفتح
+GEMINI_BREAKER_COOLDOWN  = config("GEMINI_BREAKER_COOLDOWN", cast=float, default=30.0)
+GEMINI_HEDGE             = config("GEMINI_HEDGE", cast=bool, default=False)           # نسخة تانية بعد p95 (بيزوّد الاستهلاك)
+GEMINI_HEDGE_MIN_MS      = config("GEMINI_HEDGE_MIN_MS", cast=int, default=300)
+GEMINI_HEDGE_MIN_SAMPLES = config("GEMINI_HEDGE_MIN_SAMPLES", cast=int, default=20)
+AI_REQUEST_BUDGET_MS     = config("AI_REQUEST_BUDGET_MS", cast=int, default=25000)    # أقصى ميزانية لطلب AI (X-Request-Budget-Ms)
+AI_WEB_BUDGET_MS         = config("AI_WEB_BUDGET_MS", cast=int, default=25000)        # اللى الـ web بيبعته للـ API
+
+# tracing لطلبات الـ AI (rag_ai/tracing.py) و /api/v1/metrics/
+RAG_TRACE_SLOW_MS         = config("RAG_TRACE_SLOW_MS", cast=int, default=3000)      # أبطأ من كده → log (0 = مقفول)
+RAG_TRACE_SLOW_SAMPLE     = config("RAG_TRACE_SLOW_SAMPLE", cast=float, default=1.0)  # نسبة الـ slow traces اللى بتتكتب
+RAG_METRICS_TOKEN         = config("RAG_METRICS_TOKEN", default="")                  # Bearer للـ scraper (فاضى = staff بس)
+RAG_METRICS_SHARED_ALIAS  = config("RAG_METRICS_SHARED_ALIAS", default="")           # alias فى CACHES لتجميع كل الـ workers
+RAG_METRICS_FLUSH_SECONDS = config("RAG_METRICS_FLUSH_SECONDS", cast=float, default=10.0)
+
+# حصة الـ AI اليومية (rag_ai/utils.py): العدّاد فى cache (incr atomic) والـ DB بالـ batch
+AI_QUOTA_CACHE_ALIAS   = config("AI_QUOTA_CACHE_ALIAS", default="")                 # Redis / memcached بس؛ فاضى = UPSERT فى الـ DB لكل طلب
+AI_QUOTA_FLUSH_SECONDS = config("AI_QUOTA_FLUSH_SECONDS", cast=float, default=5.0)
 
 
 
@@ -289,4 +368,22 @@ GEMINI_GEN_MODEL   = config("GEMINI_GEN_MODEL", default="gemini-2.5-flash-lite")
 
 
 BASE_API_URL  = config("BASE_API_URL", default="http://localhost:8000/api")
-WEB_DEVICE_ID = config("WEB_DEVICE_ID", default="")  # لو فاضي هنولّد واحد بالسيشن
\ No newline at end of file
+WEB_DEVICE_ID = config("WEB_DEVICE_ID", default="")  # لو فاضي هنولّد واحد بالسيشن
+
+# web → API: "inprocess" بينادي الـ views مباشرة، "http" يرجع للـ loopback على BASE_API_URL
+WEB_API_TRANSPORT = config("WEB_API_TRANSPORT", default="inprocess")
+
+# نداءات الـ API المستقلة فى نفس الصفحة بتتعمل بالتوازى (web/fanout.py)
+WEB_FANOUT_WORKERS  = config("WEB_FANOUT_WORKERS", cast=int, default=8)
+WEB_FANOUT_DEADLINE = config("WEB_FANOUT_DEADLINE", cast=float, default=10)  # ثوانى للصفحة كلها
+
+# === Outbound HTTP pool (medical_project/http_pool.py) ===
+HTTP_POOL_SIZE    = config("HTTP_POOL_SIZE", cast=int, default=20)      # connections لكل host
+HTTP_POOL_RETRIES = config("HTTP_POOL_RETRIES", cast=int, default=2)
+HTTP_POOL_BACKOFF = config("HTTP_POOL_BACKOFF", cast=float, default=0.3)
+HTTP_POOL_ASYNC_MAX_CONNECTIONS = config("HTTP_POOL_ASYNC_MAX_CONNECTIONS", cast=int, default=100)  # لكل worker (ASGI)
+# (connect, read) بالثوانى لكل host؛ الـ timeout اللى بيتبعت مع الطلب بيغلب
+HTTP_POOL_TIMEOUTS = {
+    "default": (3.05, 10),
+    "generativelanguage.googleapis.com": (3.05, 30),
+}
\ No newline at end of file
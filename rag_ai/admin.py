@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Chunk
+from .models import Chunk, AnswerCacheEntry
+from . import answer_cache
 import numpy as np
 
 # @admin.register(Chunk)
@@ -16,4 +17,34 @@ import numpy as np
 #         except:
 #             return "N/A"
 
-#     short_embedding.short_description = "Embedding Preview"
\ No newline at end of file
+#     short_embedding.short_description = "Embedding Preview"
+
+
+
+@admin.register(AnswerCacheEntry)
+class AnswerCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ("id", "scope", "short_question", "hits", "created_at", "last_hit_at")
+    list_filter = ("scope",)
+    search_fields = ("question", "answer")
+    ordering = ("-created_at",)
+    readonly_fields = ("scope", "version", "history_digest", "question", "chunk_ids", "answer",
+                       "hits", "created_at", "last_hit_at")
+    exclude = ("query_vec",)
+    actions = ("purge_selected_scopes", "purge_stale")
+
+    @admin.display(description="Question")
+    def short_question(self, obj):
+        return obj.question[:80]
+
+    @admin.action(description="Purge ALL cached answers in the selected entries' years")
+    def purge_selected_scopes(self, request, queryset):
+        deleted = 0
+        for scope in set(queryset.values_list("scope", flat=True)):
+            deleted += answer_cache.purge(scope=scope)
+        self.message_user(request, f"{deleted} cached answer(s) purged.")
+
+    @admin.action(description="Purge expired / old-version / over-limit entries")
+    def purge_stale(self, request, queryset):
+        from .qa import PROMPT_VERSION
+        deleted = answer_cache.evict(answer_cache.current_version(PROMPT_VERSION))
+        self.message_user(request, f"{deleted} stale cached answer(s) purged.")
@@ -0,0 +1,167 @@
+# rag_ai/answer_cache.py
+"""
+كاش دلالى للإجابات (semantic answer cache).
+
+سؤال جديد بياخد إجابة محفوظة لو:
+- نفس الـ scope (السنة الدراسية) ونفس الـ version (موديلات + PROMPT_VERSION)،
+- نفس الـ history_digest ("" للسؤال من غير history)،
+- cosine similarity مع متجه السؤال المحفوظ >= ANSWER_CACHE_THRESHOLD،
+- ونفس مجموعة الـ chunks اللى رجعت من البحث (يعنى نفس الـ context).
+
+الإجابة بتتخزن من غير اسم الطالب وبيتحط اسم الطالب الجديد وقت الرجوع.
+الـ eviction: TTL (ANSWER_CACHE_TTL) + حد أقصى للعدد (ANSWER_CACHE_MAX_ENTRIES).
+"""
+import hashlib
+import json
+import random
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from .models import AnswerCacheEntry
+
+NAME_PLACEHOLDER = "⟨student⟩"
+
+# إجابات مش بنخزنها (أخطاء / مفيش context)
+_NON_CACHEABLE_PREFIXES = (
+    "No references matched",
+    "AI call failed",
+    "AI error",
+    "Blocked by safety",
+    "I couldn't generate",
+)
+
+
+def enabled():
+    return getattr(settings, "ANSWER_CACHE_ENABLED", True)
+
+
+def _threshold():
+    return float(getattr(settings, "ANSWER_CACHE_THRESHOLD", 0.95))
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, "ANSWER_CACHE_TTL", 24 * 3600))
+
+
+def current_version(prompt_version):
+    raw = "|".join([
+        getattr(settings, "GEMINI_GEN_MODEL", ""),
+        getattr(settings, "GEMINI_EMBED_MODEL", ""),
+        str(prompt_version),
+    ])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def history_digest(history):
+    """
+    "" لو مفيش history. لو فيه history: digest لو ANSWER_CACHE_WITH_HISTORY،
+    غير كده None (الدور ده مش بيتكاش).
+    """
+    turns = [
+        [(t.get("role") or "user").lower(), " ".join((t.get("content") or "").split())]
+        for t in (history or []) if isinstance(t, dict) and (t.get("content") or "").strip()
+    ]
+    if not turns:
+        return ""
+    if not getattr(settings, "ANSWER_CACHE_WITH_HISTORY", False):
+        return None
+    raw = json.dumps(turns, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def strip_name(answer, student_name):
+    """الاسم ككلمة كاملة بس ("Ali" مش جوه "Alimentary")."""
+    name = (student_name or "").strip()
+    if len(name) < 2:
+        return answer
+    return re.sub(rf"(?<!\w){re.escape(name)}(?!\w)", NAME_PLACEHOLDER, answer)
+
+
+def fill_name(answer, student_name):
+    return answer.replace(NAME_PLACEHOLDER, (student_name or "").strip() or "Student")
+
+
+def cacheable(answer):
+    return bool(answer) and not answer.startswith(_NON_CACHEABLE_PREFIXES)
+
+
+def lookup(query_vec, chunk_ids, *, scope, version, digest, student_name):
+    """بيرجّع الإجابة (باسم الطالب) أو None."""
+    if digest is None:
+        return None
+    max_distance = 1.0 - _threshold()
+    ids = sorted(chunk_ids)
+    candidates = (
+        AnswerCacheEntry.objects
+        .filter(
+            scope=scope or "",
+            version=version,
+            history_digest=digest,
+            created_at__gte=timezone.now() - _ttl(),
+        )
+        .annotate(distance=CosineDistance("query_vec", query_vec.reshape(-1).tolist()))
+        .filter(distance__lte=max_distance)
+        .order_by("distance")
+        .only("id", "chunk_ids", "answer")[:5]
+    )
+    for entry in candidates:
+        if entry.chunk_ids == ids:
+            AnswerCacheEntry.objects.filter(pk=entry.pk).update(
+                hits=F("hits") + 1, last_hit_at=timezone.now()
+            )
+            return fill_name(entry.answer, student_name)
+    return None
+
+
+def store(question, query_vec, chunk_ids, *, answer, scope, version, digest, student_name):
+    if digest is None or not cacheable(answer):
+        return None
+    entry = AnswerCacheEntry.objects.create(
+        scope=scope or "",
+        version=version,
+        history_digest=digest,
+        question=question,
+        query_vec=query_vec.reshape(-1).tolist(),
+        chunk_ids=sorted(chunk_ids),
+        answer=strip_name(answer, student_name),
+    )
+    # eviction بين الحين والتانى بدل كل طلب
+    if random.random() < getattr(settings, "ANSWER_CACHE_EVICT_RATE", 0.05):
+        evict(version)
+    return entry
+
+
+def evict(version=None):
+    """
+    يمسح: المنتهى (TTL)، وأى version قديمة، والزيادة عن ANSWER_CACHE_MAX_ENTRIES
+    (الأقدم استخدامًا الأول). بيرجّع عدد الصفوف اللى اتمسحت.
+    """
+    deleted, _ = AnswerCacheEntry.objects.filter(created_at__lt=timezone.now() - _ttl()).delete()
+    if version:
+        n, _ = AnswerCacheEntry.objects.exclude(version=version).delete()
+        deleted += n
+
+    max_entries = getattr(settings, "ANSWER_CACHE_MAX_ENTRIES", 5000)
+    extra = AnswerCacheEntry.objects.count() - max_entries
+    if extra > 0:
+        stale = list(
+            AnswerCacheEntry.objects
+            .order_by(F("last_hit_at").asc(nulls_first=True), "created_at")
+            .values_list("id", flat=True)[:extra]
+        )
+        n, _ = AnswerCacheEntry.objects.filter(id__in=stale).delete()
+        deleted += n
+    return deleted
+
+
+def purge(scope=None):
+    qs = AnswerCacheEntry.objects.all()
+    if scope is not None:
+        qs = qs.filter(scope=scope)
+    deleted, _ = qs.delete()
+    return deleted
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class RagAiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rag_ai'
+
+    def ready(self):
+        # تحديث الـ chunks لما درس يتعدل
+        import rag_ai.signals  # noqa
+
+        # mmap backend: الـ mapping قبل الـ fork (gunicorn --preload) فالـ workers بيشاركوه
+        from rag_ai import mmap_index
+        if mmap_index.enabled():
+            mmap_index.current()
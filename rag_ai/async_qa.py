@@ -0,0 +1,277 @@
+# rag_ai/async_qa.py
+"""
+نسخة async من api_ask للـ views اللى شغالة على ASGI (uvicorn worker).
+
+نداءات Gemini (embedContent / generateContent) بتروح عن طريق httpx.AsyncClient
+المشترك (من خلال resilience.acall)، فالـ worker مش بيتحجز طول وقت التوليد.
+شغل الـ DB (البحث فى pgvector، answer_cache) بيتعمل فى thread عن طريق sync_to_async.
+الـ prompt والـ post-processing هما نفسهم بتوع qa.py.
+
+astream_ask / abatch_ask: async iterators للـ SSE views؛ تحت الـ uvicorn worker
+الـ StreamingHttpResponse بـ sync generator بيتجمع كله قبل ما يتبعت، فالـ streaming
+لازم يبقى async من أوله لآخره.
+"""
+import asyncio
+import json
+
+import numpy as np
+from asgiref.sync import sync_to_async
+
+from rag_ai import answer_cache, embed_cache, resilience, single_flight
+from rag_ai.resilience import GeminiUnavailable
+from rag_ai.context import pack_context
+from rag_ai.timing import stage
+from django.conf import settings
+from rag_ai.qa import (
+    _IncrementalCleaner,
+    _answer_cache_kwargs,
+    _api_result,
+    _batch_plan,
+    _build_prompt,
+    _candidate_text,
+    _clean_answer,
+    _embed_request,
+    _gen_request,
+    coalesce_key,
+    search_by_vector,
+)
+
+async def aembed_query(text: str) -> np.ndarray:
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("Empty query")
+
+    key = embed_cache.make_key(text)
+    # الـ shared tier ممكن يبقى DatabaseCache، فمش بننادى الكاش من الـ event loop مباشرة
+    vec = await sync_to_async(embed_cache.get, thread_sensitive=False)(key)
+    if vec is None:
+        url, headers, payload = _embed_request(text)
+        with stage("embed"):
+            async with resilience.acall("embed") as c:
+                r = await c.post(url, headers=headers, json=payload, hedge=True)
+                c.raise_for_status(r)
+        values = r.json()["embedding"]["values"]
+        vec = await sync_to_async(embed_cache.put, thread_sensitive=False)(
+            key, np.array(values, dtype=np.float32)
+        )
+    return vec.reshape(1, -1)
+
+
+async def aanswer_with_gemini(question: str, context: str, student_name: str = "Student", history=None) -> str:
+    if not context or not context.strip():
+        return "No references matched your question. (context is empty)"
+
+    url, headers, payload = _gen_request(_build_prompt(question, context, student_name, history))
+
+    try:
+        with stage("generate"):
+            async with resilience.acall("generate") as c:
+                r = await c.post(url, headers=headers, json=payload, hedge=True)
+                c.raise_if_unavailable(r)
+    except GeminiUnavailable:
+        raise
+    except Exception as e:
+        return f"AI call failed: {e}"
+
+    if r.status_code != 200:
+        try:
+            err = r.json()
+        except Exception:
+            err = {"raw": r.text}
+        return f"AI error {r.status_code}: {err}"
+
+    with stage("postprocess"):
+        data = r.json()
+        pf = data.get("promptFeedback") or {}
+        if pf.get("blockReason"):
+            return f"Blocked by safety: {pf.get('blockReason')}"
+
+        text = _candidate_text(data).strip()
+        if not text:
+            return "I couldn't generate an answer from the provided references."
+
+        return _clean_answer(text)
+
+
+async def aapi_ask(question: str, k: int = 15, max_chars: int = 5000, student_name: str = "student", history=None, cache_scope=None, probes=None, ef_search=None, scope=None):
+    """نفس شكل رد qa.api_ask."""
+    qv = await aembed_query(question)
+    hits = await sync_to_async(search_by_vector)(qv, k=k, probes=probes, ef_search=ef_search, content_chars=max_chars,
+                                                 scope=scope, with_vectors=True)
+
+    ans = None
+    cache_kw = _answer_cache_kwargs(question, hits, student_name, history, cache_scope, query_vec=qv)
+    if cache_kw:
+        ans = await sync_to_async(answer_cache.lookup)(**cache_kw)
+
+    cached = ans is not None
+    if not cached:
+        with stage("context"):
+            ctx = pack_context(hits, qv, max_chars=max_chars)
+        ans = await aanswer_with_gemini(question, ctx, student_name, history=history)
+        if cache_kw:
+            await sync_to_async(answer_cache.store)(question, answer=ans, **cache_kw)
+
+    return _api_result(ans, hits, cached)
+
+
+async def acoalesced_api_ask(question: str, student_name: str = "student", history=None, cache_scope=None,
+                             scope=None, **params):
+    """نسخة async من qa.coalesced_api_ask (الانتظار على الـ event loop مش thread)."""
+    if history:
+        return await aapi_ask(question, student_name=student_name, history=history, cache_scope=cache_scope,
+                              scope=scope, **params)
+
+    async def compute():
+        data = await aapi_ask(question, student_name=student_name, cache_scope=cache_scope, scope=scope, **params)
+        return {**data, "answer": answer_cache.strip_name(data["answer"], student_name)}
+
+    data = await single_flight.arun(coalesce_key(question, cache_scope, scope, params), compute)
+    return {**data, "answer": answer_cache.fill_name(data["answer"], student_name)}
+
+
+# ---- streaming / batch (SSE) ----------------------------------------------
+
+async def astream_answer_with_gemini(question: str, context: str, student_name: str = "Student", history=None):
+    """
+    زى aanswer_with_gemini بس عن طريق streamGenerateContent (SSE، httpx stream على الـ event loop).
+    بيعمل yield لأجزاء النص بعد الـ post-processing أول بأول؛ الأخطاء بترجع كنص زى النسخة العادية.
+    """
+    if not context or not context.strip():
+        yield "No references matched your question. (context is empty)"
+        return
+
+    url, headers, payload = _gen_request(_build_prompt(question, context, student_name, history), stream=True)
+
+    # الـ slot بتاع الـ bulkhead محجوز طول الـ stream
+    async with resilience.acall("generate") as c:
+        try:
+            with stage("generate"):
+                r = await c.post(url, headers=headers, json=payload, stream=True, timeout=(3.05, 30))
+        except GeminiUnavailable:
+            raise
+        except Exception as e:
+            yield f"AI call failed: {e}"
+            return
+
+        try:
+            c.raise_if_unavailable(r)
+            if r.status_code != 200:
+                await r.aread()
+                try:
+                    err = r.json()
+                except Exception:
+                    err = {"raw": r.text}
+                yield f"AI error {r.status_code}: {err}"
+                return
+
+            cleaner = _IncrementalCleaner()
+            got_text = False
+            async for line in r.aiter_lines():
+                if not line or not line.startswith("data:"):
+                    continue
+                try:
+                    data = json.loads(line[5:].strip())
+                except ValueError:
+                    continue
+                pf = data.get("promptFeedback") or {}
+                if pf.get("blockReason"):
+                    yield f"Blocked by safety: {pf.get('blockReason')}"
+                    return
+                piece = _candidate_text(data, sep="")
+                if piece:
+                    got_text = True
+                    with stage("postprocess"):
+                        out = cleaner.feed(piece)
+                    if out:
+                        yield out
+            out = cleaner.finish()
+            if out:
+                yield out
+            if not got_text:
+                yield "I couldn't generate an answer from the provided references."
+        finally:
+            await r.aclose()
+
+
+async def astream_ask(question: str, k: int = 15, max_chars: int = 5000, student_name: str = "student", history=None,
+                      cache_scope=None, scope=None):
+    """نسخة الـ streaming من aapi_ask: ("delta", text) أثناء التوليد وفى الآخر ("done", {"answer", "cached"})."""
+    qv = await aembed_query(question)
+    hits = await sync_to_async(search_by_vector)(qv, k=k, content_chars=max_chars, scope=scope, with_vectors=True)
+
+    cache_kw = _answer_cache_kwargs(question, hits, student_name, history, cache_scope, query_vec=qv)
+    if cache_kw:
+        ans = await sync_to_async(answer_cache.lookup)(**cache_kw)
+        if ans is not None:
+            yield "delta", ans
+            yield "done", {"answer": ans, "cached": True}
+            return
+
+    with stage("context"):
+        ctx = pack_context(hits, qv, max_chars=max_chars)
+    parts = []
+    async for piece in astream_answer_with_gemini(question, ctx, student_name, history=history):
+        parts.append(piece)
+        yield "delta", piece
+    ans = "".join(parts)
+
+    if cache_kw:
+        await sync_to_async(answer_cache.store)(question, answer=ans, **cache_kw)
+    yield "done", {"answer": ans, "cached": False}
+
+
+def _batch_error(ans=None, exc=None):
+    """{"error": "...", "code"?} لسؤال فشل فى الـ batch، أو None لو الإجابة سليمة."""
+    if isinstance(exc, GeminiUnavailable):
+        return {"error": exc.message, "code": "ai_unavailable"}
+    if exc is not None:
+        return {"error": str(exc)}
+    if not answer_cache.cacheable(ans):
+        # "AI error ..." / "Blocked by safety ..." رسايل فشل مش إجابات → ما تتحسبش
+        return {"error": ans, "code": "ai_error"}
+    return None
+
+
+async def abatch_ask(questions, k: int = 10, max_chars: int = 4000, student_name: str = "student", cache_scope=None,
+                     scope=None, probes=None, ef_search=None, concurrency=None):
+    """
+    إجابات لأسئلة كتير: الـ embed (نداء واحد) والبحث (SQL واحد) والكاش فى thread
+    (qa._batch_plan)، والتوليد tasks على الـ event loop بحد concurrency (أو RAG_BATCH_CONCURRENCY).
+    بيعمل yield لـ (index, result) أول ما كل إجابة تخلص (مش بالترتيب)؛ result زى aapi_ask،
+    أو _batch_error لو التوليد وقع.
+    """
+    cached, jobs = await sync_to_async(_batch_plan)(
+        questions, k=k, max_chars=max_chars, student_name=student_name,
+        cache_scope=cache_scope, scope=scope, probes=probes, ef_search=ef_search,
+    )
+    for item in cached:
+        yield item
+    if not jobs:
+        return
+
+    limit = asyncio.Semaphore(concurrency or getattr(settings, "RAG_BATCH_CONCURRENCY", 4))
+
+    async def generate(i, q, ctx):
+        async with limit:
+            try:
+                return i, await aanswer_with_gemini(q, ctx, student_name), None
+            except Exception as e:
+                return i, None, e
+
+    # الـ tasks بتاخد نسخة من الـ context (budget / trace) وقت ما بتتعمل
+    tasks = [asyncio.ensure_future(generate(i, q, ctx)) for i, (q, _, ctx, _) in jobs.items()]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            i, ans, exc = await fut
+            q, hits, _, cache_kw = jobs[i]
+            error = _batch_error(ans, exc)
+            if error:
+                yield i, error
+                continue
+            if cache_kw:
+                await sync_to_async(answer_cache.store)(q, answer=ans, **cache_kw)
+            yield i, _api_result(ans, hits, cached=False)
+    finally:
+        for task in tasks:
+            task.cancel()   # العميل قفل الـ stream → ما نكملش
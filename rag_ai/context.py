@@ -0,0 +1,169 @@
+# rag_ai/context.py
+"""
+تجميع الـ context للـ prompt بميزانية tokens بدل حد حروف.
+
+1) dedupe: نفس النص (بعد توحيد المسافات) مرة واحدة بس.
+2) MMR على الـ vectors اللى راجعة من البحث (with_vectors): الأقرب للسؤال
+   والأبعد عن اللى اتختار قبله؛ والشبه جدًا (>= RAG_CONTEXT_DEDUPE_SIM) بيتشال.
+3) ملء ميزانية الـ tokens (حسب الموديل، RAG_CONTEXT_TOKENS)، وchunk واحد
+   ما ياخدش أكتر من RAG_CONTEXT_MAX_SHARE منها.
+4) الـ chunks المتجاورة من نفس الملف بتتدمج فى segment واحد من غير الـ overlap.
+
+estimate_tokens تقريبى (حروف / RAG_CHARS_PER_TOKEN)؛ مقارنة قبل/بعد:
+python manage.py context_report
+"""
+import hashlib
+import math
+
+import numpy as np
+from django.conf import settings
+
+# (بادئة اسم الموديل، tokens للـ context) — أول تطابق بيكسب
+_MODEL_BUDGETS = (
+    ("gemini-2.5-pro", 1800),
+    ("gemini-2.5-flash-lite", 750),
+    ("gemini-2.5-flash", 1000),
+    ("gemini-1.5-pro", 1800),
+    ("gemini-1.5-flash", 900),
+)
+_DEFAULT_BUDGET = 800
+
+_MIN_PIECE_TOKENS = 48   # أقل من كده مش بيستاهل نقص chunk علشانه
+_MAX_OVERLAP = 600       # حروف؛ أكبر من الـ overlap بتاع ingest.split_text
+_MIN_OVERLAP = 20        # أقل من كده غالبًا صدفة مش overlap
+
+
+def _chars_per_token():
+    return float(getattr(settings, "RAG_CHARS_PER_TOKEN", 4.0))
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text or "") / _chars_per_token())
+
+
+def token_budget(model=None, max_chars=None):
+    """ميزانية الـ context: RAG_CONTEXT_TOKENS لو متحدد، غير كده حسب الموديل؛ و max_chars سقف."""
+    budget = int(getattr(settings, "RAG_CONTEXT_TOKENS", 0) or 0)
+    if not budget:
+        model = model or getattr(settings, "GEMINI_GEN_MODEL", "")
+        budget = next((b for prefix, b in _MODEL_BUDGETS if model.startswith(prefix)), _DEFAULT_BUDGET)
+    if max_chars:
+        budget = min(budget, int(max_chars / _chars_per_token()))
+    return budget
+
+
+def _norm_key(text):
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def _overlap(a, b):
+    """أطول جزء فى آخر a هو نفسه أول b (الـ overlap بين chunks متتالية)."""
+    for n in range(min(len(a), len(b), _MAX_OVERLAP), _MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def _truncate(text, tokens):
+    limit = int(tokens * _chars_per_token())
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[: cut if cut > limit // 2 else limit].rstrip() + " …"
+
+
+def _unit(vec):
+    vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def mmr_order(hits, query_vec, lam=None, dedupe_sim=None):
+    """
+    hits: [(distance, ChunkHit)] فيها vector. بيرجّع نفس العناصر بترتيب MMR،
+    من غير اللى شبه chunk متختار أكتر من dedupe_sim.
+    """
+    lam = float(getattr(settings, "RAG_MMR_LAMBDA", 0.7) if lam is None else lam)
+    dedupe_sim = float(getattr(settings, "RAG_CONTEXT_DEDUPE_SIM", 0.97) if dedupe_sim is None else dedupe_sim)
+
+    mat = np.stack([_unit(h.vector) for _, h in hits])
+    rel = mat @ _unit(query_vec)
+    sims = mat @ mat.T
+
+    order, left = [], list(range(len(hits)))
+    best_sim = np.full(len(hits), -1.0, dtype=np.float32)   # أعلى شبه بكل اللى اتختار
+    while left:
+        scores = [lam * rel[i] - (1 - lam) * max(best_sim[i], 0.0) for i in left]
+        i = left.pop(int(np.argmax(scores)))
+        if best_sim[i] >= dedupe_sim:
+            continue
+        order.append(hits[i])
+        best_sim = np.maximum(best_sim, sims[i])
+    return order
+
+
+def pack_context(hits, query_vec=None, *, max_chars=None, model=None, budget=None):
+    """
+    hits: [(distance, ChunkHit)] بترتيب البحث. query_vec + vectors فى الـ hits → MMR،
+    غير كده ترتيب الـ distance. بيرجّع نص الـ context.
+    """
+    budget = budget or token_budget(model, max_chars)
+
+    seen, items = set(), []
+    for d, h in hits:
+        key = _norm_key(h.content or "")
+        if h.content and key not in seen:
+            seen.add(key)
+            items.append((d, h))
+
+    if query_vec is not None and items and all(h.vector is not None for _, h in items):
+        items = mmr_order(items, query_vec)
+
+    max_piece = max(_MIN_PIECE_TOKENS, int(budget * float(getattr(settings, "RAG_CONTEXT_MAX_SHARE", 0.5))))
+    chosen = {}   # (file_name, chunk_index) → (distance, text)
+    used = 0
+    for d, h in items:
+        remaining = budget - used
+        if remaining < _MIN_PIECE_TOKENS:
+            break
+        text = h.content.strip()
+        # الـ overlap مع جار متختار مش بيتحسب مرتين
+        cost_text = text
+        prev = chosen.get((h.file_name, h.chunk_index - 1))
+        if prev:
+            cost_text = cost_text[_overlap(prev[1], cost_text):]
+        nxt = chosen.get((h.file_name, h.chunk_index + 1))
+        if nxt:
+            cost_text = cost_text[: len(cost_text) - _overlap(cost_text, nxt[1])]
+
+        cost = estimate_tokens(cost_text)
+        limit = min(max_piece, remaining)
+        if cost > limit:
+            if limit < _MIN_PIECE_TOKENS:
+                continue
+            text = _truncate(text, limit)
+            cost = estimate_tokens(text)
+        chosen[(h.file_name, h.chunk_index)] = (d, text)
+        used += cost
+
+    return _assemble(chosen)
+
+
+def _assemble(chosen):
+    """الـ chunks المتجاورة من نفس الملف → segment واحد؛ الـ segments بترتيب الأقرب."""
+    runs = []
+    for (file_name, idx), (d, text) in sorted(chosen.items()):
+        last = runs[-1] if runs else None
+        if last and last["file"] == file_name and last["end"] == idx - 1:
+            last["text"] += text[_overlap(last["text"], text):]
+            last["end"] = idx
+            last["distance"] = min(last["distance"], d)
+        else:
+            runs.append({"file": file_name, "start": idx, "end": idx, "text": text, "distance": d})
+
+    runs.sort(key=lambda r: r["distance"])
+    segs = []
+    for r in runs:
+        span = f"{r['start']}" if r["start"] == r["end"] else f"{r['start']}-{r['end']}"
+        segs.append(f"[{r['file']}#{span}] {r['text']}".strip())
+    return "\n\n".join(segs)
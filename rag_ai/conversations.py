@@ -0,0 +1,168 @@
+# rag_ai/conversations.py
+"""
+المحادثات على السيرفر بدل ما المتصفح يبعت الـ history كلها مع كل سؤال.
+
+    conv = conversations.get(user, body.get("conversation_id"))   # جديدة لو مش موجودة / مش بتاعته
+    history = conversations.history(conv)    # summary (لو فيه) + كل الأدوار اللى لسه ما اتلخصتش
+    ... api_ask(q, history=history) ...
+    conversations.append(conv, q, answer)
+
+لما الأدوار تزيد عن الـ window بـ RAG_CONVERSATION_COMPACT_EVERY، القديم بيتلخص
+(Gemini، فى الخلفية) ويدخل فى Conversation.summary ويتمسح. لحد ما ده يحصل الأدوار
+الزيادة بتفضل فى الـ history (مفيش دور بيقع من غير ما يتلخص)، فالـ prompt أقصاه
+window + compact_every دور مهما المحادثة طولت، وطلب الكلاينت فيه السؤال بس.
+"""
+import logging
+import os
+import queue
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Conversation, ConversationTurn
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ROLE = "summary"      # دور خاص فى الـ history؛ _build_prompt بيحطه كملخص
+SUMMARY_MAX_CHARS = 2000
+
+
+def _window():
+    return int(getattr(settings, "RAG_CONVERSATION_WINDOW", 10))
+
+
+def _compact_every():
+    return int(getattr(settings, "RAG_CONVERSATION_COMPACT_EVERY", 6))
+
+
+def get(user, conversation_id=None):
+    """محادثة المستخدم بالـ id ده، أو واحدة جديدة."""
+    try:
+        pk = uuid.UUID(str(conversation_id)) if conversation_id else None
+    except ValueError:
+        pk = None
+    conv = Conversation.objects.filter(pk=pk, user=user).first() if pk else None
+    return conv or Conversation.objects.create(user=user)
+
+
+def history(conv):
+    """
+    [{"role": "summary", ...}?, {"role": "user"/"assistant", "content": ...}, ...] للـ prompt.
+    الأدوار اللى بعد الـ window ولسه مستنية compact بتيجى هى كمان، والحد window +
+    compact_every بيحمى الـ prompt لو الـ compaction فشل.
+    """
+    turns = list(
+        ConversationTurn.objects.filter(conversation=conv)
+        .order_by("-id").values("role", "content")[: _window() + _compact_every()]
+    )
+    turns.reverse()
+    if conv.summary:
+        turns.insert(0, {"role": SUMMARY_ROLE, "content": conv.summary})
+    return turns
+
+
+def append(conv, question, answer):
+    ConversationTurn.objects.bulk_create([
+        ConversationTurn(conversation=conv, role="user", content=question),
+        ConversationTurn(conversation=conv, role="assistant", content=answer),
+    ])
+    conv.save(update_fields=["updated_at"])
+    if ConversationTurn.objects.filter(conversation=conv).count() > _window() + _compact_every():
+        pk = conv.pk
+        transaction.on_commit(lambda: enqueue_compact(pk))
+
+
+# ---- compaction ------------------------------------------------------------
+
+def _summary_prompt(summary, turns):
+    lines = "\n".join(
+        f"{'Student' if t.role == 'user' else 'Tutor'}: {t.content.strip()}" for t in turns
+    )
+    return f"""Update the running summary of a conversation between a medical student and their tutor.
+Keep the topics discussed, what the student already understood, open questions and any stated preferences
+(language, level of detail). Do not repeat full answers. At most 120 words, plain text.
+
+Current summary:
+{summary or "(none)"}
+
+New turns:
+{lines}
+
+Updated summary:"""
+
+
+def summarize(summary, turns):
+    from . import resilience
+    from .qa import _candidate_text, _gen_request
+
+    url, headers, payload = _gen_request(_summary_prompt(summary, turns))
+    payload["generationConfig"] = {"temperature": 0.1, "maxOutputTokens": 256}
+    with resilience.call("summary") as c:
+        r = c.post(url, headers=headers, json=payload, timeout=30)
+        c.raise_for_status(r)
+    text = _candidate_text(r.json()).strip()
+    if not text:
+        raise ValueError("empty summary")
+    return text[:SUMMARY_MAX_CHARS]
+
+
+def compact(conversation_id):
+    """الأدوار اللى قبل آخر window → summary، وبعدين بتتمسح."""
+    conv = Conversation.objects.filter(pk=conversation_id).first()
+    if conv is None:
+        return 0
+    turns = list(ConversationTurn.objects.filter(conversation=conv).order_by("id"))
+    old = turns[: max(0, len(turns) - _window())]
+    if not old:
+        return 0
+
+    summary = summarize(conv.summary, old)
+    with transaction.atomic():
+        # لو process تانى لخّص فى نفس الوقت الـ summary اتغير → نسيب شغله
+        if not Conversation.objects.filter(pk=conv.pk, summary=conv.summary).update(summary=summary):
+            return 0
+        ConversationTurn.objects.filter(id__in=[t.id for t in old]).delete()
+    return len(old)
+
+
+_queue = queue.Queue()
+_pending = set()
+_pending_lock = threading.Lock()
+_worker = None
+_worker_pid = None
+
+
+def _run_queue():
+    while True:
+        conversation_id = _queue.get()
+        with _pending_lock:
+            _pending.discard(conversation_id)
+        close_old_connections()
+        try:
+            compact(conversation_id)
+        except Exception as e:
+            # الأدوار بتفضل؛ history() لسه محدود بالـ window فالـ prompt مش بيكبر
+            logger.warning("conversation %s not compacted: %s", conversation_id, e)
+        finally:
+            close_old_connections()
+            _queue.task_done()
+
+
+def enqueue_compact(conversation_id):
+    """زى ingest.enqueue_lesson: thread واحد لكل process، ونفس المحادثة مرة واحدة فى الطابور."""
+    global _queue, _worker, _worker_pid
+    with _pending_lock:
+        pid = os.getpid()
+        if _worker_pid != pid:
+            _queue, _worker = queue.Queue(), None
+            _pending.clear()
+        if conversation_id in _pending:
+            return
+        _pending.add(conversation_id)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_queue, name="rag-conversation-compact", daemon=True)
+            _worker.start()
+            _worker_pid = pid
+    _queue.put(conversation_id)
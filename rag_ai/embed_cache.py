@@ -0,0 +1,124 @@
+# rag_ai/embed_cache.py
+"""
+كاش لـ embeddings الأسئلة: نص السؤال (بعد normalize) → متجه float32.
+
+- Tier 1: LRU فى الذاكرة لكل worker (EMBED_CACHE_SIZE عنصر، EMBED_CACHE_TTL ثانية).
+- Tier 2 (اختيارى): Django cache مشترك بين الـ workers (EMBED_CACHE_SHARED_ALIAS).
+  لو الـ alias ده DatabaseCache يبقى الكاش فى جدول على Postgres.
+- الـ key فيه اسم الموديل، فتغيير GEMINI_EMBED_MODEL مش بيرجّع متجهات قديمة.
+- stats(): hits (local/shared) و misses.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+_WS_RE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_lru = OrderedDict()  # key -> (expires_at, vec)
+
+_stats = {"hits_local": 0, "hits_shared": 0, "misses": 0, "evictions": 0}
+
+
+def _max_size():
+    return getattr(settings, "EMBED_CACHE_SIZE", 2048)
+
+
+def _ttl():
+    return getattr(settings, "EMBED_CACHE_TTL", 7 * 24 * 3600)
+
+
+def _shared_cache():
+    alias = getattr(settings, "EMBED_CACHE_SHARED_ALIAS", "")
+    return caches[alias] if alias else None
+
+
+def normalize(text: str) -> str:
+    """نفس السؤال بمسافات أو حروف كبيرة مختلفة = نفس الـ key."""
+    return _WS_RE.sub(" ", (text or "").strip()).casefold()
+
+
+def make_key(text: str, model: str = None) -> str:
+    model = model or settings.GEMINI_EMBED_MODEL
+    digest = hashlib.sha1(f"{model}\n{normalize(text)}".encode("utf-8")).hexdigest()
+    return f"rag:qemb:{digest}"
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def get(key):
+    """بيرجّع المتجه (1D float32) أو None."""
+    now = time.monotonic()
+    with _lock:
+        item = _lru.get(key)
+        if item is not None:
+            expires_at, vec = item
+            if expires_at > now:
+                _lru.move_to_end(key)
+                _stats["hits_local"] += 1
+                return vec
+            del _lru[key]
+
+    shared = _shared_cache()
+    if shared is not None:
+        try:
+            raw = shared.get(key)
+        except Exception:
+            raw = None
+        if raw:
+            vec = np.frombuffer(raw, dtype=np.float32)
+            _put_local(key, vec)
+            _count("hits_shared")
+            return vec
+
+    _count("misses")
+    return None
+
+
+def _put_local(key, vec):
+    size = _max_size()
+    if size <= 0:
+        return
+    with _lock:
+        _lru[key] = (time.monotonic() + _ttl(), vec)
+        _lru.move_to_end(key)
+        while len(_lru) > size:
+            _lru.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def put(key, vec):
+    vec = np.ascontiguousarray(vec, dtype=np.float32).reshape(-1)
+    vec.setflags(write=False)  # المتجه متشارك بين الطلبات
+    _put_local(key, vec)
+
+    shared = _shared_cache()
+    if shared is not None:
+        try:
+            shared.set(key, vec.tobytes(), timeout=_ttl())
+        except Exception:
+            pass  # الكاش المشترك مش لازم يوقع الطلب
+    return vec
+
+
+def clear():
+    with _lock:
+        _lru.clear()
+
+
+def stats():
+    with _lock:
+        data = dict(_stats)
+        data["size"] = len(_lru)
+    lookups = data["hits_local"] + data["hits_shared"] + data["misses"]
+    data["hit_ratio"] = round((data["hits_local"] + data["hits_shared"]) / lookups, 4) if lookups else 0.0
+    return data
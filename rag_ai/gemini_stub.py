@@ -0,0 +1,188 @@
+# rag_ai/gemini_stub.py
+"""
+Stand-in محلى لـ Gemini REST علشان نقيس الـ overhead بتاعنا من غير Google:
+
+    POST /{v1|v1beta}/models/{model}:embedContent
+    POST /{v1|v1beta}/models/{model}:batchEmbedContents
+    POST /{v1|v1beta}/models/{model}:generateContent
+    POST /{v1|v1beta}/models/{model}:streamGenerateContent?alt=sse
+
+- الـ embeddings ثابتة لنفس النص (seed من sha256)، بالبعد EMBED_DIM.
+- latency: embed_ms / gen_ms (+ jitter_ms)، والـ stream بيطلع stream_chunks جزء كل chunk_ms.
+- failure injection: fail_rate بـ fail_status (429 / 503 / 500)، و hang_rate بيستنى hang_s
+  (لاختبار الـ timeouts).
+
+التشغيل: python manage.py gemini_stub --port 8765 ثم GEMINI_API_BASE=http://127.0.0.1:8765
+أو start() جوه process (bench_rag --stub).
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import numpy as np
+
+EMBED_DIM = 768
+
+_PATH_RE = re.compile(r"^/(v1|v1beta)/models/([^/:]+):(embedContent|batchEmbedContents|generateContent|streamGenerateContent)$")
+
+_ERRORS = {
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+}
+
+
+class StubConfig:
+    def __init__(self, embed_ms=30.0, gen_ms=400.0, jitter_ms=0.0, stream_chunks=8, chunk_ms=40.0,
+                 fail_rate=0.0, fail_status=503, hang_rate=0.0, hang_s=60.0, answer_words=120):
+        self.embed_ms = embed_ms
+        self.gen_ms = gen_ms
+        self.jitter_ms = jitter_ms
+        self.stream_chunks = max(1, stream_chunks)
+        self.chunk_ms = chunk_ms
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self.answer_words = answer_words
+
+
+def stub_vector(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32)
+    vec /= np.linalg.norm(vec)
+    return [round(float(v), 6) for v in vec]
+
+
+def _text_of(content):
+    return "".join(p.get("text", "") for p in (content or {}).get("parts", []))
+
+
+def _answer(prompt, words):
+    # كلام من الـ context نفسه علشان الـ post-processing يشتغل على نص شبه الحقيقى
+    vocab = re.findall(r"[A-Za-z][A-Za-z-]{3,}", prompt) or ["stub"]
+    rng = random.Random(hashlib.sha1(prompt.encode("utf-8")).digest())
+    body = " ".join(rng.choice(vocab) for _ in range(words))
+    return f"**Answer**\n\n- {body[: len(body) // 2]}\n- {body[len(body) // 2:]}\n"
+
+
+def _usage(prompt, answer):
+    return {
+        "promptTokenCount": len(prompt) // 4,
+        "candidatesTokenCount": len(answer) // 4,
+        "totalTokenCount": (len(prompt) + len(answer)) // 4,
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive زى Google
+    config: StubConfig = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # ---- helpers ----
+
+    def _sleep(self, ms):
+        ms += random.uniform(0, self.config.jitter_ms) if self.config.jitter_ms else 0
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject_failure(self):
+        cfg = self.config
+        if cfg.hang_rate and random.random() < cfg.hang_rate:
+            time.sleep(cfg.hang_s)
+        if cfg.fail_rate and random.random() < cfg.fail_rate:
+            status = cfg.fail_status
+            self._send_json(status, {"error": {
+                "code": status, "message": "Injected failure (gemini_stub)", "status": _ERRORS.get(status, "UNKNOWN"),
+            }})
+            return True
+        return False
+
+    # ---- routes ----
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"code": 400, "message": "Invalid JSON", "status": "INVALID_ARGUMENT"}})
+
+        m = _PATH_RE.match(urlsplit(self.path).path)
+        if not m:
+            return self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+        if not self.headers.get("x-goog-api-key"):
+            return self._send_json(403, {"error": {"code": 403, "message": "Missing API key", "status": "PERMISSION_DENIED"}})
+        if self._inject_failure():
+            return
+
+        method = m.group(3)
+        if method == "embedContent":
+            self._sleep(self.config.embed_ms)
+            return self._send_json(200, {"embedding": {"values": stub_vector(_text_of(body.get("content")))}})
+
+        if method == "batchEmbedContents":
+            self._sleep(self.config.embed_ms)
+            return self._send_json(200, {"embeddings": [
+                {"values": stub_vector(_text_of(req.get("content")))} for req in body.get("requests", [])
+            ]})
+
+        prompt = "".join(_text_of(c) for c in body.get("contents", []))
+        answer = _answer(prompt, self.config.answer_words)
+        if method == "generateContent":
+            self._sleep(self.config.gen_ms)
+            return self._send_json(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": answer}]}, "finishReason": "STOP"}],
+                "usageMetadata": _usage(prompt, answer),
+            })
+        self._stream(prompt, answer)
+
+    def _stream(self, prompt, answer):
+        cfg = self.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        self._sleep(cfg.gen_ms)   # أول token
+        step = max(1, -(-len(answer) // cfg.stream_chunks))
+        pieces = [answer[i:i + step] for i in range(0, len(answer), step)]
+        for i, piece in enumerate(pieces):
+            if i:
+                self._sleep(cfg.chunk_ms)
+            data = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+            if i == len(pieces) - 1:
+                data["candidates"][0]["finishReason"] = "STOP"
+                data["usageMetadata"] = _usage(prompt, answer)
+            self.wfile.write(f"data: {json.dumps(data)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+
+
+def make_server(host="127.0.0.1", port=0, config=None):
+    handler = type("StubHandler", (_Handler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start(host="127.0.0.1", port=0, config=None):
+    """يشغّل الـ stub فى thread. بيرجّع (server, base_url)؛ server.shutdown() للإيقاف."""
+    server = make_server(host, port, config)
+    threading.Thread(target=server.serve_forever, name="gemini-stub", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
@@ -0,0 +1,226 @@
+# rag_ai/index.py
+"""
+إدارة الـ ANN index على rag_ai_chunk (pgvector, cosine): embedding_vec (float32)
+أو embedding_half (halfvec، نص المساحة). البحث بيستخدم RAG_VECTOR_COLUMN.
+
+- ivfflat: lists من عدد الصفوف (rows/1000 لحد مليون، بعد كده sqrt(rows)).
+- hnsw: m و ef_construction.
+- الـ build بيتعمل CONCURRENTLY باسم مؤقت، وبعدين نشيل القديم ونغيّر الاسم،
+  فالبحث مش بيقف والجدول مش بيتقفل للكتابة.
+- search_params(): بيظبط ivfflat.probes / hnsw.ef_search لكل طلب (SET LOCAL
+  جوه transaction، علشان ما يسربش لطلبات تانية على نفس الـ connection).
+- البحث المحدود بسنة (WHERE year_id = N): partial index لكل سنة
+  (build(..., year_id=N) / build_per_year)، أو iterative scan (pgvector >= 0.8،
+  RAG_ITERATIVE_SCAN) علشان الـ filter بعد الـ index ما يرجّعش أقل من k.
+- backfill_half(): embedding_half من embedding_vec على batches (كل batch commit لوحده).
+"""
+import math
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+TABLE = "rag_ai_chunk"
+COLUMN = "embedding_vec"          # float32، المرجع للـ recall
+HALF_COLUMN = "embedding_half"
+INDEX_NAME = "rag_ai_chunk_embedding_ann"
+KINDS = ("hnsw", "ivfflat")
+
+# column → (نوع pgvector، الـ opclass، اسم الـ index)
+_COLUMNS = {
+    COLUMN: ("vector", "vector_cosine_ops", INDEX_NAME),
+    HALF_COLUMN: ("halfvec", "halfvec_cosine_ops", "rag_ai_chunk_embedding_half_ann"),
+}
+COLUMNS = tuple(_COLUMNS)
+
+
+def vector_column():
+    column = getattr(settings, "RAG_VECTOR_COLUMN", COLUMN)
+    if column not in _COLUMNS:
+        raise ValueError(f"RAG_VECTOR_COLUMN must be one of {', '.join(COLUMNS)}")
+    return column
+
+
+def vector_type(column=None):
+    return _COLUMNS[column or vector_column()][0]
+
+
+def index_name(column=None):
+    return _COLUMNS[column or vector_column()][2]
+
+
+def default_probes():
+    return getattr(settings, "RAG_IVFFLAT_PROBES", 10)
+
+
+def default_ef_search():
+    return getattr(settings, "RAG_HNSW_EF_SEARCH", 40)
+
+
+def ivfflat_lists(rows: int) -> int:
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def iterative_scan():
+    # "" (off) / "relaxed_order" / "strict_order"؛ محتاج pgvector >= 0.8
+    return getattr(settings, "RAG_ITERATIVE_SCAN", "")
+
+
+def year_index_name(year_id, column=None) -> str:
+    return f"{index_name(column)}_y{int(year_id)}"
+
+
+def row_count(year_id=None, column=None) -> int:
+    sql, params = f"SELECT count(*) FROM {TABLE} WHERE {column or vector_column()} IS NOT NULL", []
+    if year_id is not None:
+        sql += " AND year_id = %s"
+        params.append(year_id)
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchone()[0]
+
+
+def rows_per_year(column=None):
+    """[(year_id or None, rows), ...]"""
+    with connection.cursor() as cur:
+        cur.execute(
+            f"SELECT year_id, count(*) FROM {TABLE} WHERE {column or vector_column()} IS NOT NULL "
+            f"GROUP BY year_id ORDER BY year_id NULLS LAST"
+        )
+        return cur.fetchall()
+
+
+def ann_indexes(column=None):
+    """[(name, method, definition), ...] للـ ANN indexes اللى على العمود."""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT i.relname, am.amname, pg_get_indexdef(i.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_class t ON t.oid = x.indrelid
+            JOIN pg_am am ON am.oid = i.relam
+            JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(x.indkey)
+            WHERE t.relname = %s AND a.attname = %s AND am.amname IN ('hnsw', 'ivfflat')
+            ORDER BY i.relname
+            """,
+            [TABLE, column or vector_column()],
+        )
+        return cur.fetchall()
+
+
+def _index_sql(name, kind, *, m=16, ef_construction=64, lists=None, year_id=None, column=None):
+    column = column or vector_column()
+    if kind == "hnsw":
+        with_ = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    elif kind == "ivfflat":
+        with_ = f"lists = {int(lists or ivfflat_lists(row_count(year_id, column)))}"
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+    where = f" WHERE year_id = {int(year_id)}" if year_id is not None else ""
+    return (
+        f"CREATE INDEX CONCURRENTLY {name} ON {TABLE} "
+        f"USING {kind} ({column} {_COLUMNS[column][1]}) WITH ({with_}){where}"
+    )
+
+
+def _is_year_index(name, column=None):
+    return name.startswith(f"{index_name(column)}_y")
+
+
+def build(kind, *, m=16, ef_construction=64, lists=None, maintenance_work_mem=None, year_id=None, column=None):
+    """
+    يبنى index جديد على column (الافتراضى RAG_VECTOR_COLUMN) ويبدّله مكان القديم:
+    - من غير year_id: الـ index العام (وبيشيل أى ANN index تانى مش per-year على نفس العمود).
+    - year_id: partial index للسنة دى بس (WHERE year_id = N).
+    لازم يتنادى برّه transaction (CONCURRENTLY).
+    """
+    column = column or vector_column()
+    target = year_index_name(year_id, column) if year_id is not None else index_name(column)
+    tmp = f"{target}_new"
+    with connection.cursor() as cur:
+        if maintenance_work_mem:
+            cur.execute("SET maintenance_work_mem = %s", [maintenance_work_mem])
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {tmp}")
+        cur.execute(_index_sql(tmp, kind, m=m, ef_construction=ef_construction, lists=lists,
+                               year_id=year_id, column=column))
+
+    if year_id is not None:
+        old = [name for name, _, _ in ann_indexes(column) if name == target]
+    else:
+        old = [name for name, _, _ in ann_indexes(column) if name != tmp and not _is_year_index(name, column)]
+    drop(old)
+    with connection.cursor() as cur:
+        cur.execute(f"ALTER INDEX {tmp} RENAME TO {target}")
+    return target
+
+
+def build_per_year(kind, column=None, **kwargs):
+    """partial index لكل سنة ليها chunks. بيرجّع أسماء الـ indexes."""
+    return [
+        build(kind, year_id=year_id, column=column, **kwargs)
+        for year_id, _ in rows_per_year(column) if year_id is not None
+    ]
+
+
+def drop(names=None, column=None):
+    if names is None:
+        names = [name for name, _, _ in ann_indexes(column)]
+    with connection.cursor() as cur:
+        for name in names:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {connection.ops.quote_name(name)}")
+    return names
+
+
+@contextmanager
+def search_params(cur, *, probes=None, ef_search=None, k=None, filtered=False):
+    """
+    with transaction + SET LOCAL للـ probes / ef_search.
+    ef_search لازم تبقى >= k وإلا hnsw يرجّع نتائج أقل من k.
+    filtered: الاستعلام فيه WHERE (سنة مثلاً) → iterative scan لو RAG_ITERATIVE_SCAN متفعّل.
+    """
+    probes = int(probes or default_probes())
+    ef_search = int(ef_search or default_ef_search())
+    if k:
+        ef_search = max(ef_search, int(k))
+    with transaction.atomic():
+        cur.execute("SELECT set_config('ivfflat.probes', %s, true), set_config('hnsw.ef_search', %s, true)",
+                    [str(probes), str(ef_search)])
+        mode = iterative_scan() if filtered else ""
+        if mode:
+            # ivfflat بيدعم relaxed_order بس
+            cur.execute(
+                "SELECT set_config('hnsw.iterative_scan', %s, true), "
+                "set_config('ivfflat.iterative_scan', 'relaxed_order', true)",
+                [mode],
+            )
+        yield cur
+
+
+def backfill_half(batch_size=1000, on_progress=None):
+    """
+    embedding_half = embedding_vec::halfvec للصفوف اللى لسه فاضية، batch ورا batch
+    (UPDATE قصير لكل batch، autocommit). بيرجّع عدد الصفوف.
+    """
+    total = 0
+    while True:
+        with connection.cursor() as cur:
+            cur.execute(
+                f"""
+                UPDATE {TABLE} SET {HALF_COLUMN} = {COLUMN}::halfvec
+                WHERE id IN (
+                    SELECT id FROM {TABLE}
+                    WHERE {HALF_COLUMN} IS NULL AND {COLUMN} IS NOT NULL
+                    ORDER BY id LIMIT %s
+                )
+                """,
+                [batch_size],
+            )
+            n = cur.rowcount
+        if not n:
+            return total
+        total += n
+        if on_progress:
+            on_progress(total)
@@ -0,0 +1,567 @@
+# rag_ai/ingest.py
+"""
+Ingestion للـ Chunks: نص → chunks → embeddings (batches) → upsert.
+
+- المصادر: Lesson.content (HTML من CKEditor)، Lesson.pdf، وملفات مرفوعة (pdf/txt/md).
+- كل chunk معاه content_hash؛ بنقارن بالموجود ونعمل embed للى اتغير بس
+  (الـ chunk اللى اتنقل مكانه بياخد نفس الـ vector من غير نداء)، والزيادة بتتمسح.
+- الـ embeddings بتتعمل batches (batchEmbedContents) بعدد threads محدود،
+  ومع backoff لما Gemini يرجّع 429 / 503.
+- الـ upsert بـ bulk_create(update_conflicts=True) على (file_name, chunk_index).
+- Checkpoint (JSON) بالمصادر اللى خلصت؛ جوه المصدر الـ hashes نفسها بتخلّى
+  الـ run اللى وقع يكمل من غير ما يعيد embed.
+- كل chunk متعلّم بـ year / module / subject (من الدرس، أو --year / --subject للملفات)
+  علشان البحث المحدود؛ retag_chunks() بتظبطهم لو الدرس/المادة اتنقلت من غير re-embed.
+- enqueue_lesson(): تحديث درس واحد فى الخلفية بعد الحفظ (rag_ai/signals.py).
+
+الأمر: python manage.py ingest_chunks (rag_ai/management/commands/ingest_chunks.py)
+"""
+import hashlib
+import html
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils.html import strip_tags
+
+from medical_project.http_pool import get_session
+from rag_ai.models import Chunk
+from rag_ai.qa import gemini_url
+
+logger = logging.getLogger(__name__)
+
+EMBED_TASK = "RETRIEVAL_DOCUMENT"
+MAX_BATCH = 100  # حد batchEmbedContents
+CHUNKER_VERSION = 2
+EMPTY_TAGS = {"year_id": None, "module_id": None, "subject_id": None}
+
+_RETRYABLE = ("429", "503", "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "rate")
+
+
+# ---- Sources -------------------------------------------------------------
+
+class Source:
+    """
+    نص واحد هيتقسم chunks. file_name ثابت علشان الـ upsert والـ checkpoint.
+    tags: {"year_id", "module_id", "subject_id"} (أى واحد ممكن يبقى None).
+    """
+
+    def __init__(self, file_name, load, lesson_id=None, tags=None):
+        self.file_name = file_name
+        self.lesson_id = lesson_id
+        self.tags = {**EMPTY_TAGS, **(tags or {})}
+        self._load = load
+
+    def text(self):
+        return self._load() or ""
+
+
+def lesson_content_name(lesson_id):
+    return f"lesson/{lesson_id}/content"
+
+
+def lesson_pdf_name(lesson_id):
+    return f"lesson/{lesson_id}/pdf"
+
+
+def html_to_text(value):
+    text = strip_tags(value or "")
+    text = html.unescape(text)
+    return re.sub(r"[ \t\r\f\v]+", " ", text).strip()
+
+
+def pdf_to_text(fileobj):
+    """PyMuPDF لو موجود، غير كده pypdf. الاتنين optional."""
+    data = fileobj.read()
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        fitz = None
+    if fitz is not None:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            return "\n\n".join(page.get_text() for page in doc)
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("PDF ingestion needs PyMuPDF (pip install PyMuPDF) or pypdf.")
+    import io
+    reader = PdfReader(io.BytesIO(data))
+    return "\n\n".join((page.extract_text() or "") for page in reader.pages)
+
+
+def lesson_tags(lesson):
+    """lesson لازم يكون جاى بـ select_related("subject__module__semester")."""
+    module = lesson.subject.module
+    return {"year_id": module.semester.year_id, "module_id": module.id, "subject_id": lesson.subject_id}
+
+
+def subject_tags(subject_id):
+    from edu.models import Subject
+
+    row = (
+        Subject.objects.filter(id=subject_id)
+        .values("module_id", "module__semester__year_id")
+        .first()
+    )
+    if row is None:
+        raise ValueError(f"Subject {subject_id} not found")
+    return {"year_id": row["module__semester__year_id"], "module_id": row["module_id"], "subject_id": subject_id}
+
+
+def _lesson_content_source(lesson):
+    return Source(lesson_content_name(lesson.id), lambda v=lesson.content: html_to_text(v), lesson.id,
+                  lesson_tags(lesson))
+
+
+def _lesson_pdf_source(lesson):
+    def load(f=lesson.pdf):
+        with f.open("rb") as fh:
+            return pdf_to_text(fh)
+    return Source(lesson_pdf_name(lesson.id), load, lesson.id, lesson_tags(lesson))
+
+
+def _lessons():
+    from edu.models import Lesson
+
+    return (
+        Lesson.objects.select_related("subject__module__semester")
+        .only("id", "content", "pdf", "subject_id", "subject__module_id",
+              "subject__module__semester_id", "subject__module__semester__year_id")
+    )
+
+
+def lesson_sources(lesson_ids=None, include_content=True, include_pdf=True):
+    qs = _lessons().order_by("id")
+    if lesson_ids:
+        qs = qs.filter(id__in=lesson_ids)
+    for lesson in qs.iterator(chunk_size=200):
+        if include_content and (lesson.content or "").strip():
+            yield _lesson_content_source(lesson)
+        if include_pdf and lesson.pdf:
+            yield _lesson_pdf_source(lesson)
+
+
+def file_sources(paths, tags=None):
+    for path in paths:
+        name = os.path.basename(path)
+
+        def load(p=path):
+            if p.lower().endswith(".pdf"):
+                with open(p, "rb") as fh:
+                    return pdf_to_text(fh)
+            with open(p, encoding="utf-8", errors="replace") as fh:
+                return fh.read()
+        yield Source(name, load, tags=tags)
+
+
+# ---- Chunking ------------------------------------------------------------
+
+def _split_long(par, size):
+    """فقرة أطول من size → قطع على حدود الجمل جوه الفقرة نفسها بس."""
+    out, start, n = [], 0, len(par)
+    while start < n:
+        end = min(n, start + size)
+        if end < n:
+            window = par[start:end]
+            cut = max(window.rfind(". "), window.rfind("\n"), window.rfind(" "))
+            if cut > size // 2:
+                end = start + cut + 1
+        out.append(par[start:end].strip())
+        start = end
+    return [p for p in out if p]
+
+
+def _is_anchor(unit):
+    # حدود بتتحدد من المحتوى نفسه (مش من مكانها)، فتعديل فى الأول ما يزحلقش كل اللى بعده
+    return zlib.crc32(unit.encode("utf-8")) % 3 == 0
+
+
+def split_text(text, size=1200, overlap=200):
+    """
+    content-defined chunking: الفقرات بتتجمع لحد size، والـ chunk بيقفل بعد
+    فقرة "anchor" لو عدّى نص الحجم. كل chunk بيبدأ بآخر overlap حرف من اللى قبله.
+    """
+    text = re.sub(r"\n{3,}", "\n\n", (text or "").strip())
+    if not text:
+        return []
+
+    units = []
+    for par in re.split(r"\n\s*\n", text):
+        par = par.strip()
+        if par:
+            units.extend(_split_long(par, size) if len(par) > size else [par])
+
+    groups, cur, cur_len = [], [], 0
+    for unit in units:
+        if cur and cur_len + len(unit) > size:
+            groups.append("\n\n".join(cur))
+            cur, cur_len = [], 0
+        cur.append(unit)
+        cur_len += len(unit) + 2
+        if cur_len >= size // 2 and _is_anchor(unit):
+            groups.append("\n\n".join(cur))
+            cur, cur_len = [], 0
+    if cur:
+        groups.append("\n\n".join(cur))
+
+    if overlap <= 0:
+        return groups
+    chunks = [groups[0]]
+    for prev, group in zip(groups, groups[1:]):
+        tail = prev[-overlap:]
+        space = tail.find(" ")
+        if 0 <= space < len(tail) - 1:
+            tail = tail[space + 1:]
+        chunks.append(f"{tail}\n\n{group}")
+    return chunks
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ---- Embedding -----------------------------------------------------------
+
+def _is_retryable(exc):
+    msg = f"{type(exc).__name__} {exc}"
+    return any(tok in msg for tok in _RETRYABLE)
+
+
+def embed_documents(texts, *, retries=6, base_delay=1.0, max_delay=60.0):
+    """batch واحد → list of float32 vectors، مع exponential backoff + jitter."""
+    model = settings.GEMINI_EMBED_MODEL
+    payload = {"requests": [
+        {"model": f"models/{model}", "content": {"parts": [{"text": t}]}, "taskType": EMBED_TASK}
+        for t in texts
+    ]}
+    attempt = 0
+    while True:
+        try:
+            r = get_session().post(
+                gemini_url(model, "batchEmbedContents"),
+                headers={"x-goog-api-key": settings.GOOGLE_API_KEY},
+                json=payload,
+                timeout=(3.05, 60),
+            )
+            r.raise_for_status()
+            return [np.asarray(e["values"], dtype=np.float32) for e in r.json()["embeddings"]]
+        except Exception as e:
+            attempt += 1
+            if attempt > retries or not _is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * (0.5 + random.random())
+            logger.warning("embed batch throttled (%s), retry %s in %.1fs", e, attempt, delay)
+            time.sleep(delay)
+
+
+# ---- Checkpoint ----------------------------------------------------------
+
+class Checkpoint:
+    """
+    {"params": {...}, "done": {file_name: n_chunks}}
+    بيتكتب atomically (tmp + os.replace) بعد كل مصدر؛ فيه المصادر اللى خلصت بس.
+    الـ batches اللى اتكتبت من مصدر وقع فى النص مش متسجلة هنا: الـ run الجاى بيلاقيها
+    بنفس الـ content_hash فى _plan فبتتعد unchanged ومابتتعملهاش embed تانى
+    (وده بيحصل حتى مع --restart).
+    """
+
+    def __init__(self, path, params=None, reset=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {"params": params or {}, "done": {}}
+        if path and os.path.exists(path) and not reset:
+            with open(path, encoding="utf-8") as fh:
+                saved = json.load(fh)
+            # لو إعدادات التقسيم اتغيرت الـ checkpoint القديم مالوش معنى
+            if saved.get("params") == self.data["params"]:
+                self.data = saved
+
+    def is_done(self, file_name):
+        return file_name in self.data["done"]
+
+    def mark_done(self, file_name, n_chunks):
+        with self._lock:
+            self.data["done"][file_name] = n_chunks
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.data, fh)
+        os.replace(tmp, self.path)
+
+
+# ---- Upsert --------------------------------------------------------------
+
+def upsert_chunks(file_name, rows, lesson_id=None, tags=None):
+    """rows: [(chunk_index, text, vector), ...]"""
+    tags = tags or EMPTY_TAGS
+    objs = [
+        Chunk(
+            file_name=file_name,
+            chunk_index=idx,
+            content=text,
+            content_hash=content_hash(text),
+            lesson_id=lesson_id,
+            **tags,
+            embedding_vec=vec.tolist(),
+            embedding_half=vec.tolist(),
+        )
+        for idx, text, vec in rows
+    ]
+    Chunk.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=["file_name", "chunk_index"],
+        update_fields=["content", "content_hash", "lesson", "year", "module", "subject",
+                       "embedding_vec", "embedding_half"],
+    )
+    return len(objs)
+
+
+_RETAG_SQL = """
+    UPDATE rag_ai_chunk c
+    SET subject_id = l.subject_id, module_id = s.module_id, year_id = sem.year_id
+    FROM edu_lesson l
+    JOIN edu_subject s ON s.id = l.subject_id
+    JOIN edu_module m ON m.id = s.module_id
+    JOIN edu_semester sem ON sem.id = m.semester_id
+    WHERE c.lesson_id = l.id
+      AND (c.subject_id IS DISTINCT FROM l.subject_id
+           OR c.module_id IS DISTINCT FROM s.module_id
+           OR c.year_id IS DISTINCT FROM sem.year_id)
+"""
+
+_RETAG_FILTERS = {
+    "lesson": "l.id",
+    "subject": "l.subject_id",
+    "module": "s.module_id",
+    "semester": "m.semester_id",
+}
+
+
+def retag_chunks(by=None, ids=None):
+    """
+    يظبط year / module / subject لـ chunks الدروس من شجرة edu (UPDATE واحد، من غير embed).
+    by: "lesson" / "subject" / "module" / "semester" + ids علشان يحدد؛ None = الكل.
+    بيرجّع عدد الصفوف اللى اتغيرت.
+    """
+    sql, params = _RETAG_SQL, []
+    if by is not None:
+        sql += f" AND {_RETAG_FILTERS[by]} = ANY(%s)"
+        params.append(list(ids or []))
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.rowcount
+
+
+def remove_source(file_name):
+    deleted, _ = Chunk.objects.filter(file_name=file_name).delete()
+    return deleted
+
+
+# ---- Pipeline ------------------------------------------------------------
+
+class IngestStats:
+    def __init__(self):
+        self.sources = 0
+        self.skipped_sources = 0
+        self.failed_sources = 0
+        self.chunks = 0          # اتعملها embed
+        self.reused_chunks = 0   # اتنقلت مكانها، الـ vector اتنسخ
+        self.unchanged_chunks = 0
+        self.removed_chunks = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_sec(self):
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+
+def _plan(file_name, pieces):
+    """
+    بيقارن الـ chunks الجديدة بالمتخزنة:
+    - unchanged: نفس الـ hash فى نفس الـ index
+    - reuse: الـ hash موجود فى index تانى → ننسخ الـ vector
+    - embed: جديد
+    """
+    stored = dict(
+        Chunk.objects.filter(file_name=file_name).values_list("chunk_index", "content_hash")
+    )
+    by_hash = {h: idx for idx, h in stored.items() if h}
+
+    unchanged, reuse, embed = 0, [], []
+    for idx, text in enumerate(pieces):
+        h = content_hash(text)
+        if stored.get(idx) == h:
+            unchanged += 1
+        elif h in by_hash:
+            reuse.append((idx, text, by_hash[h]))
+        else:
+            embed.append((idx, text))
+    return unchanged, reuse, embed
+
+
+def sync_source(source, *, pool, stats, batch_size=64, chunk_size=1200, overlap=200):
+    """
+    يحدّث مصدر واحد: embed للمتغير بس، نسخ vectors للى اتنقل، ومسح الزيادة.
+    بيرجّع عدد الـ chunks فى المصدر بعد التحديث.
+    """
+    pieces = split_text(source.text(), size=chunk_size, overlap=overlap)
+    unchanged, reuse, todo = _plan(source.file_name, pieces)
+    stats.unchanged_chunks += unchanged
+
+    if reuse:
+        vec_by_index = dict(
+            Chunk.objects.filter(
+                file_name=source.file_name, chunk_index__in={old for _, _, old in reuse}
+            ).values_list("chunk_index", "embedding_vec")
+        )
+        rows = [(idx, text, np.asarray(vec_by_index[old], dtype=np.float32)) for idx, text, old in reuse]
+        # الـ vectors اتقرت قبل الكتابة، فمفيش مشكلة لو الـ indexes بتتبدل
+        stats.reused_chunks += upsert_chunks(source.file_name, rows, source.lesson_id, source.tags)
+
+    def run_batch(batch):
+        close_old_connections()
+        try:
+            vectors = embed_documents([text for _, text in batch])
+            rows = [(idx, text, vec) for (idx, text), vec in zip(batch, vectors)]
+            return upsert_chunks(source.file_name, rows, source.lesson_id, source.tags)
+        finally:
+            close_old_connections()
+
+    batch_size = max(1, min(batch_size, MAX_BATCH))
+    futures = [pool.submit(run_batch, todo[i:i + batch_size]) for i in range(0, len(todo), batch_size)]
+    errors = []
+    for fut in as_completed(futures):
+        try:
+            stats.chunks += fut.result()
+        except Exception as e:
+            errors.append(e)
+    if errors:
+        # اللى اتكتب اتكتب بالـ hash بتاعه، فالمحاولة الجاية هتكمل الباقى بس
+        raise errors[0]
+
+    # orphans: الـ chunks اللى بقت زيادة بعد ما المحتوى قصر
+    removed, _ = Chunk.objects.filter(file_name=source.file_name, chunk_index__gte=len(pieces)).delete()
+    stats.removed_chunks += removed
+    # الـ unchanged ما اتكتبوش؛ لو المصدر اتنقل (مادة / سنة) نظبط الـ tags بس
+    Chunk.objects.filter(file_name=source.file_name).exclude(**source.tags).update(**source.tags)
+    return len(pieces)
+
+
+def ingest(sources, *, checkpoint, batch_size=64, concurrency=4, chunk_size=1200, overlap=200,
+           on_progress=None):
+    """
+    بيمشى على المصادر واحد ورا التانى (streaming)، وجوه كل مصدر الـ batches
+    بتتعمل embed بالتوازى (concurrency) وتتكتب أول ما تخلص.
+    """
+    stats = IngestStats()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ingest") as pool:
+        for source in sources:
+            if checkpoint.is_done(source.file_name):
+                stats.skipped_sources += 1
+                continue
+            try:
+                n = sync_source(source, pool=pool, stats=stats, batch_size=batch_size,
+                                chunk_size=chunk_size, overlap=overlap)
+            except Exception as e:
+                logger.error("ingest failed for %s: %s", source.file_name, e)
+                stats.failed_sources += 1
+            else:
+                checkpoint.mark_done(source.file_name, n)
+                stats.sources += 1
+            if on_progress:
+                on_progress(stats)
+
+    return stats
+
+
+# ---- تحديث درس بعد الحفظ --------------------------------------------------
+
+def sync_lesson(lesson_id, **kwargs):
+    """يحدّث chunks الدرس (content + pdf) ويمسح مصدر اتشال (content فاضى / pdf اتمسح)."""
+    lesson = _lessons().filter(id=lesson_id).first()
+    stats = IngestStats()
+    if lesson is None:
+        return stats  # الـ chunks بتتمسح بالـ CASCADE
+
+    with ThreadPoolExecutor(max_workers=max(1, kwargs.pop("concurrency", 2))) as pool:
+        if (lesson.content or "").strip():
+            sync_source(_lesson_content_source(lesson), pool=pool, stats=stats, **kwargs)
+        else:
+            stats.removed_chunks += remove_source(lesson_content_name(lesson.id))
+
+        if lesson.pdf:
+            try:
+                sync_source(_lesson_pdf_source(lesson), pool=pool, stats=stats, **kwargs)
+            except RuntimeError as e:  # مفيش PDF library
+                logger.warning("lesson %s pdf not synced: %s", lesson.id, e)
+        else:
+            stats.removed_chunks += remove_source(lesson_pdf_name(lesson.id))
+    return stats
+
+
+_queue = queue.Queue()
+_pending = set()
+_pending_lock = threading.Lock()
+_worker = None
+_worker_pid = None
+
+
+def _run_queue():
+    while True:
+        lesson_id = _queue.get()
+        with _pending_lock:
+            _pending.discard(lesson_id)
+        close_old_connections()
+        try:
+            stats = sync_lesson(lesson_id)
+            logger.info(
+                "lesson %s synced: %s embedded, %s reused, %s unchanged, %s removed",
+                lesson_id, stats.chunks, stats.reused_chunks, stats.unchanged_chunks, stats.removed_chunks,
+            )
+        except Exception:
+            logger.exception("lesson %s sync failed", lesson_id)
+        finally:
+            close_old_connections()
+            _queue.task_done()
+
+
+def enqueue_lesson(lesson_id):
+    """
+    بيحط الدرس فى طابور الـ worker (thread واحد لكل process).
+    نفس الدرس لو اتحفظ كذا مرة قبل ما يتنفذ بيتعمل مرة واحدة.
+    """
+    global _queue, _worker, _worker_pid
+    with _pending_lock:
+        pid = os.getpid()
+        if _worker_pid != pid:
+            # بعد fork: الطابور والـ thread بتوع الـ parent مش بتوعنا
+            _queue, _worker = queue.Queue(), None
+            _pending.clear()
+        if lesson_id in _pending:
+            return
+        _pending.add(lesson_id)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_queue, name="rag-lesson-sync", daemon=True)
+            _worker.start()
+            _worker_pid = pid
+    _queue.put(lesson_id)
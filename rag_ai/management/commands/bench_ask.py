@@ -0,0 +1,86 @@
+# rag_ai/management/commands/bench_ask.py
+"""
+Load benchmark: نفس السؤال على الـ sync والـ async endpoints وبنقارن.
+
+    python manage.py bench_ask --token <access> --device-id <dev> -n 200 -c 50
+
+شغّل السيرفر مرة بالـ Procfile القديم (gunicorn sync على wsgi) ومرة بالـ
+uvicorn worker (asgi) عشان تشوف الفرق فى throughput و p95 لنفس عدد الـ workers.
+"""
+import asyncio
+import time
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+class Command(BaseCommand):
+    help = "Compare sync vs async AI endpoints under concurrent load."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default=settings.BASE_API_URL)
+        parser.add_argument("--token", required=True, help="JWT access token")
+        parser.add_argument("--device-id", required=True, help="X-Device-Id للمستخدم")
+        parser.add_argument("-n", "--requests", type=int, default=50)
+        parser.add_argument("-c", "--concurrency", type=int, default=20)
+        parser.add_argument("-q", "--question", default="What are the first steps in managing hypovolemic shock?")
+        parser.add_argument(
+            "--paths", default="/v1/ask/simple/,/v1/ask/simple/async/",
+            help="endpoints مفصولة بفاصلة (نسبية لـ base-url)",
+        )
+        parser.add_argument("--timeout", type=float, default=60)
+
+    def handle(self, *args, **opts):
+        paths = [p.strip() for p in opts["paths"].split(",") if p.strip()]
+        for path in paths:
+            stats = asyncio.run(self._run(path, opts))
+            self._report(path, stats)
+
+    async def _run(self, path, opts):
+        url = opts["base_url"].rstrip("/") + path
+        headers = {
+            "Authorization": f"Bearer {opts['token']}",
+            "X-Device-Id": opts["device_id"],
+        }
+        sem = asyncio.Semaphore(opts["concurrency"])
+        latencies, statuses = [], {}
+
+        limits = httpx.Limits(max_connections=opts["concurrency"], max_keepalive_connections=opts["concurrency"])
+        async with httpx.AsyncClient(limits=limits, timeout=opts["timeout"]) as client:
+            async def one():
+                async with sem:
+                    t0 = time.perf_counter()
+                    try:
+                        r = await client.post(url, headers=headers, json={"q": opts["question"]})
+                        code = r.status_code
+                    except httpx.HTTPError as e:
+                        code = type(e).__name__
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    statuses[code] = statuses.get(code, 0) + 1
+
+            t_start = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(opts["requests"])))
+            wall = time.perf_counter() - t_start
+
+        return {"latencies": latencies, "statuses": statuses, "wall": wall, "n": opts["requests"],
+                "concurrency": opts["concurrency"]}
+
+    def _report(self, path, s):
+        lat = s["latencies"]
+        self.stdout.write(self.style.MIGRATE_HEADING(path))
+        self.stdout.write(f"  requests     {s['n']} (concurrency {s['concurrency']})")
+        self.stdout.write(f"  statuses     {s['statuses']}")
+        self.stdout.write(f"  wall         {s['wall']:.2f}s  →  {s['n'] / s['wall']:.2f} req/s")
+        self.stdout.write(
+            f"  latency ms   p50 {_pct(lat, 50):.0f}  p95 {_pct(lat, 95):.0f}  "
+            f"p99 {_pct(lat, 99):.0f}  max {max(lat) if lat else 0:.0f}"
+        )
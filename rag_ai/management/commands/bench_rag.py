@@ -0,0 +1,169 @@
+# rag_ai/management/commands/bench_rag.py
+"""
+End-to-end RAG benchmark جوه الـ process بتوقيت كل مرحلة (rag_ai/timing.py):
+
+    python manage.py bench_rag --stub -c 1,4,16 -n 40
+    python manage.py bench_rag --stub --stub-gen-ms 800 --stub-fail-rate 0.05 --targets api_ask
+    python manage.py bench_rag --targets api_ask,v1,simple --user ahmed      # Gemini الحقيقى
+
+--stub: بيشغّل rag_ai/gemini_stub.py ويوجّه GEMINI_API_BASE ليه (latency ثابتة، فالفرق = الـ overhead بتاعنا).
+v1 / simple بيتنادوا بـ APIRequestFactory كمستخدم --user (simple بيحسب من الـ DailyAIUsage بتاعه).
+كل سؤال بيتزود له رقم (إلا --no-vary) علشان embed_cache / answer_cache ما يخبّوش المراحل.
+--no-vary مع simple بيقيس الـ single-flight (السطر "single-flight: N saved").
+"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from rag_ai import single_flight, timing
+from rag_ai.gemini_stub import start as start_stub
+from rag_ai.management.commands.gemini_stub import add_stub_arguments, stub_config
+from rag_ai.qa import api_ask
+from rag_ai.views import AskApiV1, AskApiV1Simple
+
+STAGES = ("embed", "search", "fetch", "context", "generate", "postprocess")
+TARGETS = ("api_ask", "v1", "simple")
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Drive api_ask / AskApiV1 / AskApiV1Simple at given concurrency levels and report per-stage timings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--targets", default="api_ask", help=f"من {', '.join(TARGETS)} مفصولة بفاصلة")
+        parser.add_argument("-c", "--concurrency", default="1,4,16")
+        parser.add_argument("-n", "--requests", type=int, default=40, help="لكل concurrency")
+        parser.add_argument("-q", "--question", default="What are the first steps in managing hypovolemic shock?")
+        parser.add_argument("--questions", default=None, help="ملف أسئلة (سطر لكل سؤال)")
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--max-chars", type=int, default=4000)
+        parser.add_argument("--user", default=None, help="username للـ v1 / simple")
+        parser.add_argument("--no-vary", action="store_true", help="نفس السؤال بالظبط (الكاش شغال)")
+        parser.add_argument("--stub", action="store_true", help="شغّل gemini_stub محلى واستخدمه")
+        add_stub_arguments(parser, prefix="stub-")
+
+    def handle(self, *args, **opts):
+        targets = [t.strip() for t in opts["targets"].split(",") if t.strip()]
+        unknown = set(targets) - set(TARGETS)
+        if unknown:
+            raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}")
+        levels = [int(c) for c in opts["concurrency"].split(",") if c.strip()]
+
+        self.user = None
+        if {"v1", "simple"} & set(targets):
+            if not opts["user"]:
+                raise CommandError("--user is required for v1 / simple")
+            self.user = get_user_model().objects.filter(username=opts["user"]).first()
+            if self.user is None:
+                raise CommandError(f"User {opts['user']!r} not found")
+
+        questions = [opts["question"]]
+        if opts["questions"]:
+            with open(opts["questions"], encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()] or questions
+        self.questions, self.opts = questions, opts
+        self.factory = APIRequestFactory()
+
+        overrides = {}
+        server = None
+        if opts["stub"]:
+            server, base = start_stub(config=stub_config(opts, prefix="stub-"))
+            overrides = {"GEMINI_API_BASE": base, "GOOGLE_API_KEY": settings.GOOGLE_API_KEY or "stub-key"}
+            self.stdout.write(f"gemini stub: {base}")
+        elif not settings.GOOGLE_API_KEY:
+            raise CommandError("Missing GOOGLE_API_KEY (or use --stub)")
+
+        try:
+            with override_settings(**overrides):
+                for target in targets:
+                    for c in levels:
+                        self._report(target, c, self._run(target, c))
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    # ---- run ----
+
+    def _question(self, i):
+        q = self.questions[i % len(self.questions)]
+        return q if self.opts["no_vary"] else f"{q} (#{i})"
+
+    def _call(self, target, q):
+        opts = self.opts
+        if target == "api_ask":
+            api_ask(q, k=opts["k"], max_chars=opts["max_chars"])
+            return 200
+        view = AskApiV1.as_view() if target == "v1" else AskApiV1Simple.as_view()
+        path = "/api/v1/ask/" if target == "v1" else "/api/v1/ask/simple/"
+        body = {"q": q, "k": opts["k"], "max_chars": opts["max_chars"]} if target == "v1" else {"q": q}
+        request = self.factory.post(path, body, format="json",
+                                    HTTP_X_DEVICE_ID=self.user.active_device_id or "")
+        force_authenticate(request, user=self.user)
+        return view(request).status_code
+
+    def _one(self, target, i):
+        close_old_connections()
+        t0 = time.perf_counter()
+        try:
+            with timing.collect() as stages:
+                status = self._call(target, self._question(i))
+        except Exception as e:
+            status = type(e).__name__
+        finally:
+            close_old_connections()
+        return status, (time.perf_counter() - t0) * 1000, stages
+
+    def _run(self, target, concurrency):
+        n = self.opts["requests"]
+        before = single_flight.stats()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+            results = list(pool.map(lambda i: self._one(target, i), range(n)))
+        after = single_flight.stats()
+        coalesced = {name: after[name] - before[name] for name in single_flight.STAT_NAMES + ("saved",)}
+        return {"results": results, "wall": time.perf_counter() - t0, "n": n, "single_flight": coalesced}
+
+    # ---- report ----
+
+    def _report(self, target, concurrency, run):
+        results = run["results"]
+        statuses = {}
+        for status, _, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        totals = [ms for _, ms, _ in results]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{target}  c={concurrency}  n={run['n']}  {run['n'] / run['wall']:.2f} req/s  statuses={statuses}"
+        ))
+        self.stdout.write(f"  {'total':<12} mean {statistics.mean(totals):8.1f}ms  "
+                          f"p50 {_pct(totals, 50):8.1f}  p95 {_pct(totals, 95):8.1f}")
+        accounted = [0.0] * len(results)
+        for name in STAGES:
+            values = [st.get(name, 0.0) for _, _, st in results]
+            for i, v in enumerate(values):
+                accounted[i] += v
+            if not any(values):
+                continue
+            self.stdout.write(f"  {name:<12} mean {statistics.mean(values):8.1f}ms  "
+                              f"p50 {_pct(values, 50):8.1f}  p95 {_pct(values, 95):8.1f}")
+        other = [max(0.0, t - a) for t, a in zip(totals, accounted)]
+        self.stdout.write(f"  {'other':<12} mean {statistics.mean(other):8.1f}ms  "
+                          f"p50 {_pct(other, 50):8.1f}  p95 {_pct(other, 95):8.1f}")
+        sf = run["single_flight"]
+        if sf["leaders"] or sf["saved"]:
+            self.stdout.write(f"  single-flight: {sf['saved']} saved ({sf['coalesced_local']} local, "
+                              f"{sf['coalesced_shared']} shared), {sf['leaders']} computed, {sf['fallbacks']} fallbacks")
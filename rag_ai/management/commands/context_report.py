@@ -0,0 +1,74 @@
+# rag_ai/management/commands/context_report.py
+"""
+متوسط الـ prompt tokens قبل (build_context بحد الحروف) وبعد (pack_context):
+
+    python manage.py context_report --questions questions.txt -k 10 --max-chars 4000
+    python manage.py context_report --sample 50 --year y3      # متجهات chunks عشوائية
+
+من غير --questions السؤال نفسه فاضى فى الـ prompt (بنقيس الـ context + القالب بس).
+"""
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from rag_ai.context import estimate_tokens, pack_context, token_budget
+from rag_ai.qa import _build_prompt, _parse_vec, build_context, embed_query, search_by_vector, year_scope
+
+
+class Command(BaseCommand):
+    help = "Compare average prompt tokens of the old char-capped context vs the token-budgeted packer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", default=None, help="ملف أسئلة (سطر لكل سؤال)")
+        parser.add_argument("--sample", type=int, default=50)
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--max-chars", type=int, default=4000)
+        parser.add_argument("--year", default=None, help="كود السنة (زى AskApiV1Simple)")
+
+    def handle(self, *args, **opts):
+        scope = None
+        if opts["year"]:
+            scope = year_scope(opts["year"])
+            if scope is None:
+                raise CommandError(f"Year {opts['year']!r} not found")
+
+        queries = self._queries(opts, scope)
+        if not queries:
+            raise CommandError("No sample queries.")
+
+        k, max_chars = opts["k"], opts["max_chars"]
+        before, after, ctx_before, ctx_after = [], [], [], []
+        for question, qv in queries:
+            hits = search_by_vector(qv, k=k, content_chars=max_chars, scope=scope, with_vectors=True)
+            old = build_context(hits, max_chars=max_chars)
+            new = pack_context(hits, qv, max_chars=max_chars)
+            ctx_before.append(estimate_tokens(old))
+            ctx_after.append(estimate_tokens(new))
+            before.append(estimate_tokens(_build_prompt(question, old, "Student", [])))
+            after.append(estimate_tokens(_build_prompt(question, new, "Student", [])))
+
+        mean_b, mean_a = statistics.mean(before), statistics.mean(after)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"queries={len(queries)}  k={k}  max_chars={max_chars}  budget={token_budget(max_chars=max_chars)} tokens"
+        ))
+        self.stdout.write(f"context tokens  before {statistics.mean(ctx_before):8.1f}  after {statistics.mean(ctx_after):8.1f}")
+        self.stdout.write(f"prompt tokens   before {mean_b:8.1f}  after {mean_a:8.1f}")
+        self.stdout.write(self.style.SUCCESS(
+            f"saved {mean_b - mean_a:.1f} tokens / prompt ({(1 - mean_a / mean_b) * 100 if mean_b else 0:.1f}%)"
+        ))
+
+    def _queries(self, opts, scope):
+        if opts["questions"]:
+            with open(opts["questions"], encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()][: opts["sample"]]
+            return [(q, embed_query(q)) for q in questions]
+
+        scope_sql = scope.where() if scope else ""
+        with connection.cursor() as cur:
+            cur.execute(
+                f"SELECT embedding_vec::text FROM rag_ai_chunk WHERE embedding_vec IS NOT NULL{scope_sql} "
+                f"ORDER BY random() LIMIT %s",
+                [opts["sample"]],
+            )
+            return [("", _parse_vec(r[0])) for r in cur.fetchall()]
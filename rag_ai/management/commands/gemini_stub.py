@@ -0,0 +1,58 @@
+# rag_ai/management/commands/gemini_stub.py
+"""
+Gemini stand-in محلى (rag_ai/gemini_stub.py):
+
+    python manage.py gemini_stub --port 8765 --gen-ms 600 --fail-rate 0.02 --fail-status 429
+    GEMINI_API_BASE=http://127.0.0.1:8765 python manage.py runserver
+"""
+from django.core.management.base import BaseCommand
+
+from rag_ai.gemini_stub import StubConfig, make_server
+
+
+def add_stub_arguments(parser, prefix=""):
+    """نفس الـ options بتتضاف لـ bench_rag (--stub-...)."""
+    parser.add_argument(f"--{prefix}embed-ms", type=float, default=30.0)
+    parser.add_argument(f"--{prefix}gen-ms", type=float, default=400.0, help="لحد أول token")
+    parser.add_argument(f"--{prefix}jitter-ms", type=float, default=0.0)
+    parser.add_argument(f"--{prefix}stream-chunks", type=int, default=8)
+    parser.add_argument(f"--{prefix}chunk-ms", type=float, default=40.0)
+    parser.add_argument(f"--{prefix}fail-rate", type=float, default=0.0)
+    parser.add_argument(f"--{prefix}fail-status", type=int, default=503, choices=[429, 500, 503])
+    parser.add_argument(f"--{prefix}hang-rate", type=float, default=0.0)
+    parser.add_argument(f"--{prefix}hang-s", type=float, default=60.0)
+
+
+def stub_config(opts, prefix=""):
+    p = prefix.replace("-", "_")
+    return StubConfig(
+        embed_ms=opts[f"{p}embed_ms"],
+        gen_ms=opts[f"{p}gen_ms"],
+        jitter_ms=opts[f"{p}jitter_ms"],
+        stream_chunks=opts[f"{p}stream_chunks"],
+        chunk_ms=opts[f"{p}chunk_ms"],
+        fail_rate=opts[f"{p}fail_rate"],
+        fail_status=opts[f"{p}fail_status"],
+        hang_rate=opts[f"{p}hang_rate"],
+        hang_s=opts[f"{p}hang_s"],
+    )
+
+
+class Command(BaseCommand):
+    help = "Run a local Gemini REST stand-in (embedContent / generateContent / streaming) with latency and failure injection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        add_stub_arguments(parser)
+
+    def handle(self, *args, **opts):
+        server = make_server(opts["host"], opts["port"], stub_config(opts))
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(f"gemini stub on http://{host}:{port}  (GEMINI_API_BASE)"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
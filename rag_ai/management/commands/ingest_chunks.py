@@ -0,0 +1,114 @@
+# rag_ai/management/commands/ingest_chunks.py
+"""
+    python manage.py ingest_chunks                       # كل الدروس (content + pdf)
+    python manage.py ingest_chunks --lesson-ids 4 9 12
+    python manage.py ingest_chunks --no-lessons --files books/surgery.pdf notes.txt --year y4
+    python manage.py ingest_chunks --retag                # year/module/subject من شجرة edu بس
+    python manage.py ingest_chunks --batch-size 64 --concurrency 4 --restart
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rag_ai import ingest
+
+
+class Command(BaseCommand):
+    help = "Chunk, embed (batched) and upsert lesson text, lesson PDFs and files into rag_ai.Chunk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lesson-ids", type=int, nargs="*", default=None)
+        parser.add_argument("--no-lessons", action="store_true", help="ما تاخدش الدروس خالص")
+        parser.add_argument("--no-content", action="store_true", help="من غير Lesson.content")
+        parser.add_argument("--no-pdf", action="store_true", help="من غير Lesson.pdf")
+        parser.add_argument("--files", nargs="*", default=[], help="ملفات pdf / txt / md")
+        parser.add_argument("--year", default=None, help="كود السنة للملفات (y1..y5)")
+        parser.add_argument("--subject", type=int, default=None,
+                            help="Subject id للملفات (السنة والموديول بييجوا منه)")
+        parser.add_argument("--retag", action="store_true",
+                            help="ظبط year/module/subject لـ chunks الدروس من غير embed")
+        parser.add_argument("--batch-size", type=int, default=64)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--chunk-size", type=int, default=1200)
+        parser.add_argument("--overlap", type=int, default=200)
+        parser.add_argument(
+            "--checkpoint",
+            default=os.path.join(settings.BASE_DIR, ".ingest_checkpoint.json"),
+        )
+        parser.add_argument("--restart", action="store_true", help="تجاهل الـ checkpoint وابدأ من الأول")
+
+    def handle(self, *args, **opts):
+        if opts["retag"]:
+            n = ingest.retag_chunks()
+            self.stdout.write(self.style.SUCCESS(f"retagged {n} chunks"))
+            return
+
+        if not settings.GOOGLE_API_KEY:
+            raise CommandError("Missing GOOGLE_API_KEY")
+        missing = [p for p in opts["files"] if not os.path.isfile(p)]
+        if missing:
+            raise CommandError(f"Files not found: {', '.join(missing)}")
+        file_tags = self._file_tags(opts)
+
+        checkpoint = ingest.Checkpoint(
+            opts["checkpoint"],
+            params={
+                "model": settings.GEMINI_EMBED_MODEL,
+                "chunk_size": opts["chunk_size"],
+                "overlap": opts["overlap"],
+                "chunker": ingest.CHUNKER_VERSION,
+            },
+            reset=opts["restart"],
+        )
+
+        def sources():
+            if not opts["no_lessons"]:
+                yield from ingest.lesson_sources(
+                    opts["lesson_ids"],
+                    include_content=not opts["no_content"],
+                    include_pdf=not opts["no_pdf"],
+                )
+            yield from ingest.file_sources(opts["files"], tags=file_tags)
+
+        def progress(stats):
+            self.stdout.write(
+                f"\r{stats.chunks} chunks  {stats.chunks_per_sec:.1f} chunks/s", ending=""
+            )
+            self.stdout.flush()
+
+        stats = ingest.ingest(
+            sources(),
+            checkpoint=checkpoint,
+            batch_size=opts["batch_size"],
+            concurrency=opts["concurrency"],
+            chunk_size=opts["chunk_size"],
+            overlap=opts["overlap"],
+            on_progress=progress,
+        )
+
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"sources: {stats.sources} ingested, {stats.skipped_sources} already done, "
+            f"{stats.failed_sources} failed"
+        ))
+        self.stdout.write(
+            f"chunks: {stats.chunks} embedded, {stats.reused_chunks} moved (vector reused), "
+            f"{stats.unchanged_chunks} unchanged, {stats.removed_chunks} orphans removed  "
+            f"| {stats.elapsed:.1f}s  {stats.chunks_per_sec:.1f} chunks/s"
+        )
+
+    def _file_tags(self, opts):
+        if opts["subject"]:
+            try:
+                return ingest.subject_tags(opts["subject"])
+            except ValueError as e:
+                raise CommandError(str(e))
+        if opts["year"]:
+            from edu.models import Year
+
+            year_id = Year.objects.filter(code=opts["year"]).values_list("id", flat=True).first()
+            if year_id is None:
+                raise CommandError(f"Year {opts['year']!r} not found")
+            return {"year_id": year_id}
+        return None
@@ -0,0 +1,245 @@
+# rag_ai/management/commands/rag_index.py
+"""
+إدارة الـ ANN index على rag_ai_chunk (embedding_vec، أو embedding_half بـ --column):
+
+    python manage.py rag_index status
+    python manage.py rag_index build --kind hnsw --m 16 --ef-construction 64
+    python manage.py rag_index build --kind ivfflat            # lists من عدد الصفوف
+    python manage.py rag_index build --per-year                # partial index لكل سنة
+    python manage.py rag_index build --year y3
+    python manage.py rag_index drop
+    python manage.py rag_index report --sample 50 -k 10 --values 10,20,40,80,160
+
+halfvec: backfill → build → report → RAG_VECTOR_COLUMN=embedding_half → drop للـ index القديم:
+    python manage.py rag_index backfill --batch-size 1000
+    python manage.py rag_index build --column embedding_half
+    python manage.py rag_index report --column embedding_half
+    python manage.py rag_index drop --column embedding_vec
+
+report: recall@k و latency مقارنة بالبحث الـ exact (من غير index) على عينة
+أسئلة (متجهات chunks عشوائية، أو --questions ملف سؤال فى كل سطر).
+--year: نفس الـ report بس محدود بالسنة (زى AskApiV1Simple).
+الـ truth دايمًا من embedding_vec (float32)، فـ report --column embedding_half بيقيس
+خسارة الـ halfvec نفسها + خسارة الـ ANN.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from rag_ai import index
+from rag_ai.index import COLUMN, TABLE
+
+_KNN_SQL = f"""
+    SELECT id FROM {TABLE}
+    WHERE {{column}} IS NOT NULL{{scope}}
+    ORDER BY {{column}} <=> %s::{{vtype}}
+    LIMIT %s
+"""
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Build / switch / drop the pgvector ANN index and report recall vs latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["status", "build", "drop", "report", "backfill"])
+        parser.add_argument("--column", choices=index.COLUMNS, default=None,
+                            help="الافتراضى RAG_VECTOR_COLUMN")
+        parser.add_argument("--batch-size", type=int, default=1000, help="backfill")
+        parser.add_argument("--kind", choices=index.KINDS, default="hnsw")
+        parser.add_argument("--m", type=int, default=16)
+        parser.add_argument("--ef-construction", type=int, default=64)
+        parser.add_argument("--lists", type=int, default=None, help="ivfflat (الافتراضى من عدد الصفوف)")
+        parser.add_argument("--maintenance-work-mem", default=None, help="مثلاً 1GB للـ build")
+        parser.add_argument("--sample", type=int, default=50)
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--values", default=None,
+                            help="قيم probes (ivfflat) أو ef_search (hnsw) مفصولة بفاصلة")
+        parser.add_argument("--questions", default=None, help="ملف أسئلة (سطر لكل سؤال) بدل متجهات عشوائية")
+        parser.add_argument("--year", default=None, help="كود السنة: build partial index / report محدود")
+        parser.add_argument("--per-year", action="store_true", help="build: partial index لكل سنة")
+
+    def handle(self, *args, **opts):
+        opts["column"] = opts["column"] or index.vector_column()
+        opts["year_id"] = None
+        if opts["year"]:
+            from rag_ai.qa import year_scope
+            scope = year_scope(opts["year"])
+            if scope is None:
+                raise CommandError(f"Year {opts['year']!r} not found")
+            opts["year_id"] = scope.year_id
+        getattr(self, f"_{opts['action']}")(opts)
+
+    # ---- status / build / drop ----
+
+    def _status(self, opts):
+        column = opts["column"]
+        self.stdout.write(f"search column: {index.vector_column()}  (showing {column})")
+        self.stdout.write(f"rows with embeddings: {index.row_count(column=column)}")
+        self.stdout.write(f"suggested ivfflat lists: {index.ivfflat_lists(index.row_count(column=column))}")
+        for year_id, rows in index.rows_per_year(column):
+            self.stdout.write(f"  year_id={year_id if year_id is not None else '-'}: {rows} rows")
+        self.stdout.write(f"iterative scan: {index.iterative_scan() or 'off'}")
+        rows = index.ann_indexes(column)
+        if not rows:
+            self.stdout.write(self.style.WARNING(f"no ANN index on {column} (exact scan)"))
+        for name, method, definition in rows:
+            self.stdout.write(f"{name} [{method}]\n  {definition}")
+        self._sizes()
+
+    def _sizes(self):
+        with connection.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT pg_size_pretty(pg_table_size(%s)), pg_size_pretty(pg_indexes_size(%s)),
+                       avg(pg_column_size({COLUMN})), avg(pg_column_size({index.HALF_COLUMN}))
+                FROM {TABLE}
+                """,
+                [TABLE, TABLE],
+            )
+            table, indexes, vec_bytes, half_bytes = cur.fetchone()
+            cur.execute(
+                """
+                SELECT c.relname, pg_size_pretty(pg_relation_size(c.oid))
+                FROM pg_index x JOIN pg_class c ON c.oid = x.indexrelid
+                JOIN pg_class t ON t.oid = x.indrelid JOIN pg_am am ON am.oid = c.relam
+                WHERE t.relname = %s AND am.amname IN ('hnsw', 'ivfflat')
+                ORDER BY c.relname
+                """,
+                [TABLE],
+            )
+            ann = cur.fetchall()
+        self.stdout.write(f"table {table}  indexes {indexes}  "
+                          f"avg bytes/row: {COLUMN} {vec_bytes or 0:.0f}, {index.HALF_COLUMN} {half_bytes or 0:.0f}")
+        for name, size in ann:
+            self.stdout.write(f"  {name}: {size}")
+
+    def _build(self, opts):
+        kwargs = dict(
+            m=opts["m"], ef_construction=opts["ef_construction"], lists=opts["lists"],
+            maintenance_work_mem=opts["maintenance_work_mem"],
+        )
+        column = opts["column"]
+        t0 = time.perf_counter()
+        if opts["per_year"]:
+            names = index.build_per_year(opts["kind"], column=column, **kwargs)
+            self.stdout.write(self.style.SUCCESS(
+                f"built {', '.join(names) or '-'} ({opts['kind']}) in {time.perf_counter() - t0:.1f}s"
+            ))
+            return
+
+        if opts["kind"] == "ivfflat" and not kwargs["lists"]:
+            kwargs["lists"] = index.ivfflat_lists(index.row_count(opts["year_id"], column))
+        name = index.build(opts["kind"], year_id=opts["year_id"], column=column, **kwargs)
+        params = f"lists={kwargs['lists']}" if opts["kind"] == "ivfflat" else f"m={opts['m']}, ef_construction={opts['ef_construction']}"
+        self.stdout.write(self.style.SUCCESS(
+            f"built {name} ({opts['kind']}, {params}) in {time.perf_counter() - t0:.1f}s"
+        ))
+
+    def _drop(self, opts):
+        names = index.drop(column=opts["column"])
+        self.stdout.write(self.style.SUCCESS(f"dropped: {', '.join(names) or '-'}"))
+
+    def _backfill(self, opts):
+        t0 = time.perf_counter()
+
+        def progress(n):
+            self.stdout.write(f"\r{n} rows", ending="")
+            self.stdout.flush()
+
+        n = index.backfill_half(batch_size=opts["batch_size"], on_progress=progress)
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"{index.HALF_COLUMN}: {n} rows backfilled in {time.perf_counter() - t0:.1f}s"
+        ))
+
+    # ---- report ----
+
+    def _sample_vectors(self, opts):
+        if opts["questions"]:
+            from rag_ai.qa import _to_vec_literal, embed_query
+            with open(opts["questions"], encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()][: opts["sample"]]
+            return [_to_vec_literal(embed_query(q)) for q in questions]
+
+        with connection.cursor() as cur:
+            cur.execute(
+                f"SELECT {COLUMN}::text FROM {TABLE} WHERE {COLUMN} IS NOT NULL{self._scope} "
+                f"ORDER BY random() LIMIT %s",
+                [opts["sample"]],
+            )
+            return [r[0] for r in cur.fetchall()]
+
+    def _sql(self, column):
+        return _KNN_SQL.format(column=column, vtype=index.vector_type(column), scope=self._scope)
+
+    def _exact(self, vec, k, column=COLUMN):
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute("SET LOCAL enable_indexscan = off")
+            cur.execute("SET LOCAL enable_bitmapscan = off")
+            t0 = time.perf_counter()
+            cur.execute(self._sql(column), [vec, k])
+            ids = {r[0] for r in cur.fetchall()}
+        return ids, (time.perf_counter() - t0) * 1000
+
+    def _ann(self, vec, k, column, **params):
+        with connection.cursor() as cur, index.search_params(cur, k=k, filtered=bool(self._scope), **params):
+            t0 = time.perf_counter()
+            cur.execute(self._sql(column), [vec, k])
+            ids = {r[0] for r in cur.fetchall()}
+        return ids, (time.perf_counter() - t0) * 1000
+
+    def _report(self, opts):
+        column = opts["column"]
+        indexes = index.ann_indexes(column)
+        if not indexes:
+            raise CommandError(f"No ANN index on {column}; run `rag_index build --column {column}` first.")
+        method = indexes[0][1]
+        param = "probes" if method == "ivfflat" else "ef_search"
+        default_values = "1,5,10,20,40" if method == "ivfflat" else "10,20,40,80,160"
+        values = [int(v) for v in (opts["values"] or default_values).split(",")]
+
+        k = opts["k"]
+        self._scope = f" AND year_id = {int(opts['year_id'])}" if opts["year_id"] is not None else ""
+        vectors = self._sample_vectors(opts)
+        if not vectors:
+            raise CommandError("No sample queries.")
+
+        exact = [self._exact(v, k) for v in vectors]
+        exact_ms = [ms for _, ms in exact]
+        candidates = index.row_count(opts["year_id"], column)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{indexes[0][0]} [{method}]  queries={len(vectors)}  k={k}  "
+            f"candidates={candidates}/{index.row_count(column=column)}  truth={COLUMN}"
+        ))
+        self.stdout.write(
+            f"{'exact':>14}  recall 1.000  p50 {_pct(exact_ms, 50):7.2f}ms  p95 {_pct(exact_ms, 95):7.2f}ms"
+        )
+        if column != COLUMN:
+            # خسارة الـ halfvec لوحدها (من غير ANN)
+            recalls, lat = [], []
+            for vec, (truth, _) in zip(vectors, exact):
+                ids, ms = self._exact(vec, k, column)
+                recalls.append(len(ids & truth) / max(1, len(truth)))
+                lat.append(ms)
+            self.stdout.write(
+                f"{'exact ' + index.vector_type(column):>14}  recall {statistics.mean(recalls):.3f}  "
+                f"p50 {_pct(lat, 50):7.2f}ms  p95 {_pct(lat, 95):7.2f}ms"
+            )
+
+        for value in values:
+            recalls, lat = [], []
+            for vec, (truth, _) in zip(vectors, exact):
+                ids, ms = self._ann(vec, k, column, **{param: value})
+                recalls.append(len(ids & truth) / max(1, len(truth)))
+                lat.append(ms)
+            self.stdout.write(
+                f"{param}={value:<5}  recall {statistics.mean(recalls):.3f}  "
+                f"p50 {_pct(lat, 50):7.2f}ms  p95 {_pct(lat, 95):7.2f}ms"
+            )
@@ -0,0 +1,129 @@
+# rag_ai/management/commands/rag_mmap.py
+"""
+الـ export بتاع الـ mmap backend (rag_ai/mmap_index.py، RAG_SEARCH_BACKEND=mmap):
+
+    python manage.py rag_mmap build                  # RAG_MMAP_DTYPE (float16)
+    python manage.py rag_mmap build --dtype float32
+    python manage.py rag_mmap status                 # الـ build الحالى + هل فيه chunks أحدث منه
+    python manage.py rag_mmap report --sample 50 -k 10 [--year y3]
+
+build بعد ingest_chunks / تعديلات الدروس (cron مثلاً)؛ الـ workers بيلقطوه لوحدهم
+خلال RAG_MMAP_RELOAD_SECONDS من غير restart.
+report: recall@k و latency للـ mmap مقارنة بالبحث الـ exact على pgvector (embedding_vec).
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from rag_ai import mmap_index
+from rag_ai.index import COLUMN, TABLE
+from rag_ai.qa import SearchScope, _parse_vec, year_scope
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Export embeddings to the memory-mapped in-process index, show its status, or compare it with pgvector."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["build", "status", "report"])
+        parser.add_argument("--dtype", choices=mmap_index.DTYPES, default=None, help="الافتراضى RAG_MMAP_DTYPE")
+        parser.add_argument("--sample", type=int, default=50)
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--year", default=None, help="report محدود بكود السنة")
+
+    def handle(self, *args, **opts):
+        getattr(self, f"_{opts['action']}")(opts)
+
+    def _build(self, opts):
+        t0 = time.perf_counter()
+
+        def progress(i, n):
+            self.stdout.write(f"\r{i}/{n} rows", ending="")
+            self.stdout.flush()
+
+        try:
+            manifest = mmap_index.export(dtype=opts["dtype"], on_progress=progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"{manifest['build']}: {manifest['count']} rows ({manifest['dtype']}) "
+            f"in {time.perf_counter() - t0:.1f}s → {mmap_index.index_dir()}"
+        ))
+
+    def _status(self, opts):
+        self.stdout.write(f"backend: {'mmap' if mmap_index.enabled() else 'pgvector'}  dir: {mmap_index.index_dir()}")
+        manifest = mmap_index.read_manifest()
+        if manifest is None:
+            self.stdout.write(self.style.WARNING("no export yet (rag_mmap build)"))
+            return
+        build = mmap_index.index_dir() / manifest["build"]
+        size = sum(p.stat().st_size for p in build.iterdir()) if build.exists() else 0
+        self.stdout.write(
+            f"{manifest['build']}  built {manifest['built_at']}  rows {manifest['count']}  "
+            f"{manifest['dtype']}  {size / 2**20:.1f} MiB"
+        )
+        for year_id, (start, end) in sorted(manifest["years"].items(), key=lambda kv: int(kv[0])):
+            self.stdout.write(f"  year_id={year_id}: {end - start} rows")
+
+        with connection.cursor() as cur:
+            cur.execute(f"SELECT count(*), coalesce(max(id), 0) FROM {TABLE} WHERE {COLUMN} IS NOT NULL")
+            rows, max_id = cur.fetchone()
+        if rows != manifest["count"] or max_id != manifest["max_id"]:
+            self.stdout.write(self.style.WARNING(
+                f"stale: db has {rows} rows (max id {max_id}) → rag_mmap build"
+            ))
+
+    def _report(self, opts):
+        index = mmap_index.current()
+        if index is None:
+            raise CommandError("No export; run `rag_mmap build` first.")
+        k = opts["k"]
+        scope, scope_sql = None, ""
+        if opts["year"]:
+            scope = year_scope(opts["year"])
+            if scope is None:
+                raise CommandError(f"Year {opts['year']!r} not found")
+            scope_sql = SearchScope(year_id=scope.year_id).where()
+
+        with connection.cursor() as cur:
+            cur.execute(
+                f"SELECT {COLUMN}::text FROM {TABLE} WHERE {COLUMN} IS NOT NULL{scope_sql} "
+                f"ORDER BY random() LIMIT %s",
+                [opts["sample"]],
+            )
+            vectors = [r[0] for r in cur.fetchall()]
+        if not vectors:
+            raise CommandError("No sample queries.")
+
+        pg_ms, mm_ms, recalls = [], [], []
+        for vec in vectors:
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute("SET LOCAL enable_indexscan = off")
+                cur.execute("SET LOCAL enable_bitmapscan = off")
+                t0 = time.perf_counter()
+                cur.execute(
+                    f"SELECT id FROM {TABLE} WHERE {COLUMN} IS NOT NULL{scope_sql} "
+                    f"ORDER BY {COLUMN} <=> %s::vector LIMIT %s",
+                    [vec, k],
+                )
+                truth = {r[0] for r in cur.fetchall()}
+                pg_ms.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            ids = {r[0] for r in index.search(_parse_vec(vec), k=k, scope=scope)}
+            mm_ms.append((time.perf_counter() - t0) * 1000)
+            recalls.append(len(ids & truth) / max(1, len(truth)))
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{index.manifest['build']} ({index.manifest['dtype']})  queries={len(vectors)}  k={k}  truth={COLUMN}"
+        ))
+        self.stdout.write(f"{'pgvector exact':>14}  recall 1.000  p50 {_pct(pg_ms, 50):7.2f}ms  p95 {_pct(pg_ms, 95):7.2f}ms")
+        self.stdout.write(f"{'mmap':>14}  recall {statistics.mean(recalls):.3f}  "
+                          f"p50 {_pct(mm_ms, 50):7.2f}ms  p95 {_pct(mm_ms, 95):7.2f}ms")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:00
+
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_ai', '0003_dailyaiusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(blank=True, db_index=True, default='', max_length=20)),
+                ('version', models.CharField(max_length=40)),
+                ('history_digest', models.CharField(blank=True, default='', max_length=40)),
+                ('question', models.TextField()),
+                ('query_vec', pgvector.django.vector.VectorField(dimensions=768)),
+                ('chunk_ids', models.JSONField(default=list)),
+                ('answer', models.TextField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'version', 'history_digest'], name='rag_ai_answ_scope_7a656a_idx')],
+            },
+        ),
+    ]
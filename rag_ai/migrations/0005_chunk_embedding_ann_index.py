@@ -0,0 +1,24 @@
+# ANN index على embedding_vec (hnsw, cosine).
+# بعد كده التبديل/إعادة البناء من: python manage.py rag_index build --kind ivfflat|hnsw
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY
+
+    dependencies = [
+        ('rag_ai', '0004_answercacheentry'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS rag_ai_chunk_embedding_ann "
+                "ON rag_ai_chunk USING hnsw (embedding_vec vector_cosine_ops) "
+                "WITH (m = 16, ef_construction = 64);"
+            ),
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS rag_ai_chunk_embedding_ann;",
+        ),
+    ]
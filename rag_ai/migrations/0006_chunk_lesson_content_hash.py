@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu', '0018_module_is_ready'),
+        ('rag_ai', '0005_chunk_embedding_ann_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='chunk',
+            name='lesson',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rag_chunks', to='edu.lesson'),
+        ),
+    ]
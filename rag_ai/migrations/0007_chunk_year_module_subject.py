@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu', '0018_module_is_ready'),
+        ('rag_ai', '0006_chunk_lesson_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='module',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.module'),
+        ),
+        migrations.AddField(
+            model_name='chunk',
+            name='subject',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.subject'),
+        ),
+        migrations.AddField(
+            model_name='chunk',
+            name='year',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='edu.year'),
+        ),
+        # backfill للـ chunks اللى ليها lesson (بعد كده ingest / signals بيظبطوها)
+        migrations.RunSQL(
+            sql="""
+                UPDATE rag_ai_chunk c
+                SET subject_id = l.subject_id, module_id = s.module_id, year_id = sem.year_id
+                FROM edu_lesson l
+                JOIN edu_subject s ON s.id = l.subject_id
+                JOIN edu_module m ON m.id = s.module_id
+                JOIN edu_semester sem ON sem.id = m.semester_id
+                WHERE c.lesson_id = l.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
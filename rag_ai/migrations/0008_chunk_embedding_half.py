@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:10
+# بعد الـ migrate: python manage.py rag_index backfill ثم rag_index build --column embedding_half
+
+import pgvector.django.halfvec
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_ai', '0007_chunk_year_module_subject'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='embedding_half',
+            field=pgvector.django.halfvec.HalfVectorField(blank=True, dimensions=768, null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# شيل الأعمدة القديمة من أيام FAISS: embedding (bytea، نسخة تانية من embedding_vec) و faiss_id.
+# - RAG_ARCHIVE_LEGACY_EMBEDDINGS=True: بتتنسخ الأول لـ rag_ai_chunk_legacy_embedding على batches
+#   (كل batch commit لوحده، فمفيش lock طويل).
+# - الـ DROP COLUMN نفسه metadata بس، ومع lock_timeout لو فيه query طويلة ماسكة الجدول
+#   الـ migration بتفشل بدل ما توقف الكتابة وراها (أعد المحاولة).
+# المساحة بترجع للـ OS بعد VACUUM FULL / pg_repack (الصفوف الجديدة من غير الـ bytea على طول).
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH = 1000
+
+
+def archive_legacy(apps, schema_editor):
+    if not getattr(settings, "RAG_ARCHIVE_LEGACY_EMBEDDINGS", False):
+        return
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS rag_ai_chunk_legacy_embedding "
+            "(chunk_id bigint PRIMARY KEY, embedding bytea, faiss_id integer)"
+        )
+        last = 0
+        while True:
+            cur.execute(
+                "SELECT max(id) FROM (SELECT id FROM rag_ai_chunk WHERE id > %s ORDER BY id LIMIT %s) b",
+                [last, BATCH],
+            )
+            upper = cur.fetchone()[0]
+            if upper is None:
+                break
+            cur.execute(
+                """
+                INSERT INTO rag_ai_chunk_legacy_embedding (chunk_id, embedding, faiss_id)
+                SELECT id, embedding, faiss_id FROM rag_ai_chunk
+                WHERE id > %s AND id <= %s AND (embedding IS NOT NULL OR faiss_id IS NOT NULL)
+                ON CONFLICT (chunk_id) DO NOTHING
+                """,
+                [last, upper],
+            )
+            last = upper
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # كل batch بيتعمله commit لوحده
+
+    dependencies = [
+        ('rag_ai', '0008_chunk_embedding_half'),
+    ]
+
+    operations = [
+        migrations.RunPython(archive_legacy, migrations.RunPython.noop),
+        migrations.RunSQL("SET lock_timeout = '5s';", "RESET lock_timeout;"),
+        migrations.RemoveIndex(
+            model_name='chunk',
+            name='rag_ai_chun_faiss_i_6ec77b_idx',
+        ),
+        migrations.RemoveField(
+            model_name='chunk',
+            name='embedding',
+        ),
+        migrations.RemoveField(
+            model_name='chunk',
+            name='faiss_id',
+        ),
+        migrations.RunSQL("RESET lock_timeout;", "SET lock_timeout = '5s';"),
+    ]
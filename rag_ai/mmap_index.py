@@ -0,0 +1,299 @@
+# rag_ai/mmap_index.py
+"""
+Backend بحث جوه الـ process (RAG_SEARCH_BACKEND="mmap") بدل round-trip لـ Postgres
+مع كل سؤال. الحجم بتاعنا (عشرات الآلاف من الـ chunks) يخلّى البحث الـ exact بـ NumPy
+أسرع من الـ ANN على الشبكة، ومن غير خسارة recall.
+
+الملفات فى RAG_MMAP_DIR:
+    current.json               ← manifest: اسم الـ build الحالى + years + files
+    build-<stamp>/vectors.npy  ← (N, 768) float16 / float32، normalized (cosine = dot)
+    build-<stamp>/meta.npy     ← id / file / chunk_index / year / module / subject / مكان النص
+    build-<stamp>/text.bin     ← الـ content كله UTF-8 ورا بعض
+
+- export(): من embedding_vec، مترتب بالسنة فكل سنة slice متصلة (البحث المحدود بسنة
+  مش بيلمس باقى المصفوفة). الـ build بيتكتب فى dir مؤقت وبعدين os.replace للـ
+  manifest، فالقارئ يا يشوف القديم كامل يا الجديد كامل.
+- الـ workers: np.load(mmap_mode="r") → الـ pages من الـ page cache مشتركة بين كل
+  الـ processes (zero-copy). current() بيتنادى فى RagAiConfig.ready() فمع
+  gunicorn --preload الـ mapping بيتعمل قبل الـ fork.
+- hot reload: current() بيبص على الـ manifest كل RAG_MMAP_RELOAD_SECONDS، ولو اتغير
+  بيفتح الـ build الجديد ويبدّل الـ reference (الطلبات الشغالة بتكمل على القديم).
+
+التعديلات على الدروس بتظهر بعد export جديد: python manage.py rag_mmap build
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "current.json"
+DIM = 768
+DTYPES = ("float16", "float32")
+KEEP_BUILDS = 2          # الحالى + اللى قبله (worker لسه ما عملش reload)
+_BLOCK = 16384           # صفوف لكل matmul فى float16 (التحويل لـ float32 بالأجزاء)
+
+META_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("file", "<i4"),         # index فى manifest["files"]
+    ("chunk_index", "<i4"),
+    ("year_id", "<i4"),      # -1 = من غير
+    ("module_id", "<i4"),
+    ("subject_id", "<i4"),
+    ("text_off", "<i8"),
+    ("text_len", "<i4"),
+])
+
+
+def index_dir():
+    return Path(getattr(settings, "RAG_MMAP_DIR", None) or Path(settings.BASE_DIR) / "rag_mmap")
+
+
+def enabled():
+    return getattr(settings, "RAG_SEARCH_BACKEND", "pgvector") == "mmap"
+
+
+def _unit(vec):
+    vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+# --- export --------------------------------------------------------------------
+
+def export(dtype=None, on_progress=None):
+    """يكتب build جديد من embedding_vec ويبدّل الـ manifest عليه. بيرجّع الـ manifest."""
+    from rag_ai.models import Chunk
+
+    dtype = np.dtype(dtype or getattr(settings, "RAG_MMAP_DTYPE", "float16"))
+    if dtype.name not in DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(DTYPES)}")
+
+    qs = Chunk.objects.filter(embedding_vec__isnull=False)
+    n = qs.count()
+    if not n:
+        raise ValueError("No embedded chunks to export")
+
+    root = index_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    name = f"build-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    tmp = root / f".{name}"
+    tmp.mkdir()
+
+    try:
+        vectors = np.lib.format.open_memmap(tmp / "vectors.npy", mode="w+", dtype=dtype, shape=(n, DIM))
+        meta = np.zeros(n, dtype=META_DTYPE)
+        files, file_ids = [], {}
+        rows = (
+            qs.order_by(F("year_id").asc(nulls_last=True), "id")
+            .values_list("id", "file_name", "chunk_index", "year_id", "module_id", "subject_id",
+                         "content", "embedding_vec")
+            .iterator(chunk_size=2000)
+        )
+        i = off = 0
+        with open(tmp / "text.bin", "wb") as text:
+            for cid, file_name, chunk_index, year_id, module_id, subject_id, content, vec in rows:
+                if i >= n:   # صفوف اتضافت بعد الـ count → الـ build الجاى
+                    break
+                if file_name not in file_ids:
+                    file_ids[file_name] = len(files)
+                    files.append(file_name)
+                raw = (content or "").encode("utf-8")
+                text.write(raw)
+                vectors[i] = _unit(vec)
+                meta[i] = (cid, file_ids[file_name], chunk_index, _id(year_id), _id(module_id),
+                           _id(subject_id), off, len(raw))
+                off += len(raw)
+                i += 1
+                if on_progress and i % 5000 == 0:
+                    on_progress(i, n)
+        vectors.flush()
+        del vectors
+        np.save(tmp / "meta.npy", meta[:i])
+
+        manifest = {
+            "build": name,
+            "dtype": dtype.name,
+            "dim": DIM,
+            "count": i,
+            "max_id": int(meta["id"][:i].max()) if i else 0,
+            "text_bytes": off,
+            "years": _year_ranges(meta["year_id"][:i]),
+            "files": files,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        os.replace(tmp, root / name)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    _write_manifest(root, manifest)
+    _cleanup(root, keep=name)
+    return manifest
+
+
+def _id(value):
+    return -1 if value is None else int(value)
+
+
+def _year_ranges(years):
+    """مترتبة بالسنة → {year_id: [start, end)}."""
+    values, starts, counts = np.unique(years, return_index=True, return_counts=True)
+    return {str(int(y)): [int(s), int(s + c)] for y, s, c in zip(values, starts, counts) if y >= 0}
+
+
+def _write_manifest(root, manifest):
+    tmp = root / f".{MANIFEST}.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, root / MANIFEST)
+
+
+def _cleanup(root, keep):
+    builds = sorted((p for p in root.glob("build-*") if p.is_dir()), key=lambda p: p.stat().st_mtime)
+    stale = [p for p in builds if p.name != keep][: max(0, len(builds) - KEEP_BUILDS)]
+    for p in stale:
+        shutil.rmtree(p, ignore_errors=True)   # الـ mappings المفتوحة بتفضل شغالة لحد ما تتقفل
+
+
+def read_manifest():
+    path = index_dir() / MANIFEST
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# --- search --------------------------------------------------------------------
+
+class MmapIndex:
+    def __init__(self, root, manifest):
+        build = Path(root) / manifest["build"]
+        self.manifest = manifest
+        self.count = manifest["count"]
+        self.vectors = np.load(build / "vectors.npy", mmap_mode="r")[: self.count]
+        self.meta = np.load(build / "meta.npy", mmap_mode="r")
+        self.text = np.memmap(build / "text.bin", dtype=np.uint8, mode="r") if manifest["text_bytes"] else None
+        self.files = manifest["files"]
+        self.years = {int(y): tuple(r) for y, r in manifest["years"].items()}
+        # year_id NULL مترتبة فى الآخر (nulls_last)
+        self.untagged = (max((r[1] for r in self.years.values()), default=0), self.count)
+
+    def _scores(self, q, lo, hi):
+        if self.vectors.dtype == np.float32:
+            return self.vectors[lo:hi] @ q
+        out = np.empty(hi - lo, dtype=np.float32)
+        for s in range(lo, hi, _BLOCK):
+            e = min(s + _BLOCK, hi)
+            out[s - lo:e - lo] = self.vectors[s:e].astype(np.float32) @ q
+        return out
+
+    def _content(self, m, content_chars):
+        if self.text is None or not m["text_len"]:
+            return ""
+        off = int(m["text_off"])
+        content = bytes(self.text[off:off + int(m["text_len"])]).decode("utf-8")
+        return content[:content_chars] if content_chars else content
+
+    def search(self, qv, k=5, scope=None, content_chars=None, with_vectors=False):
+        """
+        بيرجّع [(id, file_name, chunk_index, content, distance, vector)] بترتيب الصعود؛
+        distance = 1 - cosine زى <=> بتاع pgvector.
+        """
+        q = _unit(qv)
+        lo, hi = 0, self.count
+        rows = None   # positions لو البحث على أكتر من range (السنة + الـ untagged)
+        if scope is not None and scope.year_id is not None:
+            lo, hi = self.years.get(int(scope.year_id), (0, 0))
+            if getattr(scope, "untagged", False) and self.untagged[0] < self.untagged[1]:
+                ranges = [(lo, hi), self.untagged]
+                rows = np.concatenate([np.arange(a, b) for a, b in ranges])
+
+        if rows is None:
+            scores = self._scores(q, lo, hi)
+        else:
+            scores = np.concatenate([self._scores(q, a, b) for a, b in ranges])
+        cand = None
+        if scope is not None and (scope.module_id is not None or scope.subject_id is not None):
+            meta = self.meta[lo:hi] if rows is None else self.meta[rows]
+            mask = np.ones(len(meta), dtype=bool)
+            for field in ("module_id", "subject_id"):
+                value = getattr(scope, field)
+                if value is not None:
+                    mask &= meta[field] == int(value)
+            cand = np.flatnonzero(mask)
+            scores = scores[cand]
+
+        if not len(scores) or k <= 0:
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        positions = cand[top] if cand is not None else top
+        positions = positions + lo if rows is None else rows[positions]
+
+        out = []
+        for pos, score in zip(positions, scores[top]):
+            m = self.meta[pos]
+            vec = np.asarray(self.vectors[pos], dtype=np.float32) if with_vectors else None
+            out.append((int(m["id"]), self.files[m["file"]], int(m["chunk_index"]),
+                        self._content(m, content_chars), 1.0 - float(score), vec))
+        return out
+
+
+_lock = threading.Lock()
+_state = {"index": None, "key": None, "checked": 0.0}
+
+
+def _reload_seconds():
+    return float(getattr(settings, "RAG_MMAP_RELOAD_SECONDS", 5.0))
+
+
+def current():
+    """الـ index الحالى (أو None لو مفيش export)؛ بيعمل reload لو الـ manifest اتبدّل."""
+    now = time.monotonic()
+    if _state["key"] is not None and now - _state["checked"] < _reload_seconds():
+        return _state["index"]
+
+    with _lock:
+        if _state["key"] is not None and now - _state["checked"] < _reload_seconds():
+            return _state["index"]
+        root = index_dir()
+        try:
+            st = os.stat(root / MANIFEST)
+            key = (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            key = ()
+        if key != _state["key"]:
+            index = None
+            if key:
+                try:
+                    index = MmapIndex(root, read_manifest())
+                    logger.info("rag mmap index loaded: %s (%s rows)", index.manifest["build"], index.count)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.error("rag mmap index not loaded: %s", e)
+                    key = ("error",)   # نجرب تانى بعد RAG_MMAP_RELOAD_SECONDS
+            else:
+                logger.warning("rag mmap index missing in %s, falling back to pgvector", root)
+            _state["index"] = index
+            _state["key"] = key
+        _state["checked"] = now
+        return _state["index"]
+
+
+def search(qv, k=5, scope=None, content_chars=None, with_vectors=False):
+    """None لو مفيش index محمّل (الـ caller يرجع لـ pgvector)."""
+    index = current()
+    if index is None:
+        return None
+    return index.search(qv, k=k, scope=scope, content_chars=content_chars, with_vectors=with_vectors)
@@ -1,21 +1,33 @@
+import uuid
+
 from django.db import models
-from pgvector.django import VectorField
+from pgvector.django import HalfVectorField, VectorField
 from django.conf import settings
 
 class Chunk(models.Model):
     file_name = models.CharField(max_length=255)
     chunk_index = models.IntegerField()
     content = models.TextField()
-    embedding = models.BinaryField()  # هنخزن الـ embedding كـ bytes
-    faiss_id = models.IntegerField(null=True, blank=True, db_index=True)
 
     embedding_vec = VectorField(dimensions=768, null=True, blank=True)
+    # نفس الـ embedding بـ float16 (نص المساحة، والـ index أصغر)؛ البحث عليه لما RAG_VECTOR_COLUMN = "embedding_half"
+    embedding_half = HalfVectorField(dimensions=768, null=True, blank=True)
+
+    # للتحديث الجزئى (rag_ai/ingest.py): الدرس اللى جه منه الـ chunk و sha256 للـ content
+    lesson = models.ForeignKey(
+        "edu.Lesson", on_delete=models.CASCADE, null=True, blank=True, related_name="rag_chunks"
+    )
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+
+    # للبحث المحدود بسنة / موديول / مادة (من شجرة edu، rag_ai/ingest.py: retag_chunks)
+    year = models.ForeignKey("edu.Year", on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    module = models.ForeignKey("edu.Module", on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    subject = models.ForeignKey("edu.Subject", on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
 
     class Meta:
         unique_together = ("file_name", "chunk_index")  # يمنع التكرار
         indexes = [
             models.Index(fields=["file_name", "chunk_index"]),
-            models.Index(fields=["faiss_id"]),
         ]
 
     def __str__(self):
@@ -33,4 +45,55 @@ class DailyAIUsage(models.Model):
     count = models.PositiveIntegerField(default=0)
 
     class Meta:
-        unique_together = ("user", "date")
\ No newline at end of file
+        unique_together = ("user", "date")
+
+
+
+class AnswerCacheEntry(models.Model):
+    """
+    إجابة محفوظة لسؤال اتسأل قبل كده (rag_ai/answer_cache.py).
+    بترجع لما: نفس الـ scope والـ version والـ history_digest،
+    متجه السؤال قريب بما فيه الكفاية، ونفس الـ chunks اللى طلعت من البحث.
+    """
+    scope = models.CharField(max_length=20, blank=True, default="", db_index=True)  # السنة الدراسية
+    version = models.CharField(max_length=40)          # موديل التوليد + موديل الـ embedding + نسخة الـ prompt
+    history_digest = models.CharField(max_length=40, blank=True, default="")
+    question = models.TextField()
+    query_vec = VectorField(dimensions=768)
+    chunk_ids = models.JSONField(default=list)         # sorted
+    answer = models.TextField()                        # اسم الطالب متشال ومتحط مكانه placeholder
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["scope", "version", "history_digest"]),
+        ]
+
+    def __str__(self):
+        return f"[{self.scope or '-'}] {self.question[:60]}"
+
+
+class Conversation(models.Model):
+    """
+    محادثة الطالب مع الـ tutor محفوظة على السيرفر (rag_ai/conversations.py): الكلاينت بيبعت
+    conversation_id + السؤال الجديد بس. الأدوار اللى خرجت من الـ window بتتلخص فى summary.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="ai_conversations")
+    summary = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+class ConversationTurn(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="turns")
+    role = models.CharField(max_length=10)   # user / assistant
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["conversation", "id"]),
+        ]
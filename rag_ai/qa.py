@@ -1,11 +1,18 @@
 # rag_ai/qa.py
 import numpy as np
 from django.conf import settings
-import google.generativeai as genai
 import re
+import json
+from functools import lru_cache
+from typing import NamedTuple
 from django.conf import settings
 from django.db import connection
-from rag_ai.models import Chunk
+from rag_ai import embed_cache, answer_cache, mmap_index, resilience, single_flight
+from rag_ai.resilience import GeminiUnavailable
+from rag_ai.context import pack_context
+from rag_ai.timing import stage
+from rag_ai.index import search_params, vector_column, vector_type
+from edu.models import Year
 
 EMBED_DIM = 768  # لازم يطابق vector(dimensions=768)
 
@@ -16,73 +23,174 @@ def _ensure_float32_row(vec: np.ndarray) -> np.ndarray:
         vec = vec.reshape(1, -1)
     return vec.astype("float32")
 
+def gemini_url(model: str, method: str, version: str = "v1beta") -> str:
+    """
+    REST endpoint لـ Gemini. GEMINI_API_BASE بيتغير للـ stand-in المحلى
+    (python manage.py gemini_stub) فى الـ benchmarks.
+    """
+    base = getattr(settings, "GEMINI_API_BASE", "https://generativelanguage.googleapis.com").rstrip("/")
+    return f"{base}/{version}/models/{model}:{method}"
+
+def _embed_request(text: str, task_type: str = "RETRIEVAL_QUERY"):
+    model = settings.GEMINI_EMBED_MODEL
+    headers = {"x-goog-api-key": settings.GOOGLE_API_KEY}
+    payload = {
+        "model": f"models/{model}",
+        "content": {"parts": [{"text": text}]},
+        "taskType": task_type,
+    }
+    return gemini_url(model, "embedContent"), headers, payload
+
 def embed_query(text: str) -> np.ndarray:
     """
-    يحوّل نص الاستعلام إلى متجه (float32) باستخدام Gemini (نفس الموديل اللي كنت بتستخدمه).
+    يحوّل نص الاستعلام إلى متجه (float32) باستخدام Gemini (embedContent على الـ session المشتركة).
+    الأسئلة المتكررة بتيجى من embed_cache من غير نداء لـ Gemini.
     """
-    genai.configure(api_key=settings.GOOGLE_API_KEY)
     text = (text or "").strip()
     if not text:
         raise ValueError("Empty query")
-    res = genai.embed_content(
-        model=settings.GEMINI_EMBED_MODEL,
-        content=text,
-        task_type="retrieval_query",
-    )
-    vec = np.array(res["embedding"], dtype=np.float32)
-    return _ensure_float32_row(vec)  # (1, EMBED_DIM)
+
+    key = embed_cache.make_key(text)
+    vec = embed_cache.get(key)
+    if vec is None:
+        with stage("embed"), resilience.call("embed") as c:
+            url, headers, payload = _embed_request(text)
+            r = c.post(url, headers=headers, json=payload, hedge=True)
+            c.raise_for_status(r)
+            vec = embed_cache.put(key, np.array(r.json()["embedding"]["values"], dtype=np.float32))
+    return vec.reshape(1, -1)  # (1, EMBED_DIM)
 
 # --- Vector search via pgvector ---------------------------------------------
 
+_VEC_ENCODE = json.JSONEncoder(separators=(",", ":")).encode
+
+@lru_cache(maxsize=1024)
+def _literal_from_bytes(raw: bytes) -> str:
+    row = np.frombuffer(raw, dtype=np.float32).astype(np.float64).round(6)
+    return _VEC_ENCODE(row.tolist())  # encoder بتاع json مكتوب بـ C
+
 def _to_vec_literal(vec: np.ndarray) -> str:
     """
     يحوّل np.ndarray إلى literal مفهوم من pgvector: "[0.1,0.2,...]".
+    متكاش بالـ bytes: السؤال المتكرر (من embed_cache) مش بيتعمله serialize تانى.
     """
-    row = vec.reshape(-1).astype("float32")
-    return "[" + ",".join(f"{float(x):.6f}" for x in row.tolist()) + "]"
+    return _literal_from_bytes(np.ascontiguousarray(vec, dtype=np.float32).reshape(-1).tobytes())
 
-def search_top_k(query_text: str, k: int = 5):
-    """
-    بحث ANN باستخدام pgvector + ivfflat (cosine).
-    بيرجّع: [(distance, Chunk), ...] بترتيب الصعود (أقرب أولاً).
-    """
-    qv = embed_query(query_text)            # (1, EMBED_DIM)
-    vec_lit = _to_vec_literal(qv)           # "[...]"
+class ChunkHit(NamedTuple):
+    """نتيجة بحث خفيفة بدل Chunk كامل؛ vector بيرجع بس مع with_vectors (للـ MMR فى context.py)."""
+    id: int
+    file_name: str
+    chunk_index: int
+    content: str
+    distance: float
+    vector: np.ndarray = None
 
-    # استعلام مباشر على PostgreSQL
-    with connection.cursor() as cur:
-        # probes أعلى = دقة أعلى (وسرعة أبطأ قليلاً). 10 قيمة معقولة كبداية.
-        cur.execute("SET LOCAL ivfflat.probes = %s;", [10])
-
-        cur.execute(
-            """
-            SELECT id, (embedding_vec <=> %s::vector) AS distance
-            FROM rag_ai_chunk
-            WHERE embedding_vec IS NOT NULL
-            ORDER BY embedding_vec <=> %s::vector
-            LIMIT %s
-            """,
-            [vec_lit, vec_lit, k],
-        )
-        rows = cur.fetchall()   # [(id, distance), ...]
-
-    if not rows:
-        return []
 
-    ids_in_order = [r[0] for r in rows]
-    dist_by_id = {r[0]: float(r[1]) for r in rows}
+def _parse_vec(text):
+    # embedding_vec::text / embedding_half::text = "[0.1,0.2,...]" → float32 (parse فى C)
+    return np.array(text[1:-1].split(","), dtype=np.float32) if text else None
 
-    # هات الـ objects مرة واحدة وحافظ على ترتيب الـ ids
-    chunks = {c.id: c for c in Chunk.objects.filter(id__in=ids_in_order)}
-    ordered = [(dist_by_id[_id], chunks[_id]) for _id in ids_in_order if _id in chunks]
-    return ordered
+class SearchScope(NamedTuple):
+    """
+    فلتر البحث على tags الـ chunks (None = من غير فلتر).
+    untagged: الـ chunks اللى year_id بتاعها NULL (قديمة / من غير lesson) بتدخل مع السنة.
+    """
+    year_id: int = None
+    module_id: int = None
+    subject_id: int = None
+    untagged: bool = False
+
+    def where(self):
+        """" AND year_id = N ..." بقيم ثابتة فى الـ SQL علشان الـ partial index (WHERE year_id = N) يتطابق."""
+        parts = [f"{col} = {int(val)}" for col, val in zip(("year_id", "module_id", "subject_id"), self[:3])
+                 if val is not None]
+        if self.untagged and self.year_id is not None:
+            # الـ partial index بتاع السنة مش بيتطابق هنا؛ iterative scan على الـ index العام
+            parts[0] = f"({parts[0]} OR year_id IS NULL)"
+        return "".join(f" AND {p}" for p in parts)
+
+
+def year_scope(code, untagged=None):
+    """
+    SearchScope لسنة الطالب (User.study_year = Year.code)، أو None.
+    untagged: None = RAG_SCOPE_INCLUDE_UNTAGGED.
+    """
+    code = (code or "").strip()
+    if not code:
+        return None
+    year_id = Year.objects.filter(code=code).values_list("id", flat=True).first()
+    if year_id is None:
+        return None
+    if untagged is None:
+        untagged = getattr(settings, "RAG_SCOPE_INCLUDE_UNTAGGED", True)
+    return SearchScope(year_id=year_id, untagged=bool(untagged))
+
+
+def search_by_vector(qv: np.ndarray, k: int = 5, probes: int = None, ef_search: int = None, content_chars: int = None,
+                     scope: SearchScope = None, with_vectors: bool = False):
+    """
+    بحث ANN باستخدام pgvector (hnsw أو ivfflat حسب الـ index الموجود، cosine) بمتجه السؤال
+    (embed_query / aembed_query).
+    probes (ivfflat) / ef_search (hnsw): أعلى = دقة أعلى وأبطأ شوية؛ None = الـ settings.
+    content_chars: لو متحدد الـ content بيرجع مقصوص من الـ DB (مثلاً = max_chars بتاع الـ context).
+    scope: SearchScope (سنة / موديول / مادة)؛ None = كل الـ chunks.
+    with_vectors: ChunkHit.vector بيرجع (عمود الـ vector) علشان الـ MMR.
+    بيرجّع: [(distance, ChunkHit), ...] بترتيب الصعود (أقرب أولاً).
+    """
+    if mmap_index.enabled():
+        # RAG_SEARCH_BACKEND="mmap": exact فى الـ process؛ لو مفيش export بنكمل على pgvector
+        with stage("search"):
+            rows = mmap_index.search(qv, k=k, scope=scope, content_chars=content_chars, with_vectors=with_vectors)
+        if rows is not None:
+            return [(r[4], ChunkHit(*r)) for r in rows]
+
+    vec_lit = _to_vec_literal(qv)           # "[...]"
+    if content_chars:
+        content_sql, params = "left(content, %s)", [int(content_chars), vec_lit, k]
+    else:
+        content_sql, params = "content", [vec_lit, k]
+    scope_sql = scope.where() if scope else ""
+    col, vtype = vector_column(), vector_type()   # embedding_vec / vector أو embedding_half / halfvec
+    vec_sql = f", {col}::text" if with_vectors else ""
+
+    # استعلام واحد: المتجه مبعوت مرة واحدة، الـ distance بتتحسب مرة (ORDER BY بالـ alias
+    # بيستخدم نفس الـ expression فالـ index لسه شغال)، والصفوف نفسها راجعة معاه.
+    with connection.cursor() as cur, search_params(cur, probes=probes, ef_search=ef_search, k=k,
+                                                   filtered=bool(scope_sql)):
+        with stage("search"):
+            cur.execute(
+                f"""
+                SELECT id, file_name, chunk_index, {content_sql}, ({col} <=> %s::{vtype}) AS distance{vec_sql}
+                FROM rag_ai_chunk
+                WHERE {col} IS NOT NULL{scope_sql}
+                ORDER BY distance
+                LIMIT %s
+                """,
+                params,
+            )
+        with stage("fetch"):
+            rows = cur.fetchall()
+
+    with stage("fetch"):
+        return _rows_to_hits(rows, with_vectors, resort=bool(scope_sql))
+
+
+def _rows_to_hits(rows, with_vectors, resort=False):
+    if with_vectors:
+        hits = [ChunkHit(*r[:5], _parse_vec(r[5])) for r in rows]
+    else:
+        hits = [ChunkHit(*r) for r in rows]
+    if resort:
+        hits.sort(key=lambda h: h.distance)  # iterative scan (relaxed_order) ممكن يرجّعها مش مترتبة بالظبط
+    return [(h.distance, h) for h in hits]
 
 # --- Context building & LLM answer ------------------------------------------
 
 def build_context(chunks, max_chars=2500):
     """
-    يستخلص نصوص المقاطع بالحد الأقصى للأحرف.
-    chunks: [(distance, Chunk), ...]
+    يستخلص نصوص المقاطع بالحد الأقصى للأحرف (الطريقة القديمة؛ الـ api بقت بتستخدم
+    context.pack_context، ودى فاضلة للمقارنة فى context_report).
+    chunks: [(distance, ChunkHit), ...]
     """
     ctx = []
     total = 0
@@ -94,18 +202,20 @@ def build_context(chunks, max_chars=2500):
         total += len(seg)
     return "\n\n".join(ctx)
 
-from django.conf import settings
-import requests, re
+# زوّدها مع أى تعديل فى الـ prompt أو الـ post-processing (بتبطّل الإجابات المتكاشة القديمة)
+PROMPT_VERSION = "3"
 
-def answer_with_gemini(question: str, context: str, student_name: str = "Student" , history=None) -> str:
-    if not context or not context.strip():
-        return "No references matched your question. (context is empty)"
-    
+def _build_prompt(question: str, context: str, student_name: str, history) -> str:
     history = history or []
-    
+    # ملخص الأدوار القديمة (rag_ai/conversations.py) بيتحط لوحده قبل الأدوار.
+    # الأدوار كلها بتتكتب: الـ history من الـ body متقصوصة فى views._parse_history،
+    # واللى من conversations.history() محدودة بـ window + compact_every ومفيهاش دور اتلخص
+    summary = "\n".join((t.get("content") or "").strip() for t in history if t.get("role") == "summary").strip()
+    history = [t for t in history if t.get("role") != "summary"]
+
      # نحولها لتكست بسيط
     convo_lines = []
-    for turn in history[-10:]:
+    for turn in history:
         role = turn.get("role", "user").lower()
         if role in ("user", "student"):
             prefix = "Student"
@@ -120,16 +230,10 @@ def answer_with_gemini(question: str, context: str, student_name: str = "Student
     convo_text = "\n".join(convo_lines).strip()
 
     convo_block = f"Conversation so far:\n{convo_text}\n\n" if convo_text else ""
-    
-    
-    model = getattr(settings, "GEMINI_GEN_MODEL", "gemini-1.5-flash")
-    url   = f"https://generativelanguage.googleapis.com/v1/models/{model}:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-        "x-goog-api-key": settings.GOOGLE_API_KEY,
-    }
+    if summary:
+        convo_block = f"Summary of the earlier conversation:\n{summary}\n\n" + convo_block
 
-    prompt = f"""You are a clinical tutor helping a medical student at Zagazig University in Egypt.
+    return f"""You are a clinical tutor helping a medical student at Zagazig University in Egypt.
 
     You MUST rely ONLY on the following excerpts ("Context"). If a detail is not present in the Context, do NOT add it.
     Do NOT include any citations, bracketed references, source IDs, URLs, or a "References" section in your answer.
@@ -155,7 +259,16 @@ def answer_with_gemini(question: str, context: str, student_name: str = "Student
     {context}""".strip()
 
 
-
+def _gen_request(prompt: str, stream: bool = False):
+    model = getattr(settings, "GEMINI_GEN_MODEL", "gemini-1.5-flash")
+    if stream:
+        url = gemini_url(model, "streamGenerateContent", "v1") + "?alt=sse"
+    else:
+        url = gemini_url(model, "generateContent", "v1")
+    headers = {
+        "Content-Type": "application/json",
+        "x-goog-api-key": settings.GOOGLE_API_KEY,
+    }
     payload = {
         "contents": [{"role": "user", "parts": [{"text": prompt}]}],
         "generationConfig": {"temperature": 0.2, "maxOutputTokens": 512},
@@ -167,10 +280,148 @@ def answer_with_gemini(question: str, context: str, student_name: str = "Student
             {"category": "HARM_CATEGORY_CIVIC_INTEGRITY",   "threshold": "BLOCK_NONE"},
         ],
     }
-    
+    return url, headers, payload
+
+
+def _candidate_text(data: dict, sep: str = "\n") -> str:
+    """
+    نص أول candidate. sep بين الـ parts: "\n" للإجابة الكاملة (زى الأول)،
+    و "" لأجزاء الـ stream (الـ delta بيكمّل اللى قبله).
+    """
+    cands = data.get("candidates") or []
+    if not cands:
+        return ""
+    parts = (cands[0].get("content") or {}).get("parts") or []
+    return sep.join(p.get("text", "") for p in parts if isinstance(p, dict) and p.get("text"))
+
+
+# --- Post-processing ---------------------------------------------------------
+
+_REFERENCES_LINE_RE = re.compile(r'(?im)^\s*references\s*:?.*$')
+_BRACKET_RE = re.compile(r'\[[^\]\n]{1,120}\]')
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+_BULLET_RE = re.compile(r'(?m)^\s*[\*\-]\s+')
+_SPACES_RE = re.compile(r'[ \t]+')
+
+
+def _clean_answer(text: str) -> str:
+     # شيل أى سطر بعنوان References
+    text = _REFERENCES_LINE_RE.sub("", text)
+    text = _BRACKET_RE.sub("", text)
+    text = _BOLD_RE.sub(r'\1', text)
+    text = _BULLET_RE.sub('', text)
+    text = _SPACES_RE.sub(" ", text).strip()
+    text = re.sub(r'\n{3,}', "\n\n", text)
+    return text
+
+
+class _IncrementalCleaner:
+    """
+    نفس _clean_answer بس على أجزاء جاية من الـ stream.
+    كل الـ regexes على مستوى السطر، فبنطلع من السطر الحالى الجزء "الآمن" بس:
+    بعد ما نعرف بداية السطر (References؟ bullet؟) ومن غير [ مفتوح أو ** ناقص.
+    """
+    _HEAD_CHARS = 12  # كفاية نعرف بيها "references" أو bullet فى أول السطر
+
+    def __init__(self):
+        self.line = ""           # الجزء اللى لسه ما طلعش من السطر الحالى
+        self.head_done = False
+        self.drop_line = False
+        self.newlines = 0        # newlines مستنية (بتطلع قبل أول كلام بعدها)
+        self.started = False     # طلع كلام قبل كده (علشان الـ strip فى الأول)
+        self.pending_space = False
+
+    def _emit(self, text):
+        text = _BRACKET_RE.sub("", text)
+        text = _BOLD_RE.sub(r"\1", text)
+        text = _SPACES_RE.sub(" ", text)
+        if self.pending_space and not text.startswith(" "):
+            text = " " + text
+        self.pending_space = text.endswith(" ")
+        text = text.rstrip(" ")
+        if not text:
+            return ""
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self.started = True
+            self.newlines = 0
+        out = "\n" * min(self.newlines, 2) + text
+        self.newlines = 0
+        return out
+
+    def _resolve_head(self, final):
+        stripped = self.line.lstrip(" \t")
+        if not final and len(stripped) < self._HEAD_CHARS:
+            return False
+        if _REFERENCES_LINE_RE.match(self.line):
+            self.drop_line = True
+        elif _BULLET_RE.match(self.line):
+            self.line = _BULLET_RE.sub("", self.line, count=1)
+            # الـ regex الأصلى (\s* multiline) بياكل السطور الفاضية اللى قبل الـ bullet
+            self.newlines = min(self.newlines, 1)
+        self.head_done = True
+        return True
+
+    @staticmethod
+    def _safe_cut(line):
+        # آخر مكان مفيهوش [ مفتوح (لسه ممكن يتقفل خلال 120 حرف) ولا ** فردى
+        cut = len(line)
+        open_br = line.rfind("[")
+        if open_br != -1 and "]" not in line[open_br:] and len(line) - open_br <= 121:
+            cut = min(cut, open_br)
+        while True:
+            if line[:cut].count("**") % 2:
+                cut = line[:cut].rfind("**")
+            run = len(line[:cut]) - len(line[:cut].rstrip("*"))
+            if run % 2 == 0:
+                return cut
+            cut -= 1  # * لوحدها فى الآخر ممكن تبقى ** مع الجزء الجاى
+
+    def _flush_line(self, final):
+        if self.drop_line:
+            self.line = ""
+            return ""
+        if not self.head_done and not self._resolve_head(final):
+            return ""
+        if self.drop_line:
+            self.line = ""
+            return ""
+        cut = len(self.line) if final else self._safe_cut(self.line)
+        out, self.line = self.line[:cut], self.line[cut:]
+        return self._emit(out) if out else ""
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        self.line += chunk
+        while "\n" in self.line:
+            head, rest = self.line.split("\n", 1)
+            self.line = head
+            out.append(self._flush_line(final=True))
+            if self.started:
+                self.newlines += 1
+            self.pending_space = False
+            self.line, self.head_done, self.drop_line = rest, False, False
+        out.append(self._flush_line(final=False))
+        return "".join(out)
+
+    def finish(self) -> str:
+        return self._flush_line(final=True)
+
+
+def answer_with_gemini(question: str, context: str, student_name: str = "Student" , history=None) -> str:
+    if not context or not context.strip():
+        return "No references matched your question. (context is empty)"
+
+    url, headers, payload = _gen_request(_build_prompt(question, context, student_name, history))
 
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=30)
+        with stage("generate"), resilience.call("generate") as c:
+            r = c.post(url, headers=headers, json=payload, timeout=30, hedge=True)
+            c.raise_if_unavailable(r)
+    except GeminiUnavailable:
+        raise   # الـ view بيرد برسالة لطيفة ومن غير ما يحسب من الـ quota
     except Exception as e:
         return f"AI call failed: {e}"
 
@@ -181,40 +432,27 @@ def answer_with_gemini(question: str, context: str, student_name: str = "Student
             err = {"raw": r.text}
         return f"AI error {r.status_code}: {err}"
 
-    data = r.json()
-    pf = data.get("promptFeedback") or {}
-    if pf.get("blockReason"):
-        return f"Blocked by safety: {pf.get('blockReason')}"
-
-    text = ""
-    cands = data.get("candidates") or []
-    if cands:
-        parts = (cands[0].get("content") or {}).get("parts") or []
-        text = "\n".join(p.get("text", "") for p in parts if isinstance(p, dict) and p.get("text")).strip()
-
-    if not text:
-        return "I couldn't generate an answer from the provided references."
-
-     # شيل أى سطر بعنوان References
-    text = re.sub(r'(?im)^\s*references\s*:?.*$', "", text)
-    text = re.sub(r'\[[^\]\n]{1,120}\]', "", text)
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-    text = re.sub(r'(?m)^\s*[\*\-]\s+', '', text)
-    text = re.sub(r'[ \t]+', " ", text).strip()
-    text = re.sub(r'\n{3,}', "\n\n", text)
-
-    return text
-
+    with stage("postprocess"):
+        data = r.json()
+        pf = data.get("promptFeedback") or {}
+        if pf.get("blockReason"):
+            return f"Blocked by safety: {pf.get('blockReason')}"
 
+        text = _candidate_text(data).strip()
+        if not text:
+            return "I couldn't generate an answer from the provided references."
 
+        return _clean_answer(text)
 
 
 def ask(question: str, k: int = 15):
     """
     الواجهة الرئيسية: بتجيب أعلى k مقاطع، تبني سياق، وتستدعي Gemini للإجابة.
     """
-    hits = search_top_k(question, k=k)              # [(distance, Chunk), ...]
-    ctx  = build_context(hits, max_chars=5000)
+    qv = embed_query(question)
+    hits = search_by_vector(qv, k=k, content_chars=5000, with_vectors=True)  # [(distance, ChunkHit), ...]
+    with stage("context"):
+        ctx  = pack_context(hits, qv, max_chars=5000)
     ans  = answer_with_gemini(question, ctx)
     sources = [f"{c.file_name}#{c.chunk_index}" for _, c in hits]
     return {"answer": ans, "sources": sources}
@@ -224,18 +462,77 @@ def ask(question: str, k: int = 15):
 
 
 
-def api_ask(question: str, k: int = 15, probes: int = 10, max_chars: int = 5000 ,student_name: str = "student" , history=None):
+def _answer_cache_kwargs(question, hits, student_name, history, cache_scope, query_vec):
+    """kwargs لـ answer_cache.lookup/store، أو None لو الكاش مش مستخدم. query_vec = متجه السؤال اللى اتبحث بيه."""
+    if cache_scope is None or not answer_cache.enabled():
+        return None
+    return {
+        "query_vec": query_vec,
+        "chunk_ids": [c.id for _, c in hits],
+        "scope": cache_scope,
+        "version": answer_cache.current_version(PROMPT_VERSION),
+        "digest": answer_cache.history_digest(history),
+        "student_name": student_name,
+    }
+
+
+def api_ask(question: str, k: int = 15, probes: int = None, max_chars: int = 5000 ,student_name: str = "student" , history=None, cache_scope=None, ef_search: int = None, scope: SearchScope = None):
     """
     واجهة مرتبة للـ API:
     - answer: نص الإجابة
     - sources: ["file.pdf#chunk", ...]
     - hits: تفاصيل النتائج (للـ UI)
+    - cached: الإجابة جت من answer_cache
+    cache_scope: لو مش None بنستخدم answer_cache (مثلاً السنة الدراسية للطالب).
+    scope: SearchScope للبحث (مثلاً year_scope(user.study_year)).
     """
-    # لو search_top_k ما بتاخدش probes عندك، سيبها كده والافتراضي داخلها 10
-    hits = search_top_k(question, k=k)  # [(distance, Chunk)]
-    ctx  = build_context(hits, max_chars=max_chars)
-    ans  = answer_with_gemini(question, ctx ,student_name ,history=history)
+    # embed مرة واحدة: نفس المتجه للبحث والكاش والـ MMR
+    qv = embed_query(question)
+    hits = search_by_vector(qv, k=k, probes=probes, ef_search=ef_search, content_chars=max_chars,
+                            scope=scope, with_vectors=True)  # [(distance, ChunkHit)]
+
+    ans = None
+    cache_kw = _answer_cache_kwargs(question, hits, student_name, history, cache_scope, qv)
+    if cache_kw:
+        ans = answer_cache.lookup(**cache_kw)
 
+    cached = ans is not None
+    if not cached:
+        with stage("context"):
+            ctx = pack_context(hits, qv, max_chars=max_chars)
+        ans = answer_with_gemini(question, ctx ,student_name ,history=history)
+        if cache_kw:
+            answer_cache.store(question, answer=ans, **cache_kw)
+
+    return _api_result(ans, hits, cached)
+
+
+def coalesce_key(question, cache_scope, scope, params):
+    """key الـ single-flight: السؤال + كل اللى بيغيّر الإجابة (من غير اسم الطالب)."""
+    return single_flight.make_key(question, cache_scope, tuple(scope) if scope else None,
+                                  answer_cache.current_version(PROMPT_VERSION), sorted(params.items()))
+
+
+def coalesced_api_ask(question: str, student_name: str = "student", history=None, cache_scope=None,
+                      scope: SearchScope = None, **params):
+    """
+    api_ask مع single-flight (rag_ai/single_flight.py): نفس السؤال بنفس الـ scope شغال فى
+    نفس الوقت → embed + بحث + Gemini مرة واحدة، والإجابة بتتشارك من غير اسم الطالب.
+    لو فيه history مش بنجمّع (كل محادثة إجابتها مختلفة).
+    """
+    if history:
+        return api_ask(question, student_name=student_name, history=history, cache_scope=cache_scope,
+                       scope=scope, **params)
+
+    def compute():
+        data = api_ask(question, student_name=student_name, cache_scope=cache_scope, scope=scope, **params)
+        return {**data, "answer": answer_cache.strip_name(data["answer"], student_name)}
+
+    data = single_flight.run(coalesce_key(question, cache_scope, scope, params), compute)
+    return {**data, "answer": answer_cache.fill_name(data["answer"], student_name)}
+
+
+def _api_result(ans, hits, cached):
     sources = [f"{c.file_name}#{c.chunk_index}" for _, c in hits]
     hits_json = [{
         "id": c.id,
@@ -246,4 +543,110 @@ def api_ask(question: str, k: int = 15, probes: int = 10, max_chars: int = 5000
         "content_preview": (c.content[:300] or "").strip()
     } for d, c in hits]
 
-    return {"answer": ans, "sources": sources, "hits": hits_json}
+    return {"answer": ans, "sources": sources, "hits": hits_json, "cached": cached}
+
+
+# --- Batch (AskApiV1Batch) ----------------------------------------------------
+
+BATCH_EMBED_MAX = 100   # حد Gemini لـ batchEmbedContents
+
+def embed_queries(texts) -> list:
+    """
+    زى embed_query لأسئلة كتير: اللى مش فى embed_cache بيتعمل embed فى batchEmbedContents
+    (نداء واحد لكل BATCH_EMBED_MAX سؤال). بيرجّع [(1, EMBED_DIM)] بنفس الترتيب.
+    """
+    texts = [(t or "").strip() for t in texts]
+    if not all(texts):
+        raise ValueError("Empty query")
+
+    keys = [embed_cache.make_key(t) for t in texts]
+    vecs = {key: embed_cache.get(key) for key in keys}
+    todo = list({key: t for key, t in zip(keys, texts) if vecs[key] is None}.items())
+    model = settings.GEMINI_EMBED_MODEL
+    for start in range(0, len(todo), BATCH_EMBED_MAX):
+        part = todo[start:start + BATCH_EMBED_MAX]
+        payload = {"requests": [
+            {"model": f"models/{model}", "content": {"parts": [{"text": t}]}, "taskType": "RETRIEVAL_QUERY"}
+            for _, t in part
+        ]}
+        with stage("embed"), resilience.call("embed") as c:
+            r = c.post(gemini_url(model, "batchEmbedContents"),
+                       headers={"x-goog-api-key": settings.GOOGLE_API_KEY}, json=payload)
+            c.raise_for_status(r)
+            for (key, _), e in zip(part, r.json()["embeddings"]):
+                vecs[key] = embed_cache.put(key, np.array(e["values"], dtype=np.float32))
+    return [vecs[key].reshape(1, -1) for key in keys]
+
+
+def search_many(vectors, k: int = 5, probes: int = None, ef_search: int = None, content_chars: int = None,
+                scope: SearchScope = None, with_vectors: bool = False):
+    """
+    N بحث فى round-trip واحد: unnest للمتجهات + LATERAL (نفس استعلام search_by_vector
+    لكل متجه، فالـ ANN index شغال لكل واحد). بيرجّع list لكل متجه زى search_by_vector.
+    """
+    if not vectors:
+        return []
+    if mmap_index.enabled() and mmap_index.current() is not None:
+        return [search_by_vector(qv, k=k, content_chars=content_chars, scope=scope, with_vectors=with_vectors)
+                for qv in vectors]
+
+    lits = [_to_vec_literal(qv) for qv in vectors]
+    if content_chars:
+        content_sql, params = "left(c.content, %s)", [lits, int(content_chars), k]
+    else:
+        content_sql, params = "c.content", [lits, k]
+    scope_sql = scope.where() if scope else ""
+    col, vtype = vector_column(), vector_type()
+    vec_sql = f", c.{col}::text" if with_vectors else ""
+
+    with connection.cursor() as cur, search_params(cur, probes=probes, ef_search=ef_search, k=k,
+                                                   filtered=bool(scope_sql)):
+        with stage("search"):
+            cur.execute(
+                f"""
+                SELECT q.ord, h.*
+                FROM unnest(%s::text[]) WITH ORDINALITY AS q(vec, ord)
+                CROSS JOIN LATERAL (
+                    SELECT c.id, c.file_name, c.chunk_index, {content_sql},
+                           (c.{col} <=> q.vec::{vtype}) AS distance{vec_sql}
+                    FROM rag_ai_chunk c
+                    WHERE c.{col} IS NOT NULL{scope_sql}
+                    ORDER BY distance
+                    LIMIT %s
+                ) h
+                ORDER BY q.ord
+                """,
+                params,
+            )
+        with stage("fetch"):
+            rows = cur.fetchall()
+
+    with stage("fetch"):
+        grouped = [[] for _ in vectors]
+        for row in rows:
+            grouped[row[0] - 1].append(row[1:])
+        return [_rows_to_hits(g, with_vectors, resort=True) for g in grouped]
+
+
+def _batch_plan(questions, k: int = 10, max_chars: int = 4000, student_name: str = "student", cache_scope=None,
+               scope: SearchScope = None, probes: int = None, ef_search: int = None):
+    """
+    الجزء الـ sync (فيه DB) من async_qa.abatch_ask:
+    embed فى نداء واحد، البحث فى SQL واحد، والكاش. بيرجّع (cached, jobs):
+    cached = [(index, result)]، jobs = {index: (q, hits, ctx, cache_kw)} محتاجين توليد.
+    """
+    vectors = embed_queries(questions)
+    results = search_many(vectors, k=k, probes=probes, ef_search=ef_search, content_chars=max_chars,
+                          scope=scope, with_vectors=True)
+
+    cached, jobs = [], {}
+    for i, (q, qv, hits) in enumerate(zip(questions, vectors, results)):
+        cache_kw = _answer_cache_kwargs(q, hits, student_name, None, cache_scope, query_vec=qv)
+        ans = answer_cache.lookup(**cache_kw) if cache_kw else None
+        if ans is not None:
+            cached.append((i, _api_result(ans, hits, cached=True)))
+            continue
+        with stage("context"):
+            ctx = pack_context(hits, qv, max_chars=max_chars)
+        jobs[i] = (q, hits, ctx, cache_kw)
+    return cached, jobs
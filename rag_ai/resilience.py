@@ -0,0 +1,456 @@
+# rag_ai/resilience.py
+"""
+طبقة حماية حوالين كل نداءات Gemini، علشان لما Gemini يبطّأ الـ tutor يقع لوحده
+من غير ما ياخد باقى الموقع (المواد / الأسئلة) معاه.
+
+    with resilience.call("generate") as c:            # async: async with resilience.acall(...)
+        r = c.post(url, headers=..., json=..., timeout=30, hedge=True)   # timeout=None → HTTP_POOL_TIMEOUTS
+        c.raise_for_status(r)                         # 429 / 5xx → GeminiUnavailable، 4xx → HTTPError
+
+- bulkhead: أقصى GEMINI_MAX_CONCURRENCY نداء فى نفس الوقت لكل process (الـ sync threads
+  والـ event loops بياخدوا من نفس العدد). اللى مالقاش مكان خلال GEMINI_BULKHEAD_WAIT
+  بياخد GeminiUnavailable.
+- circuit breaker: GEMINI_BREAKER_FAILURES فشل ورا بعض (timeout / connection / 429 / 5xx؛
+  الـ 4xx التانية غلطة فى الطلب ومش بتتحسب)
+  → مفتوح GEMINI_BREAKER_COOLDOWN ثانية (fast-fail برسالة لطيفة)، وبعدها نداء تجريبى
+  واحد (half-open) يقفله أو يفتحه تانى.
+- hedging (GEMINI_HEDGE): لو الرد اتأخر عن p95 بتاع آخر النداءات الناجحة بنبعت نسخة
+  تانية وناخد الأسرع. للنداءات اللى مش streaming بس؛ الـ streams (وقت أول byte) ليها
+  عينة لوحدها ("<kind>_stream") علشان ما توطّيش الـ p95.
+- ميزانية الوقت: web_ai_ask بيبعت X-Request-Budget-Ms، والـ API بيحطها فى budget()؛
+  timeout كل نداء = الأقل من الافتراضى والباقى من الميزانية، ولو الباقى خلص بنوقف فورًا.
+
+stats(): حالة الـ breaker والنداءات الشغالة والـ hedges.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+import httpx
+import numpy as np
+import requests
+from django.conf import settings
+
+from medical_project.http_pool import get_async_client, get_session, host_timeout
+
+BUDGET_HEADER = "X-Request-Budget-Ms"
+FRIENDLY_MESSAGE = "The AI tutor is busy right now. Please try again in a minute."
+_MIN_TIMEOUT = 0.5   # ثوانى؛ أقل من كده مفيش فايدة نبعت
+
+
+class GeminiUnavailable(Exception):
+    """الـ breaker مفتوح / الـ bulkhead مليان / الميزانية خلصت / Gemini مش بيرد."""
+
+    def __init__(self, reason, message=FRIENDLY_MESSAGE):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ---- circuit breaker ---------------------------------------------------------
+
+class CircuitBreaker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.opened = 0      # عدد مرات الفتح
+        self.rejected = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= _setting("GEMINI_BREAKER_COOLDOWN", 30.0):
+            return "half_open"
+        return "open"
+
+    def before(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self.probing:
+                self.probing = True   # نداء تجريبى واحد
+                return
+            self.rejected += 1
+        raise GeminiUnavailable("circuit_open")
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= _setting("GEMINI_BREAKER_FAILURES", 5):
+                if self.opened_at is None or self.probing:
+                    self.opened += 1
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def release_probe(self):
+        """النداء التجريبى خلص من غير نتيجة (مثلاً 4xx)."""
+        with self._lock:
+            self.probing = False
+
+
+breaker = CircuitBreaker()
+
+
+# ---- bulkhead ----------------------------------------------------------------
+
+_slots_lock = threading.Lock()
+
+
+class _Bulkhead:
+    """
+    عدد واحد (GEMINI_MAX_CONCURRENCY) للـ process كله: الـ sync بيستنى على Condition،
+    والـ async على future بيتصحى من release() (حتى لو جه من thread).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters = []   # [(loop, future)] للـ async
+        self.in_flight = {"sync": 0, "async": 0}
+
+    def _take(self, side):
+        if sum(self.in_flight.values()) >= _max_concurrency():
+            return False
+        self.in_flight[side] += 1
+        return True
+
+    def acquire(self, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._take("sync"), timeout)
+
+    async def aacquire(self, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._cond:
+                if self._take("async"):
+                    return True
+                waiter = (loop, loop.create_future())
+                self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter[1], max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                with self._cond:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    return self._take("async")   # آخر فرصة لو فيه مكان فضى فى نفس اللحظة
+
+    def release(self, side):
+        with self._cond:
+            self.in_flight[side] -= 1
+            self._cond.notify()
+            waiters, self._waiters = self._waiters, []
+        # كل الـ async اللى مستنيين بيصحوا ويجربوا تانى (_take تحت الـ lock)
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_wake, fut)
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.in_flight)
+
+
+def _wake(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+def _max_concurrency():
+    return int(_setting("GEMINI_MAX_CONCURRENCY", 8))
+
+
+def _bulkhead_wait():
+    return float(_setting("GEMINI_BULKHEAD_WAIT", 0.5))
+
+
+bulkhead = _Bulkhead()
+
+
+# ---- budget ------------------------------------------------------------------
+
+_deadline = ContextVar("gemini_deadline", default=None)
+
+
+@contextmanager
+def budget(ms):
+    """كل نداءات Gemini جوه الـ block لازم تخلص خلال ms (None = من غير حد)."""
+    token = _deadline.set(time.monotonic() + ms / 1000 if ms else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def request_budget_ms(headers):
+    """من X-Request-Budget-Ms (بحد أقصى AI_REQUEST_BUDGET_MS)، أو AI_REQUEST_BUDGET_MS."""
+    cap = int(_setting("AI_REQUEST_BUDGET_MS", 25000))
+    try:
+        ms = int(headers.get(BUDGET_HEADER) or 0)
+    except (TypeError, ValueError):
+        ms = 0
+    return min(ms, cap) if ms > 0 else cap
+
+
+def _timeout(default, url):
+    default = host_timeout(url) if default is None else default
+    connect, read = default if isinstance(default, (list, tuple)) else (default, default)
+    left = remaining()
+    if left is None:
+        return connect, read
+    if left < _MIN_TIMEOUT:
+        raise GeminiUnavailable("deadline")
+    return min(connect, left), min(read, left)
+
+
+# ---- hedging -----------------------------------------------------------------
+
+_latency_lock = threading.Lock()
+_latencies = {}    # kind → deque(ms)
+_hedge_stats = {"hedged": 0, "hedge_won": 0}
+_hedge_pool = None
+
+
+def _record_latency(kind, ms):
+    with _latency_lock:
+        _latencies.setdefault(kind, deque(maxlen=200)).append(ms)
+
+
+def hedge_delay(kind):
+    """ثوانى قبل النسخة التانية: p95 لآخر النداءات (None لو العينة صغيرة)."""
+    with _latency_lock:
+        values = list(_latencies.get(kind, ()))
+    if len(values) < int(_setting("GEMINI_HEDGE_MIN_SAMPLES", 20)):
+        return None
+    return max(float(np.percentile(values, 95)), float(_setting("GEMINI_HEDGE_MIN_MS", 300))) / 1000
+
+
+def _hedge_executor():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _slots_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=_max_concurrency() * 2, thread_name_prefix="gemini-hedge")
+    return _hedge_pool
+
+
+def _is_failure_status(status):
+    return status == 429 or status >= 500
+
+
+# ---- call --------------------------------------------------------------------
+
+class _Call:
+    def __init__(self, kind):
+        self.kind = kind
+        self.outcome = None   # True / False / None (ما اتسجلش)
+
+    def _done(self, response=None, ms=None, stream=False):
+        if response is not None and _is_failure_status(response.status_code):
+            self.outcome = False
+        elif response is not None and response.status_code < 400:
+            self.outcome = True
+            # الـ stream بيرجع بعد أول byte مش بعد الإجابة كلها → عينة لوحدها
+            _record_latency(f"{self.kind}_stream" if stream else self.kind, ms)
+
+    def raise_if_unavailable(self, response):
+        """429 / 5xx → GeminiUnavailable (اتحسب فشل فى الـ breaker من _done)."""
+        if _is_failure_status(response.status_code):
+            response.close()
+            raise GeminiUnavailable(f"http_{response.status_code}")
+
+    def raise_for_status(self, response):
+        """زى raise_if_unavailable، والـ 4xx التانية HTTPError عادى (غلطة فى الطلب، مش بتتحسب)."""
+        self.raise_if_unavailable(response)
+        response.raise_for_status()
+
+    def post(self, url, *, timeout=None, hedge=False, **kwargs):
+        timeout = _timeout(timeout, url)
+        delay = hedge_delay(self.kind) if hedge and _setting("GEMINI_HEDGE", False) else None
+        left = remaining()
+        if delay is not None and left is not None and delay * 2 > left:
+            delay = None   # مفيش وقت لنسخة تانية
+        t0 = time.perf_counter()
+        try:
+            if delay is None:
+                r = get_session().post(url, timeout=timeout, **kwargs)
+            else:
+                r = self._hedged(url, timeout, delay, kwargs)
+        except requests.RequestException as e:
+            self.outcome = False
+            raise GeminiUnavailable(type(e).__name__) from e
+        self._done(r, (time.perf_counter() - t0) * 1000, stream=kwargs.get("stream", False))
+        return r
+
+    def _hedged(self, url, timeout, delay, kwargs):
+        pool = _hedge_executor()
+        send = lambda: get_session().post(url, timeout=timeout, **kwargs)  # noqa: E731
+        first = pool.submit(send)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        with _latency_lock:
+            _hedge_stats["hedged"] += 1
+        second = pool.submit(send)
+        futures = [first, second]
+        while futures:
+            done, pending = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                futures.remove(fut)
+                if fut.exception() is None and not _is_failure_status(fut.result().status_code):
+                    for other in pending:
+                        other.add_done_callback(_close_response)
+                    if fut is second:
+                        with _latency_lock:
+                            _hedge_stats["hedge_won"] += 1
+                    return fut.result()
+                if not futures:
+                    return fut.result()   # الاتنين فشلوا → نرجّع الأخير (أو نرفع الـ exception)
+                _close_response(fut)
+
+
+def _close_response(fut):
+    if fut.exception() is None:
+        fut.result().close()
+
+
+@contextmanager
+def call(kind="generate"):
+    """breaker + bulkhead حوالين نداء sync (ولو streaming: حوالين الـ iteration كلها)."""
+    breaker.before()
+    if not bulkhead.acquire(_bulkhead_wait()):
+        breaker.release_probe()
+        raise GeminiUnavailable("bulkhead_full")
+    c = _Call(kind)
+    try:
+        yield c
+    except requests.HTTPError:
+        raise   # 4xx من c.raise_for_status: مش فشل لـ Gemini
+    except requests.RequestException as e:
+        # انقطاع فى نص الـ stream
+        c.outcome = False
+        raise GeminiUnavailable(type(e).__name__) from e
+    finally:
+        bulkhead.release("sync")
+        if c.outcome is True:
+            breaker.success()
+        elif c.outcome is False:
+            breaker.failure()
+        else:
+            breaker.release_probe()
+
+
+class _AsyncCall(_Call):
+    def raise_if_unavailable(self, response):
+        # httpx: الرد العادى اتقرا واتقفل، والـ stream بيتقفل بـ aclose() عند اللى فتحه
+        if _is_failure_status(response.status_code):
+            raise GeminiUnavailable(f"http_{response.status_code}")
+
+    async def post(self, url, *, timeout=None, hedge=False, stream=False, **kwargs):
+        """stream=True: زى requests، الـ body بيتقرا بـ aiter_lines() وبعدين await r.aclose()."""
+        connect, read = _timeout(timeout, url)
+        timeout = httpx.Timeout(read, connect=connect)
+        delay = hedge_delay(self.kind) if hedge and _setting("GEMINI_HEDGE", False) else None
+        left = remaining()
+        if delay is not None and left is not None and delay * 2 > left:
+            delay = None
+        client = get_async_client()
+        t0 = time.perf_counter()
+        try:
+            if stream:
+                r = await client.send(client.build_request("POST", url, timeout=timeout, **kwargs), stream=True)
+            elif delay is None:
+                r = await client.post(url, timeout=timeout, **kwargs)
+            else:
+                r = await self._hedged(client, url, timeout, delay, kwargs)
+        except httpx.HTTPError as e:
+            self.outcome = False
+            raise GeminiUnavailable(type(e).__name__) from e
+        self._done(r, (time.perf_counter() - t0) * 1000, stream=stream)
+        return r
+
+    async def _hedged(self, client, url, timeout, delay, kwargs):
+        first = asyncio.ensure_future(client.post(url, timeout=timeout, **kwargs))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        with _latency_lock:
+            _hedge_stats["hedged"] += 1
+        second = asyncio.ensure_future(client.post(url, timeout=timeout, **kwargs))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and not _is_failure_status(task.result().status_code):
+                        if task is second:
+                            with _latency_lock:
+                                _hedge_stats["hedge_won"] += 1
+                        return task.result()
+                    if not pending:
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+@asynccontextmanager
+async def acall(kind="generate"):
+    """نسخة async من call(): نفس الـ bulkhead بس الانتظار من غير ما نقفل الـ event loop."""
+    breaker.before()
+    if not await bulkhead.aacquire(_bulkhead_wait()):
+        breaker.release_probe()
+        raise GeminiUnavailable("bulkhead_full")
+    c = _AsyncCall(kind)
+    try:
+        yield c
+    except httpx.HTTPStatusError:
+        raise
+    except httpx.HTTPError as e:
+        c.outcome = False
+        raise GeminiUnavailable(type(e).__name__) from e
+    finally:
+        bulkhead.release("async")
+        if c.outcome is True:
+            breaker.success()
+        elif c.outcome is False:
+            breaker.failure()
+        else:
+            breaker.release_probe()
+
+
+def stats():
+    with _latency_lock:
+        hedges = dict(_hedge_stats)
+        p95 = {kind: round(float(np.percentile(v, 95)), 1) for kind, v in _latencies.items() if v}
+    in_flight = bulkhead.snapshot()
+    return {
+        "breaker": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "opened": breaker.opened,
+        "rejected": breaker.rejected,
+        "in_flight": in_flight,
+        "max_concurrency": _max_concurrency(),
+        "p95_ms": p95,
+        **hedges,
+    }
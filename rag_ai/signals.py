@@ -0,0 +1,71 @@
+# rag_ai/signals.py
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from edu.models import Lesson, Module, Semester, Subject
+from .ingest import enqueue_lesson, retag_chunks
+
+
+@receiver(pre_save, sender=Lesson)
+def mark_lesson_rag_dirty(sender, instance: Lesson, **kwargs):
+    # بنعلّم الدرس لو الـ content أو الـ pdf اتغيروا بس (تعديل العنوان/الترتيب مالوش دعوة)
+    pdf_name = instance.pdf.name if instance.pdf else ""
+    if not instance.pk:
+        instance._rag_dirty = bool((instance.content or "").strip() or pdf_name)
+        return
+    old = Lesson.objects.filter(pk=instance.pk).values("content", "pdf", "subject_id").first()
+    instance._rag_dirty = (
+        old is None
+        or (old["content"] or "") != (instance.content or "")
+        or (old["pdf"] or "") != (pdf_name or "")
+    )
+    # اتنقل لمادة تانية بس: الـ tags تتظبط من غير embed
+    instance._rag_retag = old is not None and old["subject_id"] != instance.subject_id
+
+
+@receiver(post_save, sender=Lesson)
+def enqueue_lesson_rag_sync(sender, instance: Lesson, **kwargs):
+    retag = getattr(instance, "_rag_retag", False)
+    instance._rag_retag = False
+    if retag:
+        transaction.on_commit(lambda pk=instance.pk: retag_chunks("lesson", [pk]))
+
+    if not getattr(instance, "_rag_dirty", False):
+        return
+    if not getattr(settings, "RAG_SYNC_ON_SAVE", True):
+        return
+    instance._rag_dirty = False
+    transaction.on_commit(lambda pk=instance.pk: enqueue_lesson(pk))
+
+
+# ---- نقل مادة / موديول / ترم: الـ year/module/subject بتوع الـ chunks ----
+
+_PARENT = {
+    Subject: ("module_id", "subject"),
+    Module: ("semester_id", "module"),
+    Semester: ("year_id", "semester"),
+}
+
+
+def _mark_moved(sender, instance, **kwargs):
+    field, _ = _PARENT[sender]
+    if not instance.pk:
+        instance._rag_moved = False
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    instance._rag_moved = old is not None and old != getattr(instance, field)
+
+
+def _retag_moved(sender, instance, **kwargs):
+    if not getattr(instance, "_rag_moved", False):
+        return
+    instance._rag_moved = False
+    _, by = _PARENT[sender]
+    transaction.on_commit(lambda pk=instance.pk: retag_chunks(by, [pk]))
+
+
+for _model in _PARENT:
+    pre_save.connect(_mark_moved, sender=_model, dispatch_uid=f"rag_mark_moved_{_model.__name__}")
+    post_save.connect(_retag_moved, sender=_model, dispatch_uid=f"rag_retag_moved_{_model.__name__}")
@@ -0,0 +1,274 @@
+# rag_ai/single_flight.py
+"""
+Single-flight للأسئلة المتطابقة اللى شغالة فى نفس الوقت (بعد المحاضرة نفس السؤال
+بيتسأل عشرات المرات فى ثوانى): طلب واحد بيحسب والباقى بيستنوا نتيجته.
+
+- جوه الـ worker: dict key → call شغال؛ اللى بييجى بعده بيستنى (threading.Event
+  للـ sync، asyncio.Future للـ async).
+- بين الـ workers (اختيارى، SINGLE_FLIGHT_SHARED_ALIAS): cache.add(lock) — اللى
+  ياخده هو الـ leader ويكتب النتيجة فى result slot لمدة قصيرة؛ الباقى بيعمل poll
+  لحد ما النتيجة تظهر. لو الـ leader وقع (الـ lock راح من غير نتيجة) أو عدّى
+  SINGLE_FLIGHT_WAIT، الـ follower بيحسب بنفسه.
+- stats(): leaders / coalesced_local / coalesced_shared / fallbacks فى الـ worker، و
+  shared_stats() نفس العدادات مجمّعة من كل الـ workers (لو فيه shared cache).
+
+النتيجة لازم تكون picklable (dict) علشان الـ shared cache.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .embed_cache import normalize
+
+STAT_NAMES = ("leaders", "coalesced_local", "coalesced_shared", "fallbacks", "errors")
+
+_lock = threading.Lock()
+_calls = {}        # key → _Call (sync)
+_acalls = {}       # (loop id, key) → asyncio.Future
+_stats = dict.fromkeys(STAT_NAMES, 0)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def enabled():
+    return getattr(settings, "SINGLE_FLIGHT_ENABLED", True)
+
+
+def _wait_seconds():
+    return float(getattr(settings, "SINGLE_FLIGHT_WAIT", 45.0))
+
+
+def _poll_seconds():
+    return float(getattr(settings, "SINGLE_FLIGHT_POLL", 0.05))
+
+
+def _shared_cache():
+    alias = getattr(settings, "SINGLE_FLIGHT_SHARED_ALIAS", "")
+    return caches[alias] if alias else None
+
+
+def make_key(question, *parts):
+    """السؤال بعد normalize + أى حاجة بتغيّر الإجابة (scope، سنة الطالب، k ...)."""
+    raw = json.dumps([normalize(question), *parts], ensure_ascii=False, default=str, separators=(",", ":"))
+    return f"rag:sf:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+    shared = _shared_cache()
+    if shared is not None:
+        try:
+            shared.incr(f"rag:sf:stats:{name}")
+        except ValueError:
+            shared.add(f"rag:sf:stats:{name}", 1, timeout=None)
+        except Exception:
+            pass
+
+
+# ---- بين الـ workers -------------------------------------------------------
+
+_MISSING = object()
+
+
+def _acquire(shared, key):
+    """True لو احنا الـ leader (أو مفيش shared cache)."""
+    if shared is None:
+        return True
+    try:
+        return shared.add(f"{key}:lock", uuid.uuid4().hex, timeout=int(_wait_seconds()) + 5)
+    except Exception:
+        return True
+
+
+def _publish(shared, key, result):
+    if shared is None:
+        return
+    try:
+        shared.set(f"{key}:result", result, timeout=int(getattr(settings, "SINGLE_FLIGHT_RESULT_TTL", 10)))
+    except Exception:
+        pass
+
+
+def _release(shared, key):
+    if shared is None:
+        return
+    try:
+        shared.delete(f"{key}:lock")
+    except Exception:
+        pass
+
+
+def _peek(shared, key):
+    """(result | _MISSING, الـ lock لسه موجود)."""
+    try:
+        values = shared.get_many([f"{key}:result", f"{key}:lock"])
+    except Exception:
+        return _MISSING, False
+    return values.get(f"{key}:result", _MISSING), f"{key}:lock" in values
+
+
+def _wait_shared(shared, key):
+    deadline = time.monotonic() + _wait_seconds()
+    while time.monotonic() < deadline:
+        result, locked = _peek(shared, key)
+        if result is not _MISSING:
+            return result
+        if not locked:
+            break
+        time.sleep(_poll_seconds())
+    return _MISSING
+
+
+async def _await_shared(shared, key):
+    from asgiref.sync import sync_to_async
+
+    deadline = time.monotonic() + _wait_seconds()
+    while time.monotonic() < deadline:
+        result, locked = await sync_to_async(_peek)(shared, key)
+        if result is not _MISSING:
+            return result
+        if not locked:
+            break
+        await asyncio.sleep(_poll_seconds())
+    return _MISSING
+
+
+def _lead(shared, key, fn):
+    """بيحسب كـ leader بين الـ workers (أو بيستنى leader تانى)."""
+    if not _acquire(shared, key):
+        result = _wait_shared(shared, key)
+        if result is not _MISSING:
+            _count("coalesced_shared")
+            return result
+        _count("fallbacks")
+        return fn()
+
+    _count("leaders")
+    try:
+        result = fn()
+    except Exception:
+        _count("errors")
+        _release(shared, key)   # الـ followers فى الـ workers التانية يحسبوا بنفسهم
+        raise
+    _publish(shared, key, result)
+    _release(shared, key)
+    return result
+
+
+# ---- API -------------------------------------------------------------------
+
+def run(key, fn):
+    """fn() مرة واحدة لكل الطلبات المتطابقة الشغالة؛ كلهم بياخدوا نفس النتيجة (أو نفس الـ exception محليًا)."""
+    if not enabled():
+        return fn()
+
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        if call.done.wait(_wait_seconds()):
+            _count("coalesced_local")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        _count("fallbacks")
+        return fn()
+
+    shared = _shared_cache()
+    try:
+        call.result = _lead(shared, key, fn)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+async def arun(key, afn):
+    """نسخة async من run(): afn() coroutine function؛ الانتظار جوه الـ worker على asyncio.Future."""
+    from asgiref.sync import sync_to_async
+
+    if not enabled():
+        return await afn()
+
+    loop = asyncio.get_running_loop()
+    slot = (id(loop), key)
+    fut = _acalls.get(slot)
+    if fut is not None:
+        try:
+            result = await asyncio.wait_for(asyncio.shield(fut), _wait_seconds())
+        except asyncio.TimeoutError:
+            await sync_to_async(_count)("fallbacks")
+            return await afn()
+        await sync_to_async(_count)("coalesced_local")
+        return result
+
+    fut = _acalls[slot] = loop.create_future()
+    shared = _shared_cache()
+    try:
+        if not await sync_to_async(_acquire)(shared, key):
+            result = await _await_shared(shared, key)
+            if result is not _MISSING:
+                await sync_to_async(_count)("coalesced_shared")
+            else:
+                await sync_to_async(_count)("fallbacks")
+                result = await afn()
+        else:
+            await sync_to_async(_count)("leaders")
+            try:
+                result = await afn()
+            except Exception:
+                await sync_to_async(_count)("errors")
+                await sync_to_async(_release)(shared, key)
+                raise
+            await sync_to_async(_publish)(shared, key, result)
+            await sync_to_async(_release)(shared, key)
+        fut.set_result(result)
+        return result
+    except BaseException as e:
+        if not fut.done():
+            fut.set_exception(e if isinstance(e, Exception) else RuntimeError("single-flight leader cancelled"))
+            fut.exception()   # ما يطلعش "exception was never retrieved" لو مفيش حد مستنى
+        raise
+    finally:
+        _acalls.pop(slot, None)
+
+
+def stats():
+    with _lock:
+        data = dict(_stats)
+        data["in_flight"] = len(_calls) + len(_acalls)
+    data["saved"] = data["coalesced_local"] + data["coalesced_shared"]
+    return data
+
+
+def shared_stats():
+    """العدادات من كل الـ workers (None لو مفيش SINGLE_FLIGHT_SHARED_ALIAS)."""
+    shared = _shared_cache()
+    if shared is None:
+        return None
+    try:
+        values = shared.get_many([f"rag:sf:stats:{n}" for n in STAT_NAMES])
+    except Exception:
+        return None
+    data = {n: int(values.get(f"rag:sf:stats:{n}", 0)) for n in STAT_NAMES}
+    data["saved"] = data["coalesced_local"] + data["coalesced_shared"]
+    return data
@@ -1,3 +1,339 @@
-from django.test import TestCase
+import asyncio
+import os
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from rag_ai import answer_cache, conversations, embed_cache, resilience, single_flight, tracing, utils
+from rag_ai.models import DailyAIUsage
+from rag_ai.qa import _build_prompt, _candidate_text
+
+
+@override_settings(RAG_CONVERSATION_WINDOW=10, RAG_CONVERSATION_COMPACT_EVERY=6)
+class ConversationPromptTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="student", password="x")
+        self.conv = conversations.get(self.user)
+
+    def test_turns_past_window_reach_prompt_until_compacted(self):
+        # 7 أسئلة = 14 دور: أكتر من الـ window وأقل من حد الـ compaction
+        for i in range(7):
+            conversations.append(self.conv, f"question number {i}", f"answer number {i}")
+
+        history = conversations.history(self.conv)
+        self.assertEqual(len(history), 14)
+
+        prompt = _build_prompt("new question", "ctx", "Ali", history)
+        for i in range(7):
+            self.assertIn(f"Student: question number {i}", prompt)
+            self.assertIn(f"Tutor: answer number {i}", prompt)
+
+    def test_summary_goes_before_turns(self):
+        self.conv.summary = "talked about shock"
+        self.conv.save(update_fields=["summary"])
+        conversations.append(self.conv, "what is sepsis", "an infection response")
+
+        prompt = _build_prompt("new question", "ctx", "Ali", conversations.history(self.conv))
+        self.assertIn("Summary of the earlier conversation:\ntalked about shock", prompt)
+        self.assertLess(prompt.index("talked about shock"), prompt.index("Student: what is sepsis"))
+
+
+class CandidateTextTests(SimpleTestCase):
+    data = {"candidates": [{"content": {"parts": [{"text": "First part."}, {"text": "Second part."}, {}]}}]}
+
+    def test_whole_answer_parts_on_separate_lines(self):
+        self.assertEqual(_candidate_text(self.data), "First part.\nSecond part.")
+
+    def test_stream_delta_parts_joined_as_is(self):
+        self.assertEqual(_candidate_text(self.data, sep=""), "First part.Second part.")
+
+    def test_no_candidates(self):
+        self.assertEqual(_candidate_text({}), "")
+
+
+class PrometheusPoolMetricsTests(SimpleTestCase):
+    def test_pool_counters_per_worker(self):
+        snaps = [
+            {"hist": [], "requests": [], "pool": {"pid": 11, "requests": 10, "new_connections": 2,
+                                                  "reused_connections": 8, "tls_handshakes": 2, "reuse_ratio": 0.8}},
+            {"hist": [], "requests": [], "pool": {"pid": 12, "requests": 4, "new_connections": 4,
+                                                  "reused_connections": 0, "tls_handshakes": 4, "reuse_ratio": 0.0}},
+        ]
+        text = tracing.render_prometheus(snaps)
+        self.assertIn("# TYPE http_pool_requests_total counter", text)
+        self.assertIn('http_pool_requests_total{pid="11"} 10', text)
+        self.assertIn('http_pool_reused_connections_total{pid="11"} 8', text)
+        self.assertIn('http_pool_tls_handshakes_total{pid="12"} 4', text)
+        self.assertIn('http_pool_reuse_ratio{pid="12"} 0.0', text)
+
+    def test_snapshot_carries_pool_stats(self):
+        self.assertEqual(tracing.snapshot()["pool"]["pid"], os.getpid())
+
+
+class QuotaCacheTierTests(SimpleTestCase):
+    @override_settings(
+        AI_QUOTA_CACHE_ALIAS="quota",
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "quota": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "quota"}},
+    )
+    def test_non_atomic_backend_falls_back_to_db(self):
+        with self.assertLogs("rag_ai.utils", "WARNING"):
+            utils._rejected.discard("quota")
+            self.assertIsNone(utils._quota_cache())
+
+    def test_reconcile_raises_reseeded_key_to_db_count(self):
+        cache = LocMemCache("quota-test", {})
+        day = date(2026, 1, 1)
+        cache.set(utils._key(1, day), 3)    # seed بعد eviction ناقص deltas worker تانى
+        cache.set(utils._key(2, day), 9)    # أعلى من الـ DB (deltas لسه ما اتعملهاش flush) → يفضل
+        with mock.patch.object(utils, "_quota_cache", return_value=cache):
+            utils._reconcile({(1, day): 7, (2, day): 5})
+        self.assertEqual(cache.get(utils._key(1, day)), 7)
+        self.assertEqual(cache.get(utils._key(2, day)), 9)
+
+
+
+@override_settings(AI_QUOTA_CACHE_ALIAS="")
+class QuotaReserveTests(TransactionTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="student", password="x")
+        patcher = mock.patch.object(utils, "ai_limit", return_value=3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_reserve_stops_at_limit(self):
+        day = date(2026, 1, 1)
+        results = []
+        start = threading.Barrier(8)
+
+        def reserve():
+            try:
+                start.wait()
+                results.append(utils.reserve_ai(self.user, day=day)[0])
+            finally:
+                connection.close()   # كل thread ليه connection
+
+        threads = [threading.Thread(target=reserve) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(DailyAIUsage.objects.get(user=self.user, date=day).count, 3)
+        self.assertEqual(utils.reserve_ai(self.user, day=day), (False, 3, 3))
+
+    def test_refund_after_midnight_goes_to_reservation_day(self):
+        day = date(2026, 1, 1)
+        self.assertTrue(utils.reserve_ai(self.user, day=day)[0])
+        utils.reserve_ai(self.user, day=day + timedelta(days=1))
+
+        with mock.patch.object(utils, "date") as fake_date:
+            fake_date.today.return_value = day + timedelta(days=1)
+            self.assertEqual(utils.refund_ai(self.user, day=day), 0)
+
+        counts = dict(DailyAIUsage.objects.filter(user=self.user).values_list("date", "count"))
+        self.assertEqual(counts, {day: 0, day + timedelta(days=1): 1})
+
+    def test_refund_never_goes_negative(self):
+        day = date(2026, 1, 1)
+        utils.reserve_ai(self.user, day=day)
+        self.assertEqual(utils.refund_ai(self.user, n=5, day=day), 0)
+
+
+@override_settings(GEMINI_MAX_CONCURRENCY=2)
+class BulkheadTests(SimpleTestCase):
+    def test_sync_and_async_share_one_budget(self):
+        bulkhead = resilience._Bulkhead()
+        self.assertTrue(bulkhead.acquire(0.1))
+
+        async def main():
+            self.assertTrue(await bulkhead.aacquire(0.1))
+            self.assertFalse(await bulkhead.aacquire(0.05))
+            self.assertFalse(bulkhead.acquire(0.05))
+            # release من thread تانى بيصحّى الـ async اللى مستنى
+            threading.Timer(0.05, bulkhead.release, args=("sync",)).start()
+            self.assertTrue(await bulkhead.aacquire(1))
+
+        asyncio.run(main())
+        self.assertEqual(bulkhead.snapshot(), {"sync": 0, "async": 2})
+
+    def test_stream_latency_kept_out_of_hedge_window(self):
+        with mock.patch.dict(resilience._latencies, clear=True):
+            resilience._Call("generate")._done(mock.Mock(status_code=200), 40.0, stream=True)
+            resilience._Call("generate")._done(mock.Mock(status_code=200), 900.0)
+            self.assertEqual(list(resilience._latencies["generate_stream"]), [40.0])
+            self.assertEqual(list(resilience._latencies["generate"]), [900.0])
+
+
+class AnswerCacheNameTests(SimpleTestCase):
+    def test_strip_name_whole_word_only(self):
+        answer = "Ali, the alimentary canal starts at the mouth. Good question Ali!"
+        self.assertEqual(
+            answer_cache.strip_name(answer, "Ali"),
+            "⟨student⟩, the alimentary canal starts at the mouth. Good question ⟨student⟩!",
+        )
+        self.assertEqual(answer_cache.strip_name("Alimentary tract", "Ali"), "Alimentary tract")
+
+    def test_short_name_left_alone(self):
+        self.assertEqual(answer_cache.strip_name("A is for artery", "A"), "A is for artery")
+
+    def test_fill_name_round_trip(self):
+        stored = answer_cache.strip_name("Hi Ali, see the alimentary notes.", "Ali")
+        self.assertEqual(answer_cache.fill_name(stored, "Mona"), "Hi Mona, see the alimentary notes.")
+        self.assertEqual(answer_cache.fill_name(stored, ""), "Hi Student, see the alimentary notes.")
+
+
+class AnswerCacheLookupTests(TestCase):
+    vec = np.eye(768, dtype=np.float32)[0]
+
+    def setUp(self):
+        answer_cache.store("what is the aorta", self.vec, [3, 1, 2], answer="Ali, the aorta is an artery.",
+                           scope="y1", version="v1", digest="", student_name="Ali")
+
+    def lookup(self, vec=None, chunk_ids=(1, 2, 3), **kwargs):
+        opts = dict(scope="y1", version="v1", digest="", student_name="Mona")
+        opts.update(kwargs)
+        return answer_cache.lookup(self.vec if vec is None else vec, list(chunk_ids), **opts)
+
+    def test_hit_fills_new_student_name(self):
+        self.assertEqual(self.lookup(chunk_ids=(3, 2, 1)), "Mona, the aorta is an artery.")
+
+    def test_mismatches_miss(self):
+        self.assertIsNone(self.lookup(scope="y2"))
+        self.assertIsNone(self.lookup(version="v2"))
+        self.assertIsNone(self.lookup(digest="abc"))
+        self.assertIsNone(self.lookup(digest=None))
+        self.assertIsNone(self.lookup(chunk_ids=(1, 2)))
+        self.assertIsNone(self.lookup(chunk_ids=(1, 2, 4)))
+
+    def test_far_vector_misses(self):
+        self.assertIsNone(self.lookup(vec=np.eye(768, dtype=np.float32)[1]))
+
+    def test_errors_are_not_stored(self):
+        self.assertIsNone(answer_cache.store("q", self.vec, [1], answer="AI call failed: timeout",
+                                             scope="y1", version="v1", digest="", student_name="Ali"))
+
+
+@override_settings(EMBED_CACHE_SIZE=2, EMBED_CACHE_SHARED_ALIAS="", GEMINI_EMBED_MODEL="embed-a")
+class EmbedCacheTests(SimpleTestCase):
+    def setUp(self):
+        embed_cache.clear()
+        self.addCleanup(embed_cache.clear)
+
+    def test_same_question_same_key(self):
+        self.assertEqual(embed_cache.make_key("What is  the AORTA? "), embed_cache.make_key("what is the aorta?"))
+        self.assertNotEqual(embed_cache.make_key("aorta"), embed_cache.make_key("aorta", model="embed-b"))
+
+    def test_lru_evicts_oldest_and_counts(self):
+        before = embed_cache.stats()
+        for text in ("a", "b"):
+            embed_cache.put(embed_cache.make_key(text), np.ones(3))
+        self.assertIsNotNone(embed_cache.get(embed_cache.make_key("a")))   # a بقى الأحدث
+        embed_cache.put(embed_cache.make_key("c"), np.ones(3))
+
+        self.assertIsNone(embed_cache.get(embed_cache.make_key("b")))
+        vec = embed_cache.get(embed_cache.make_key("a"))
+        self.assertEqual(vec.dtype, np.float32)
+        self.assertFalse(vec.flags.writeable)
+
+        after = embed_cache.stats()
+        self.assertEqual(after["hits_local"] - before["hits_local"], 2)
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["evictions"] - before["evictions"], 1)
+        self.assertEqual(after["size"], 2)
+
+    @override_settings(EMBED_CACHE_TTL=-1)
+    def test_expired_entry_misses(self):
+        embed_cache.put(embed_cache.make_key("a"), np.ones(3))
+        self.assertIsNone(embed_cache.get(embed_cache.make_key("a")))
+
+
+@override_settings(SINGLE_FLIGHT_ENABLED=True, SINGLE_FLIGHT_SHARED_ALIAS="", SINGLE_FLIGHT_WAIT=5)
+class SingleFlightTests(SimpleTestCase):
+    def _race(self, leader_fn):
+        """leader بيستنى لحد ما الـ follower يدخل؛ بيرجّع (نتيجة/exception الـ follower، عدد نداءات الـ follower)."""
+        release = threading.Event()
+        follower_calls = []
+        out = {}
+
+        def slow_leader():
+            release.wait(5)
+            return leader_fn()
+
+        def own():
+            follower_calls.append(1)
+            return "own"
+
+        def run(fn, slot):
+            try:
+                out[slot] = single_flight.run("k", fn)
+            except Exception as e:
+                out[slot] = e
+
+        t1 = threading.Thread(target=run, args=(slow_leader, "leader"))
+        t1.start()
+        while "k" not in single_flight._calls:
+            time.sleep(0.001)
+        t2 = threading.Thread(target=run, args=(own, "follower"))
+        t2.start()
+        time.sleep(0.1)   # الـ follower واقف على call.done
+        release.set()
+        t1.join()
+        t2.join()
+        return out["follower"], len(follower_calls)
+
+    def test_followers_share_leader_result(self):
+        before = single_flight.stats()["coalesced_local"]
+        value, calls = self._race(lambda: {"answer": "shared"})
+        self.assertEqual(value, {"answer": "shared"})
+        self.assertEqual(calls, 0)
+        self.assertEqual(single_flight.stats()["coalesced_local"], before + 1)
+
+    def test_leader_error_reaches_followers(self):
+        def fail():
+            raise ValueError("gemini down")
+
+        value, calls = self._race(fail)
+        self.assertIsInstance(value, ValueError)
+        self.assertEqual(str(value), "gemini down")
+        self.assertEqual(calls, 0)
+        self.assertNotIn("k", single_flight._calls)
+
+    def test_arun_coalesces_on_one_loop(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"answer": "shared"}
+
+        async def main():
+            return await asyncio.gather(*(single_flight.arun("k", compute) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(main()), [{"answer": "shared"}] * 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_arun_leader_error_reaches_followers(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            raise ValueError("gemini down")
+
+        async def main():
+            return await asyncio.gather(*(single_flight.arun("k", compute) for _ in range(3)),
+                                        return_exceptions=True)
+
+        results = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(single_flight._acalls, {})
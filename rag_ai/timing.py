@@ -0,0 +1,44 @@
+# rag_ai/timing.py
+"""
+توقيت مراحل الـ RAG (embed / search / fetch / context / generate / postprocess).
+
+    with timing.collect() as t:
+        api_ask(...)
+    t  →  {"embed": 12.3, "search": 4.1, ...}   (ms)
+
+برّه collect() الـ stage() مش بيعمل حاجة غير قراءة ContextVar.
+الـ ContextVar بيعدّى مع sync_to_async، فالـ async path بيتقاس بنفس الطريقة.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("rag_timings", default=None)
+
+
+@contextmanager
+def stage(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+@contextmanager
+def collect():
+    """collect() جوه collect() (bench_rag حوالين view عامل trace): المراحل بتتضاف للاتنين."""
+    parent = _current.get()
+    timings = {}
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        if parent is not None:
+            for name, ms in timings.items():
+                parent[name] = parent.get(name, 0.0) + ms
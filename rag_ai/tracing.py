@@ -0,0 +1,286 @@
+# rag_ai/tracing.py
+"""
+Trace لكل طلب AI فوق rag_ai/timing.py: مراحل الطلب (embed / search / fetch / context /
+generate / postprocess + total) بتتسجل فى histograms ومعاها plan / k / model.
+
+    with tracing.trace("simple", user=request.user, k=10, trace_id=tracing.incoming_id(request.headers)) as tr:
+        data = api_ask(...)
+    tr.id  → trace_id فى الرد (و X-Trace-Id)
+
+- histograms: لكل (endpoint, stage, plan, model, k) عدد فى كل bucket (ms) + sum + count.
+  بتتجمع فى الـ process، ولو RAG_METRICS_SHARED_ALIAS متظبط كل worker بيكتب snapshot
+  بتاعه فى الـ cache كل RAG_METRICS_FLUSH_SECONDS، والـ endpoint بيجمّع كل الـ workers.
+- /api/v1/metrics/: Prometheus text format (Bearer RAG_METRICS_TOKEN أو staff)، ومعاها
+  عدادات الـ HTTP pool لكل worker (medical_project/http_pool.pool_stats: reuse / TLS handshakes).
+- الطلبات الأبطأ من RAG_TRACE_SLOW_MS بتتكتب فى logger "rag_ai.tracing" (JSON سطر
+  واحد بكل المراحل) بنسبة RAG_TRACE_SLOW_SAMPLE.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+from medical_project.http_pool import pool_stats
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+TRACE_HEADER = "X-Request-Id"
+_ID_RE = re.compile(r"^[A-Za-z0-9._-]{8,64}$")
+
+_lock = threading.Lock()
+_hist = {}        # (endpoint, stage, plan, model, k) → [bucket counts..., +Inf], sum, count
+_requests = {}    # (endpoint, outcome) → count
+_flushed = {"at": 0.0}
+
+
+class Trace:
+    def __init__(self, endpoint, trace_id, plan, k, model):
+        self.id = trace_id
+        self.endpoint = endpoint
+        self.plan = plan
+        self.k = k
+        self.model = model
+        self.outcome = "ok"
+        self.tags = {}
+        self.timings = {}
+        self.total_ms = None
+
+    def tag(self, **tags):
+        """تفاصيل زيادة للـ slow log (cached، coalesced، ...)."""
+        self.tags.update(tags)
+
+
+def incoming_id(headers):
+    """X-Request-Id من الـ load balancer / الكلاينت لو شكله سليم، وإلا None (id جديد)."""
+    value = (headers.get(TRACE_HEADER) or "").strip()
+    return value if _ID_RE.match(value) else None
+
+
+def _plan(user):
+    return (getattr(user, "plan", "") or "none").lower() if user is not None else "anonymous"
+
+
+def _k_label(k):
+    if k is None:
+        return ""
+    return str(k) if k <= 50 else "50+"
+
+
+@contextmanager
+def trace(endpoint, user=None, k=None, trace_id=None):
+    tr = Trace(endpoint, trace_id or uuid.uuid4().hex, _plan(user), k,
+               getattr(settings, "GEMINI_GEN_MODEL", ""))
+    t0 = time.perf_counter()
+    try:
+        with timing.collect() as tr.timings:
+            yield tr
+    except Exception as e:
+        from .resilience import GeminiUnavailable
+        tr.outcome = "unavailable" if isinstance(e, GeminiUnavailable) else "error"
+        raise
+    except BaseException:
+        tr.outcome = "cancelled"   # العميل قفل الـ stream / الـ task اتلغت
+        raise
+    finally:
+        tr.total_ms = (time.perf_counter() - t0) * 1000
+        _finish(tr)
+
+
+def _finish(tr):
+    try:
+        record(tr)
+        _maybe_log(tr)
+        _maybe_flush()
+    except Exception:
+        logger.exception("rag trace %s not recorded", tr.id)
+
+
+def record(tr):
+    labels = (tr.endpoint, tr.plan, tr.model, _k_label(tr.k))
+    with _lock:
+        for name, ms in (*tr.timings.items(), ("total", tr.total_ms)):
+            key = (labels[0], name, *labels[1:])
+            h = _hist.get(key)
+            if h is None:
+                h = _hist[key] = [[0] * (len(BUCKETS_MS) + 1), 0.0, 0]
+            h[0][_bucket(ms)] += 1
+            h[1] += ms
+            h[2] += 1
+        rkey = (tr.endpoint, tr.outcome)
+        _requests[rkey] = _requests.get(rkey, 0) + 1
+
+
+def _bucket(ms):
+    for i, le in enumerate(BUCKETS_MS):
+        if ms <= le:
+            return i
+    return len(BUCKETS_MS)
+
+
+def _maybe_log(tr):
+    slow_ms = float(getattr(settings, "RAG_TRACE_SLOW_MS", 3000))
+    total = tr.total_ms
+    if slow_ms <= 0 or total < slow_ms:
+        return
+    if random.random() >= float(getattr(settings, "RAG_TRACE_SLOW_SAMPLE", 1.0)):
+        return
+    logger.warning("slow rag trace %s", json.dumps({
+        "trace_id": tr.id,
+        "endpoint": tr.endpoint,
+        "outcome": tr.outcome,
+        "plan": tr.plan,
+        "k": tr.k,
+        "model": tr.model,
+        "total_ms": round(total, 1),
+        "stages_ms": {n: round(ms, 1) for n, ms in tr.timings.items()},
+        **tr.tags,
+    }, ensure_ascii=False, default=str))
+
+
+# ---- بين الـ workers ---------------------------------------------------------
+
+_INDEX_KEY = "rag:metrics:workers"
+
+
+def _shared_cache():
+    alias = getattr(settings, "RAG_METRICS_SHARED_ALIAS", "")
+    return caches[alias] if alias else None
+
+
+def _flush_seconds():
+    return float(getattr(settings, "RAG_METRICS_FLUSH_SECONDS", 10.0))
+
+
+def snapshot():
+    """نسخة من عدادات الـ process ده (cumulative من ساعة ما الـ worker اشتغل)."""
+    with _lock:
+        return {
+            "hist": [[list(k), list(h[0]), h[1], h[2]] for k, h in _hist.items()],
+            "requests": [[list(k), n] for k, n in _requests.items()],
+            "pool": pool_stats(),
+        }
+
+
+def _maybe_flush(force=False):
+    shared = _shared_cache()
+    if shared is None:
+        return
+    now = time.monotonic()
+    with _lock:
+        if not force and now - _flushed["at"] < _flush_seconds():
+            return
+        _flushed["at"] = now
+    pid = os.getpid()
+    ttl = int(_flush_seconds() * 30) + 60   # worker مات → بيختفى بعد شوية
+    try:
+        shared.set(f"rag:metrics:w:{pid}", snapshot(), timeout=ttl)
+        workers = shared.get(_INDEX_KEY) or []
+        if pid not in workers:
+            # مش atomic؛ لو اتسابق مع worker تانى هيرجع يضيف نفسه فى الـ flush الجاى
+            shared.set(_INDEX_KEY, [*workers, pid][-256:], timeout=None)
+    except Exception as e:
+        logger.warning("rag metrics not flushed: %s", e)
+
+
+def collect_all():
+    """snapshots كل الـ workers (أو الـ process ده بس لو مفيش shared cache)."""
+    shared = _shared_cache()
+    if shared is None:
+        return [snapshot()]
+    _maybe_flush(force=True)
+    try:
+        workers = shared.get(_INDEX_KEY) or []
+        snaps = shared.get_many([f"rag:metrics:w:{pid}" for pid in workers])
+    except Exception as e:
+        logger.warning("rag metrics not read from shared cache: %s", e)
+        return [snapshot()]
+    return list(snaps.values())
+
+
+# ---- Prometheus --------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+_POOL_METRICS = (
+    ("http_pool_requests_total", "requests", "counter", "Outbound HTTP requests (Gemini, web → API) per worker."),
+    ("http_pool_new_connections_total", "new_connections", "counter", "New TCP connections opened per worker."),
+    ("http_pool_reused_connections_total", "reused_connections", "counter",
+     "Requests served on a kept-alive connection per worker."),
+    ("http_pool_connect_ms_total", "connect_ms_total", "counter", "Time spent in TCP connect (ms)."),
+    ("http_pool_tls_handshakes_total", "tls_handshakes", "counter", "TLS handshakes per worker."),
+    ("http_pool_tls_handshake_ms_total", "tls_handshake_ms_total", "counter", "Time spent in TLS handshakes (ms)."),
+    ("http_pool_reuse_ratio", "reuse_ratio", "gauge", "Share of requests that reused a connection."),
+)
+
+
+def render_prometheus(snaps=None):
+    snaps = collect_all() if snaps is None else snaps
+    hist, reqs = {}, {}
+    for snap in snaps:
+        for key, buckets, total, count in snap.get("hist", ()):
+            h = hist.setdefault(tuple(key), [[0] * len(buckets), 0.0, 0])
+            h[0] = [a + b for a, b in zip(h[0], buckets)]
+            h[1] += total
+            h[2] += count
+        for key, n in snap.get("requests", ()):
+            reqs[tuple(key)] = reqs.get(tuple(key), 0) + n
+
+    lines = [
+        "# HELP rag_requests_total AI tutor requests by endpoint and outcome.",
+        "# TYPE rag_requests_total counter",
+    ]
+    for (endpoint, outcome), n in sorted(reqs.items()):
+        lines.append(f"rag_requests_total{_labels(endpoint=endpoint, outcome=outcome)} {n}")
+
+    lines += [
+        "# HELP rag_stage_duration_ms Time spent in each RAG stage (total = whole request).",
+        "# TYPE rag_stage_duration_ms histogram",
+    ]
+    for (endpoint, stage, plan, model, k), (buckets, total, count) in sorted(hist.items()):
+        base = dict(endpoint=endpoint, stage=stage, plan=plan, model=model, k=k)
+        running = 0
+        for le, n in zip((*BUCKETS_MS, "+Inf"), buckets):
+            running += n
+            lines.append(f"rag_stage_duration_ms_bucket{_labels(**base, le=le)} {running}")
+        lines.append(f"rag_stage_duration_ms_sum{_labels(**base)} {total:.3f}")
+        lines.append(f"rag_stage_duration_ms_count{_labels(**base)} {count}")
+
+    # الـ HTTP pool: counters لكل worker (pid)؛ sum by pid فى Prometheus للـ dyno كله
+    pools = sorted((snap["pool"] for snap in snaps if snap.get("pool")), key=lambda p: p["pid"])
+    for name, key, kind, help_text in _POOL_METRICS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for pool in pools:
+            lines.append(f"{name}{_labels(pid=pool['pid'])} {pool.get(key, 0)}")
+
+    from . import resilience
+    breaker = resilience.stats()
+    lines += [
+        "# HELP rag_gemini_breaker_open Gemini circuit breaker state in this worker (1 = open / half-open).",
+        "# TYPE rag_gemini_breaker_open gauge",
+        f"rag_gemini_breaker_open{_labels(pid=os.getpid())} {int(breaker['breaker'] != 'closed')}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """للـ benchmarks: يصفّر عدادات الـ process."""
+    with _lock:
+        _hist.clear()
+        _requests.clear()
@@ -1,9 +1,16 @@
 # rag_ai/urls.py
 from django.urls import path
-from .views import ask_api , chat_ui ,AskApiV1,AskApiV1Simple
+from .views import ask_api , chat_ui ,AskApiV1,AskApiV1Simple,AskApiV1Stream,AskApiV1Batch
+from .views import ask_api_v1_async, ask_api_v1_simple_async, rag_metrics
 urlpatterns = [
     path("api/ask/", ask_api, name="ask_api"),
     path("chat/", chat_ui, name="chat_ui"),
     path("api/v1/ask/", AskApiV1.as_view(), name="ask_api_v1"),# الجديد (للموبايل)
     path("api/v1/ask/simple/", AskApiV1Simple.as_view(), name="ask_api_v1_simple"),
+    path("api/v1/ask/stream/", AskApiV1Stream.as_view(), name="ask_api_v1_stream"),  # SSE
+    path("api/v1/ask/batch/", AskApiV1Batch.as_view(), name="ask_api_v1_batch"),     # أسئلة كتير، SSE
+    # نفس الـ endpoints بس async (ASGI)
+    path("api/v1/ask/async/", ask_api_v1_async, name="ask_api_v1_async"),
+    path("api/v1/ask/simple/async/", ask_api_v1_simple_async, name="ask_api_v1_simple_async"),
+    path("api/v1/metrics/", rag_metrics, name="rag_metrics"),  # Prometheus (rag_ai/tracing.py)
 ]
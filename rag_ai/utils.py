@@ -1,22 +1,310 @@
 # rag_ai/utils.py
+"""
+حصة الـ AI اليومية (DailyAIUsage).
+
+    day = date.today()
+    ok, limit, used = reserve_ai(user, day=day)      # قبل Gemini: حجز فى statement واحد
+    if not ok: → 429
+    ... لو الإجابة فشلت: refund_ai(user, day=day)   # نفس يوم الحجز حتى لو عدّينا نص الليل
+
+reserve_ai: INSERT ... ON CONFLICT DO UPDATE SET count = count + n WHERE count + n <= limit
+RETURNING count — من غير select_for_update ومن غير فرق بين الـ check والـ consume
+(طلبين فى نفس الوقت ما يعدّوش الحد).
+
+AI_QUOTA_CACHE_ALIAS (اختيارى): العدّاد فى الـ cache والـ DB بيتحدث بالـ batch كل
+AI_QUOTA_FLUSH_SECONDS من thread فى الخلفية، فالطلب مفيهوش query للحصة خالص.
+الـ DB بيتأخر لحد الـ flush الجاى؛ الـ cache هو المرجع للحد.
+
+- لازم Redis أو memcached (incr atomic ومشترك بين الـ workers). LocMem / DB / file
+  الـ incr فيهم read-modify-write (و LocMem لكل process)، فبنتجاهلهم بـ warning
+  ونرجع للـ UPSERT.
+- لو الـ key اتمسح (eviction / restart للـ cache) بيتعمله seed من الـ DB + الـ deltas
+  اللى مستنية فى الـ process ده بس؛ deltas الـ workers التانية لسه ما وصلتش. كل flush
+  بعد كده بيرفع الـ key للى فى الـ DB لو كان أقل (_reconcile)، فالزيادة عن الحد أقصاها
+  الحجوزات اللى اتعملت فى الـ workers التانية خلال flush interval واحد تقريباً.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
 from datetime import date
-from django.db import transaction
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, connection, transaction
+
 from .models import DailyAIUsage
 
-def can_consume_ai(user):
+logger = logging.getLogger(__name__)
+
+_TABLE = DailyAIUsage._meta.db_table
+
+
+def ai_limit(user):
     from edu.policy import get_policy
-    policy = get_policy(user)
-    limit = int(policy.get("ai_daily_limit", 0))
+    return int(get_policy(user).get("ai_daily_limit", 0))
+
+
+def can_consume_ai(user):
+    """قراءة بس (من غير حجز) — للعرض؛ الـ views بتستخدم reserve_ai."""
+    limit = ai_limit(user)
     if limit <= 0:
         return False, limit, 0
-    today = date.today()
-    obj, _ = DailyAIUsage.objects.get_or_create(user=user, date=today)
-    return (obj.count < limit), limit, obj.count
+    used = _cached_count(user.pk, date.today())
+    if used is None:
+        used = DailyAIUsage.objects.filter(user=user, date=date.today()).values_list("count", flat=True).first() or 0
+    return used < limit, limit, used
+
 
 def consume_ai(user, n=1):
-    today = date.today()
-    with transaction.atomic():
-        obj, _ = DailyAIUsage.objects.select_for_update().get_or_create(user=user, date=today)
-        obj.count += n
-        obj.save()
-        return obj.count
+    """زيادة من غير شرط الحد (مثلاً تسجيل استهلاك بعدى)؛ بيرجّع العدد الجديد."""
+    return _upsert(user.pk, date.today(), n, limit=None)
+
+
+def reserve_ai(user, n=1, day=None):
+    """
+    بيحجز n من حصة day (default النهارده) لو فيه مكان. بيرجّع (ok, limit, used)؛
+    used بعد الحجز لو ok، وإلا الاستهلاك الحالى.
+    """
+    limit = ai_limit(user)
+    if limit <= 0:
+        return False, limit, 0
+    today = day or date.today()
+    cache = _quota_cache()
+    if cache is not None:
+        used = _cache_reserve(cache, user.pk, today, n, limit)
+    else:
+        used = _upsert(user.pk, today, n, limit=limit)
+    if used is None:
+        return False, limit, _current(user.pk, today)
+    return True, limit, used
+
+
+def refund_ai(user, n=1, day=None):
+    """بيرجّع حجز مااتستخدمش (Gemini وقع / العميل قفل). بيرجّع العدد بعد الـ refund."""
+    if n <= 0:
+        return _current(user.pk, day or date.today())
+    day = day or date.today()
+    cache = _quota_cache()
+    if cache is not None:
+        return _cache_add(cache, user.pk, day, -n)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"UPDATE {_TABLE} SET count = GREATEST(count - %s, 0) WHERE user_id = %s AND date = %s RETURNING count",
+            [n, user.pk, day],
+        )
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def _upsert(user_id, day, n, limit):
+    """statement واحد؛ None لو الحد هيتعدّى."""
+    cond = "" if limit is None else f" WHERE {_TABLE}.count + EXCLUDED.count <= %s"
+    params = [user_id, day, n]
+    if limit is not None:
+        if n > limit:
+            return None
+        params.append(limit)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO {_TABLE} (user_id, date, count) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (user_id, date) DO UPDATE SET count = {_TABLE}.count + EXCLUDED.count{cond} "
+            f"RETURNING count",
+            params,
+        )
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _current(user_id, day):
+    used = _cached_count(user_id, day)
+    if used is not None:
+        return used
+    return DailyAIUsage.objects.filter(user_id=user_id, date=day).values_list("count", flat=True).first() or 0
+
+
+# ---- cache tier --------------------------------------------------------------
+
+_lock = threading.Lock()
+_pending = {}          # (user_id, date) → delta لسه ما اتكتبش فى الـ DB
+_flusher = None
+_flusher_pid = None
+
+
+# backends الـ incr فيها atomic ومشتركة بين الـ processes
+_ATOMIC_BACKENDS = (
+    "django.core.cache.backends.redis.RedisCache",
+    "django.core.cache.backends.memcached.PyMemcacheCache",
+    "django.core.cache.backends.memcached.PyLibMCCache",
+    "django_redis.cache.RedisCache",
+)
+_rejected = set()
+
+
+def _quota_cache():
+    alias = getattr(settings, "AI_QUOTA_CACHE_ALIAS", "")
+    if not alias:
+        return None
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "")
+    if backend not in _ATOMIC_BACKENDS:
+        if alias not in _rejected:
+            _rejected.add(alias)
+            logger.warning("AI_QUOTA_CACHE_ALIAS=%r uses %s (no atomic shared incr); using the DB upsert", alias, backend)
+        return None
+    return caches[alias]
+
+
+def _flush_seconds():
+    return float(getattr(settings, "AI_QUOTA_FLUSH_SECONDS", 5.0))
+
+
+def _key(user_id, day):
+    return f"rag:quota:{user_id}:{day.isoformat()}"
+
+
+def _cached_count(user_id, day):
+    cache = _quota_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.get(_key(user_id, day))
+    except Exception:
+        return None
+
+
+def _seed(cache, user_id, day):
+    """أول مرة النهارده فى الـ cache: نبدأ من الـ DB + اللى مستنى flush فى الـ process ده."""
+    with _lock:
+        pending = _pending.get((user_id, day), 0)
+    db = DailyAIUsage.objects.filter(user_id=user_id, date=day).values_list("count", flat=True).first() or 0
+    cache.add(_key(user_id, day), db + pending, timeout=2 * 24 * 3600)
+
+
+def _incr(cache, key, delta):
+    return cache.incr(key, delta) if delta >= 0 else cache.decr(key, -delta)
+
+
+def _cache_add(cache, user_id, day, delta):
+    key = _key(user_id, day)
+    try:
+        value = _incr(cache, key, delta)
+    except ValueError:   # مش موجود (يوم جديد / اتمسح)
+        _seed(cache, user_id, day)
+        value = _incr(cache, key, delta)
+    if value < 0:
+        value = _incr(cache, key, -value)
+    _note(user_id, day, delta)
+    return value
+
+
+def _cache_reserve(cache, user_id, day, n, limit):
+    if n > limit:
+        return None
+    key = _key(user_id, day)
+    try:
+        value = cache.incr(key, n)
+    except ValueError:
+        _seed(cache, user_id, day)
+        value = cache.incr(key, n)
+    if value > limit:
+        cache.decr(key, n)
+        return None
+    _note(user_id, day, n)
+    return value
+
+
+def _note(user_id, day, delta):
+    with _lock:
+        _pending[(user_id, day)] = _pending.get((user_id, day), 0) + delta
+    _ensure_flusher()
+
+
+def flush():
+    """بيكتب الـ deltas المستنية فى الـ DB (upsert واحد للزيادات، update واحد للـ refunds)."""
+    with _lock:
+        batch = {k: v for k, v in _pending.items() if v}
+        _pending.clear()
+    if not batch:
+        return 0
+    added = [(user_id, day, d) for (user_id, day), d in batch.items() if d > 0]
+    refunded = [(user_id, day, -d) for (user_id, day), d in batch.items() if d < 0]
+    counts = {}
+    try:
+        with transaction.atomic(), connection.cursor() as cur:
+            if added:
+                cur.execute(
+                    f"INSERT INTO {_TABLE} (user_id, date, count) VALUES {', '.join(['(%s, %s, %s)'] * len(added))} "
+                    f"ON CONFLICT (user_id, date) DO UPDATE SET count = {_TABLE}.count + EXCLUDED.count "
+                    f"RETURNING user_id, date, count",
+                    [p for row in added for p in row],
+                )
+                counts.update(((u, d), c) for u, d, c in cur.fetchall())
+            if refunded:
+                cur.execute(
+                    f"UPDATE {_TABLE} AS u SET count = GREATEST(u.count - v.n, 0) "
+                    f"FROM (VALUES {', '.join(['(%s, %s::date, %s)'] * len(refunded))}) AS v(user_id, date, n) "
+                    f"WHERE u.user_id = v.user_id AND u.date = v.date",
+                    [p for row in refunded for p in row],
+                )
+    except Exception:
+        with _lock:   # نرجّعهم للـ flush الجاى
+            for k, v in batch.items():
+                _pending[k] = _pending.get(k, 0) + v
+        raise
+    _reconcile(counts)
+    return len(batch)
+
+
+def _reconcile(counts):
+    """
+    الـ key اللى اتعمله seed بعد eviction ممكن يكون أقل من الحقيقة (deltas workers تانية
+    ماكانتش وصلت الـ DB). بعد الـ flush: لو الـ cache أقل من الـ DB + المستنى هنا نرفعه.
+    """
+    cache = _quota_cache()
+    if cache is None or not counts:
+        return
+    keys = {_key(user_id, day): (user_id, day) for user_id, day in counts}
+    try:
+        cached = cache.get_many(list(keys))
+        for key, value in cached.items():
+            user_id, day = keys[key]
+            with _lock:
+                floor = counts[(user_id, day)] + max(0, _pending.get((user_id, day), 0))
+            if value < floor:
+                cache.incr(key, floor - value)
+    except Exception as e:
+        logger.warning("ai quota cache not reconciled: %s", e)
+
+
+def _run_flusher():
+    while True:
+        time.sleep(_flush_seconds())
+        close_old_connections()
+        try:
+            flush()
+        except Exception as e:
+            logger.warning("ai quota not flushed: %s", e)
+        finally:
+            close_old_connections()
+
+
+def _ensure_flusher():
+    """thread واحد لكل process (بعد fork بتاع gunicorn كل worker بيبدأ بتاعه)."""
+    global _flusher, _flusher_pid
+    with _lock:
+        pid = os.getpid()
+        if _flusher is not None and _flusher_pid == pid and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=_run_flusher, name="rag-quota-flush", daemon=True)
+        _flusher.start()
+        _flusher_pid = pid
+
+
+@atexit.register
+def _flush_at_exit():
+    if _pending:
+        try:
+            flush()
+        except Exception:
+            pass
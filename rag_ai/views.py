@@ -1,14 +1,20 @@
 # rag_ai/views.py
-import json, time, uuid, traceback
+import json, logging, traceback
 from django.shortcuts import render
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
 from django.conf import settings
 from users.permissions import SingleDeviceOnly
-from rag_ai.qa import ask, api_ask
-from rag_ai.utils import can_consume_ai, consume_ai
+from rag_ai.qa import ask, api_ask, coalesced_api_ask, SearchScope, year_scope
+from datetime import date
+from rag_ai.utils import refund_ai, reserve_ai
+from rag_ai import answer_cache, conversations, resilience, tracing
+from rag_ai.resilience import GeminiUnavailable
+from rag_ai.index import default_probes, default_ef_search
 from users.streak import record_activity
+
+logger = logging.getLogger(__name__)
 # ===== الواجهة القديمة (تفضل كما هي) =========================================
 def chat_ui(request):
     return render(request, "rag/chat.html")
@@ -38,6 +44,33 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 def _err(code, message, http_status):
     return Response({"error": {"code": code, "message": message}}, status=http_status)
 
+
+def _unavailable(e):
+    """GeminiUnavailable → 503 برسالة لطيفة (ومن غير ما يتحسب من الـ quota)."""
+    return {"error": {"code": "ai_unavailable", "message": e.message, "reason": e.reason}}
+
+
+def _scope_from_body(body):
+    """year (كود) / module_id / subject_id اختياريين فى الـ body → SearchScope أو None."""
+    year_id = None
+    if body.get("year"):
+        year = year_scope(body["year"])
+        if year is None:
+            raise ValueError(f"Unknown year {body['year']!r}")
+        year_id = year.year_id
+    module_id = int(body["module_id"]) if body.get("module_id") else None
+    subject_id = int(body["subject_id"]) if body.get("subject_id") else None
+    if year_id is None and module_id is None and subject_id is None:
+        return None
+    return SearchScope(year_id=year_id, module_id=module_id, subject_id=subject_id)
+
+
+def _user_scope(user):
+    """البحث على سنة الطالب بس (RAG_SCOPE_BY_YEAR)؛ من غير سنة = كل الـ chunks."""
+    if not getattr(settings, "RAG_SCOPE_BY_YEAR", True):
+        return None
+    return year_scope(getattr(user, "study_year", ""))
+
 class AskApiV1(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, SingleDeviceOnly]  # لازم توكن
@@ -53,19 +86,24 @@ class AskApiV1(APIView):
                 return _err("bad_request", "Missing field 'q'", status.HTTP_400_BAD_REQUEST)
 
             k = int(body.get("k", 15))
-            probes = int(body.get("probes", 10))
+            probes = int(body.get("probes") or default_probes())
+            ef_search = int(body.get("ef_search") or default_ef_search())
             max_chars = int(body.get("max_chars", 5000))
+            scope = _scope_from_body(body)
         except Exception as e:
             return _err("bad_request", str(e), status.HTTP_400_BAD_REQUEST)
 
-        t0 = time.perf_counter()
         try:
-            data = api_ask(q, k=k, probes=probes, max_chars=max_chars)
+            with tracing.trace("v1", user=request.user, k=k, trace_id=tracing.incoming_id(request.headers)) as tr, \
+                    resilience.budget(resilience.request_budget_ms(request.headers)):
+                data = api_ask(q, k=k, probes=probes, ef_search=ef_search, max_chars=max_chars, scope=scope)
+                tr.tag(cached=data["cached"])
+        except GeminiUnavailable as e:
+            return Response(_unavailable(e), status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             traceback.print_exc()
             return _err("server_error", str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        elapsed_ms = int((time.perf_counter() - t0) * 1000)
         resp = {
             **data,
             "usage": {
@@ -73,13 +111,16 @@ class AskApiV1(APIView):
                 "generation_model": getattr(settings, "GEMINI_GEN_MODEL", ""),
                 "k": k,
                 "probes": probes,
+                "ef_search": ef_search,
                 "max_chars": max_chars,
+                "scope": scope._asdict() if scope else None,
                 "vector_metric": "cosine",
-                "elapsed_ms": elapsed_ms,
+                "elapsed_ms": int(tr.total_ms),
+                "stages_ms": {n: round(ms, 1) for n, ms in tr.timings.items()},
             },
-            "trace_id": str(uuid.uuid4()),
+            "trace_id": tr.id,
         }
-        return Response(resp, status=status.HTTP_200_OK)
+        return Response(resp, status=status.HTTP_200_OK, headers={"X-Trace-Id": tr.id})
 
 
 
@@ -87,6 +128,34 @@ class AskApiV1(APIView):
 
 import json
 
+def _parse_history(body):
+    raw_history = body.get("history")
+
+    if isinstance(raw_history, str):
+        # جاية كسلسلة JSON
+        try:
+            history = json.loads(raw_history)
+        except Exception:
+            history = []
+    elif isinstance(raw_history, list):
+        # جاية list جاهزة من web_ai_ask
+        history = raw_history
+    else:
+        history = []
+
+    return history[-10:]  # آخر 10 رسائل بس
+
+
+def _conversation(user, body):
+    """
+    "conversation_id" فى الـ body (حتى لو فاضى) → المحادثة على السيرفر (جديدة لو مش موجودة)؛
+    من غيره None والـ history بتيجى من الـ body زى الأول.
+    """
+    if "conversation_id" not in body:
+        return None
+    return conversations.get(user, body.get("conversation_id"))
+
+
 class AskApiV1Simple(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, SingleDeviceOnly]
@@ -101,36 +170,407 @@ class AskApiV1Simple(APIView):
             return Response({"error": {"code": "bad_request", "message": "Missing field 'q'"}}, status=400)
 
         # ✅ history (اختياري)
-        raw_history = body.get("history")
+        history = _parse_history(body)
+        logger.debug("ask/simple history: %d turns", len(history))
+
+        if not request.user.is_active_subscription:
+            return Response({"error": {"code": "inactive", "message": "Subscription inactive"}}, status=402)
+
+        day = date.today()
+        ok, limit, used = reserve_ai(request.user, day=day)
+        if not ok:
+            return Response({"error": {"code": "ai_limit", "message": "Daily AI limit reached", "limit": limit, "used": used}}, status=429)
+
+        try:
+            conv = _conversation(request.user, body)
+            if conv:
+                history = conversations.history(conv)
+            display_name = getattr(request.user, "first_name", "") or getattr(request.user, "username", "") or "Student"
+            with tracing.trace("simple", user=request.user, k=10, trace_id=tracing.incoming_id(request.headers)) as tr, \
+                    resilience.budget(resilience.request_budget_ms(request.headers)):
+                data = coalesced_api_ask(
+                    q, k=10, max_chars=4000, student_name=display_name, history=history,
+                    cache_scope=getattr(request.user, "study_year", "") or "",
+                    scope=_user_scope(request.user),
+                )
+                tr.tag(cached=data.get("cached"), history=len(history))
+            resp = {"answer": data.get("answer", "")}
+            if not answer_cache.cacheable(resp["answer"]):
+                # رسالة فشل ("AI error ..."، "Blocked by safety ...") → ما تتحسبش ولا تدخل المحادثة
+                refund_ai(request.user, day=day)
+            else:
+                record_activity(request.user)
+                if conv:
+                    conversations.append(conv, q, resp["answer"])
+            if conv:
+                resp["conversation_id"] = str(conv.pk)
+            return Response(resp, status=200, headers={"X-Trace-Id": tr.id})
+        except GeminiUnavailable as e:
+            refund_ai(request.user, day=day)
+            return Response(_unavailable(e), status=503)
+        except Exception as e:
+            refund_ai(request.user, day=day)
+            return Response({"error": {"code": "server_error", "message": str(e)}}, status=500)
+
+
+
+# ===== Streaming (SSE) جنب /v1/ask/simple/ ==================================
+# الـ validation والحجز فى الـ APIView (sync)، والـ stream نفسه async iterator:
+# تحت الـ uvicorn worker الـ sync generator بيتجمع كله قبل ما يتبعت (مفيش SSE).
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rag_ai.async_qa import abatch_ask, astream_ask
 
-        if isinstance(raw_history, str):
-            # جاية كسلسلة JSON
-            try:
-                history = json.loads(raw_history)
-            except Exception:
-                history = []
-        elif isinstance(raw_history, list):
-            # جاية list جاهزة من web_ai_ask
-            history = raw_history
-        else:
-            history = []
 
-        history = history[-10:]  # آخر 10 رسائل بس
-        print(">>> received history:", history)
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """علشان Accept: text/event-stream ما يرجعش 406، والأخطاء تطلع كـ event: error."""
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and "error" in data:
+            return _sse("error", data["error"]).encode("utf-8")
+        return _sse("message", data).encode("utf-8")
+
+
+class AskApiV1Stream(APIView):
+    """
+    نفس AskApiV1Simple بس الإجابة بتطلع SSE أول بأول:
+      event: delta  data: {"text": "..."}
+      event: done   data: {"answer": "...", "cached": false, "conversation_id": "..."}
+      event: error  data: {"code": "...", "message": "..."}
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated, SingleDeviceOnly]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        if not settings.GOOGLE_API_KEY:
+            return Response({"error": {"code": "missing_api_key", "message": "Missing GOOGLE_API_KEY"}}, status=500)
+
+        body = request.data if isinstance(request.data, dict) else {}
+        q = (body.get("q") or "").strip()
+        if not q:
+            return Response({"error": {"code": "bad_request", "message": "Missing field 'q'"}}, status=400)
+        history = _parse_history(body)
 
-        # باقى الكود كما هو...
         if not request.user.is_active_subscription:
             return Response({"error": {"code": "inactive", "message": "Subscription inactive"}}, status=402)
 
-        ok, limit, used = can_consume_ai(request.user)
+        day = date.today()
+        ok, limit, used = reserve_ai(request.user, day=day)
         if not ok:
             return Response({"error": {"code": "ai_limit", "message": "Daily AI limit reached", "limit": limit, "used": used}}, status=429)
 
+        user = request.user
+        display_name = getattr(user, "first_name", "") or getattr(user, "username", "") or "Student"
         try:
-            display_name = getattr(request.user, "first_name", "") or getattr(request.user, "username", "") or "Student"
-            data = api_ask(q, k=10, probes=10, max_chars=4000, student_name=display_name, history=history)
-            consume_ai(request.user)
-            record_activity(request.user)
-            return Response({"answer": data.get("answer", "")}, status=200)
+            scope = _user_scope(user)
+            conv = _conversation(user, body)
+            if conv:
+                history = conversations.history(conv)
+        except Exception:
+            refund_ai(user, day=day)
+            raise
+
+        budget_ms = resilience.request_budget_ms(request.headers)
+        trace_id = tracing.incoming_id(request.headers)
+        delivered = []
+
+        async def events():
+            try:
+                with tracing.trace("stream", user=user, k=10, trace_id=trace_id), resilience.budget(budget_ms):
+                    async for chunk in _stream_events():
+                        yield chunk
+            except GeminiUnavailable as e:
+                yield _sse("error", _unavailable(e)["error"])
+            except Exception as e:
+                traceback.print_exc()
+                yield _sse("error", {"code": "server_error", "message": str(e)})
+            finally:
+                if not delivered:   # وقع / رسالة فشل / العميل قفل قبل done → الحجز يرجع
+                    await sync_to_async(refund_ai)(user, day=day)
+
+        async def _stream_events():
+            async for kind, payload in astream_ask(
+                q, k=10, max_chars=4000, student_name=display_name, history=history,
+                cache_scope=getattr(user, "study_year", "") or "", scope=scope,
+            ):
+                if kind == "delta":
+                    yield _sse("delta", {"text": payload})
+                else:
+                    if answer_cache.cacheable(payload["answer"]):
+                        delivered.append(True)
+                        await sync_to_async(record_activity)(user)
+                        if conv:
+                            await sync_to_async(conversations.append)(conv, q, payload["answer"])
+                    if conv:
+                        payload = {**payload, "conversation_id": str(conv.pk)}
+                    yield _sse("done", payload)
+
+        resp = StreamingHttpResponse(events(), content_type="text/event-stream; charset=utf-8")
+        resp["Cache-Control"] = "no-cache"
+        resp["X-Accel-Buffering"] = "no"  # nginx/heroku router ما يعملش buffering
+        return resp
+
+
+
+class AskApiV1Batch(APIView):
+    """
+    أسئلة كتير فى طلب واحد (المدرسين / مولّد الـ study guides):
+      {"questions": ["...", ...], "k": 10, "max_chars": 4000, "year"/"module_id"/"subject_id": اختيارى}
+    الإجابات بتطلع SSE أول ما كل واحدة تخلص (مش بالترتيب):
+      event: answer  data: {"index": 0, "q": "...", "answer": "...", "sources": [...], "cached": false}
+      event: error   data: {"index": 3, "code": "server_error", "message": "..."}
+      event: done    data: {"answered": 9, "failed": 1, "used": 21, "limit": 50}
+    كل سؤال بيتحسب فى DailyAIUsage زى AskApiV1Simple، والفاشل ما بيتحسبش.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated, SingleDeviceOnly]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        if not settings.GOOGLE_API_KEY:
+            return _err("missing_api_key", "Missing GOOGLE_API_KEY", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        try:
+            body = request.data if isinstance(request.data, dict) else {}
+            questions = body.get("questions")
+            if not isinstance(questions, list) or not questions:
+                return _err("bad_request", "Missing field 'questions'", status.HTTP_400_BAD_REQUEST)
+            questions = [str(q or "").strip() for q in questions]
+            if not all(questions):
+                return _err("bad_request", "Empty question in 'questions'", status.HTTP_400_BAD_REQUEST)
+            max_questions = getattr(settings, "RAG_BATCH_MAX_QUESTIONS", 50)
+            if len(questions) > max_questions:
+                return _err("bad_request", f"At most {max_questions} questions per batch", status.HTTP_400_BAD_REQUEST)
+
+            k = int(body.get("k", 10))
+            max_chars = int(body.get("max_chars", 4000))
+            scope = _scope_from_body(body)
         except Exception as e:
-            return Response({"error": {"code": "server_error", "message": str(e)}}, status=500)
\ No newline at end of file
+            return _err("bad_request", str(e), status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        if not user.is_active_subscription:
+            return _err("inactive", "Subscription inactive", status.HTTP_402_PAYMENT_REQUIRED)
+
+        # الحجز للكل مرة واحدة؛ اللى يفشل بيرجع فى الآخر
+        day = date.today()
+        ok, limit, used = reserve_ai(user, len(questions), day=day)
+        if not ok:
+            return Response({"error": {"code": "ai_limit", "message": "Daily AI limit reached",
+                                       "limit": limit, "used": used, "remaining": max(0, limit - used)}}, status=429)
+
+        display_name = getattr(user, "first_name", "") or getattr(user, "username", "") or "Student"
+        scope = scope or _user_scope(user)
+
+        budget_ms = resilience.request_budget_ms(request.headers)
+        trace_id = tracing.incoming_id(request.headers)
+
+        async def events():
+            answered = 0
+            try:
+                with tracing.trace("batch", user=user, k=k, trace_id=trace_id) as tr, resilience.budget(budget_ms):
+                    tr.tag(questions=len(questions))
+                    async for i, result in abatch_ask(
+                        questions, k=k, max_chars=max_chars, student_name=display_name,
+                        cache_scope=getattr(user, "study_year", "") or "", scope=scope,
+                    ):
+                        if "error" in result:
+                            yield _sse("error", {"index": i, "code": result.get("code", "server_error"),
+                                                 "message": result["error"]})
+                            continue
+                        answered += 1
+                        yield _sse("answer", {"index": i, "q": questions[i], **result})
+            except GeminiUnavailable as e:
+                yield _sse("error", _unavailable(e)["error"])
+            except Exception as e:
+                traceback.print_exc()
+                yield _sse("error", {"code": "server_error", "message": str(e)})
+            finally:
+                failed = len(questions) - answered
+                count = await sync_to_async(refund_ai)(user, failed, day=day) if failed else used
+            if answered:
+                await sync_to_async(record_activity)(user)
+            yield _sse("done", {"answered": answered, "failed": len(questions) - answered, "used": count, "limit": limit})
+
+        resp = StreamingHttpResponse(events(), content_type="text/event-stream; charset=utf-8")
+        resp["Cache-Control"] = "no-cache"
+        resp["X-Accel-Buffering"] = "no"
+        return resp
+
+
+
+# ===== Async (ASGI) نسخ من AskApiV1 / AskApiV1Simple ========================
+# DRF مش بيدعم async views، فالـ auth (JWT + SingleDeviceOnly) بنعمله بإيدينا
+# بنفس الكلاسات وفى thread، والباقى (Gemini) async على الـ event loop.
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rag_ai.async_qa import aapi_ask, acoalesced_api_ask
+
+
+def _json(data, status_code):
+    return JsonResponse(data, status=status_code, json_dumps_params={"ensure_ascii": False})
+
+
+def _authenticate(request):
+    """بيرجّع (user, None) أو (None, JsonResponse) زى ما الـ APIView كانت هترد."""
+    drf_request = Request(request, authenticators=[JWTAuthentication()])
+    try:
+        user = drf_request.user
+    except exceptions.AuthenticationFailed as e:
+        return None, _json({"detail": e.detail}, 401)
+
+    if not getattr(user, "is_authenticated", False):
+        return None, _json({"detail": "Authentication credentials were not provided."}, 401)
+    if not SingleDeviceOnly().has_permission(drf_request, None):
+        return None, _json({"detail": SingleDeviceOnly.message}, 403)
+    return user, None
+
+
+def _read_body(request):
+    if request.content_type == "application/json":
+        try:
+            body = json.loads(request.body or b"{}")
+        except ValueError:
+            return {}
+        return body if isinstance(body, dict) else {}
+    return request.POST.dict()
+
+
+@csrf_exempt
+@require_POST
+async def ask_api_v1_async(request):
+    user, error = await sync_to_async(_authenticate)(request)
+    if error:
+        return error
+
+    if not settings.GOOGLE_API_KEY:
+        return _json({"error": {"code": "missing_api_key", "message": "Missing GOOGLE_API_KEY"}}, 500)
+
+    try:
+        body = _read_body(request)
+        q = (body.get("q") or "").strip()
+        if not q:
+            return _json({"error": {"code": "bad_request", "message": "Missing field 'q'"}}, 400)
+
+        k = int(body.get("k", 15))
+        probes = int(body.get("probes") or default_probes())
+        ef_search = int(body.get("ef_search") or default_ef_search())
+        max_chars = int(body.get("max_chars", 5000))
+        scope = await sync_to_async(_scope_from_body)(body)
+    except Exception as e:
+        return _json({"error": {"code": "bad_request", "message": str(e)}}, 400)
+
+    try:
+        with tracing.trace("v1_async", user=user, k=k, trace_id=tracing.incoming_id(request.headers)) as tr, \
+                resilience.budget(resilience.request_budget_ms(request.headers)):
+            data = await aapi_ask(q, k=k, max_chars=max_chars, probes=probes, ef_search=ef_search, scope=scope)
+            tr.tag(cached=data["cached"])
+    except GeminiUnavailable as e:
+        return _json(_unavailable(e), 503)
+    except Exception as e:
+        traceback.print_exc()
+        return _json({"error": {"code": "server_error", "message": str(e)}}, 500)
+
+    resp = _json({
+        **data,
+        "usage": {
+            "embedding_model": getattr(settings, "GEMINI_EMBED_MODEL", ""),
+            "generation_model": getattr(settings, "GEMINI_GEN_MODEL", ""),
+            "k": k,
+            "probes": probes,
+            "ef_search": ef_search,
+            "max_chars": max_chars,
+            "scope": scope._asdict() if scope else None,
+            "vector_metric": "cosine",
+            "elapsed_ms": int(tr.total_ms),
+            "stages_ms": {n: round(ms, 1) for n, ms in tr.timings.items()},
+        },
+        "trace_id": tr.id,
+    }, 200)
+    resp["X-Trace-Id"] = tr.id
+    return resp
+
+
+@csrf_exempt
+@require_POST
+async def ask_api_v1_simple_async(request):
+    user, error = await sync_to_async(_authenticate)(request)
+    if error:
+        return error
+
+    if not settings.GOOGLE_API_KEY:
+        return _json({"error": {"code": "missing_api_key", "message": "Missing GOOGLE_API_KEY"}}, 500)
+
+    body = _read_body(request)
+    q = (body.get("q") or "").strip()
+    if not q:
+        return _json({"error": {"code": "bad_request", "message": "Missing field 'q'"}}, 400)
+    history = _parse_history(body)
+
+    if not user.is_active_subscription:
+        return _json({"error": {"code": "inactive", "message": "Subscription inactive"}}, 402)
+
+    day = date.today()
+    ok, limit, used = await sync_to_async(reserve_ai)(user, day=day)
+    if not ok:
+        return _json({"error": {"code": "ai_limit", "message": "Daily AI limit reached", "limit": limit, "used": used}}, 429)
+
+    try:
+        conv = await sync_to_async(_conversation)(user, body)
+        if conv:
+            history = await sync_to_async(conversations.history)(conv)
+        display_name = getattr(user, "first_name", "") or getattr(user, "username", "") or "Student"
+        scope = await sync_to_async(_user_scope)(user)
+        with tracing.trace("simple_async", user=user, k=10, trace_id=tracing.incoming_id(request.headers)) as tr, \
+                resilience.budget(resilience.request_budget_ms(request.headers)):
+            data = await acoalesced_api_ask(
+                q, k=10, max_chars=4000, student_name=display_name, history=history,
+                cache_scope=getattr(user, "study_year", "") or "", scope=scope,
+            )
+            tr.tag(cached=data.get("cached"), history=len(history))
+        resp = {"answer": data.get("answer", "")}
+        if not answer_cache.cacheable(resp["answer"]):
+            await sync_to_async(refund_ai)(user, day=day)
+        else:
+            await sync_to_async(record_activity)(user)
+            if conv:
+                await sync_to_async(conversations.append)(conv, q, resp["answer"])
+        if conv:
+            resp["conversation_id"] = str(conv.pk)
+        resp = _json(resp, 200)
+        resp["X-Trace-Id"] = tr.id
+        return resp
+    except GeminiUnavailable as e:
+        await sync_to_async(refund_ai)(user, day=day)
+        return _json(_unavailable(e), 503)
+    except Exception as e:
+        await sync_to_async(refund_ai)(user, day=day)
+        return _json({"error": {"code": "server_error", "message": str(e)}}, 500)
+
+
+# ===== Metrics (Prometheus) ==================================================
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+
+@require_GET
+def rag_metrics(request):
+    """
+    histograms المراحل وعدادات الـ HTTP pool من rag_ai/tracing.py بصيغة Prometheus.
+    Authorization: Bearer <RAG_METRICS_TOKEN> (للـ scraper) أو staff داخل من الـ admin.
+    """
+    token = getattr(settings, "RAG_METRICS_TOKEN", "")
+    auth = request.headers.get("Authorization", "")
+    allowed = bool(token) and constant_time_compare(auth, f"Bearer {token}")
+    if not allowed and not getattr(request.user, "is_staff", False):
+        return HttpResponseForbidden("metrics: missing or bad token")
+    return HttpResponse(tracing.render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,242 @@
+# web/api_client.py
+"""
+نداء الـ API بتاعتنا من صفحات الويب.
+
+- "inprocess" (الافتراضي): بنبني HttpRequest داخلي وننادي الـ view بتاعة الـ API
+  مباشرة (نفس JWT + SingleDeviceOnly + policy) من غير ما نفتح HTTP على نفس السيرفر،
+  فمفيش worker تاني بيتحجز ومفيش JSON encode/decode للرد.
+- "http": الطريقة القديمة (HTTP على BASE_API_URL عبر الـ session المشتركة) كـ fallback بس.
+
+الـ views بتتعامل مع الرد بنفس واجهة requests.Response:
+status_code / ok / json() / text / content.
+
+aapi_request / aapi_get / aapi_post: نفس الكلام للـ async views (ASGI)؛
+الـ API views الـ async بتتنادى بـ await والـ sync فى thread، والـ http عن طريق httpx.
+stream=True: الرد بيتقرا بـ aiter_bytes() وبعدين aclose() (نفس واجهة httpx).
+"""
+import io
+import json as _json
+import logging
+from urllib.parse import urlencode, urlsplit
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+
+from medical_project.http_pool import get_async_client, get_session
+
+logger = logging.getLogger(__name__)
+
+API = settings.BASE_API_URL
+API_PREFIX = urlsplit(API).path.rstrip("/")  # "/api"
+
+
+def _transport():
+    return (getattr(settings, "WEB_API_TRANSPORT", "inprocess") or "inprocess").lower()
+
+
+class ApiResponse:
+    """
+    رد الـ dispatch الداخلي.
+    لو الـ view رجّعت DRF Response بنقرا response.data على طول (من غير render).
+    """
+
+    def __init__(self, status_code, response=None, content=b""):
+        self.status_code = status_code
+        self._response = response
+        self._content = content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        resp = self._response
+        if resp is None:
+            return self._content
+        if hasattr(resp, "render") and not getattr(resp, "is_rendered", True):
+            resp.render()
+        if getattr(resp, "streaming", False):
+            return b"".join(resp.streaming_content)
+        return resp.content
+
+    def iter_content(self, chunk_size=None):
+        """زى requests: الـ streaming responses بتطلع أول بأول."""
+        resp = self._response
+        if resp is not None and getattr(resp, "streaming", False):
+            yield from resp.streaming_content
+        else:
+            yield self.content
+
+    async def aiter_bytes(self):
+        """زى httpx: الـ streaming response (async iterator) بيطلع أول بأول على الـ event loop."""
+        resp = self._response
+        if resp is not None and getattr(resp, "streaming", False) and resp.is_async:
+            async for chunk in resp.streaming_content:
+                yield chunk
+        else:
+            yield await sync_to_async(lambda: self.content)()
+
+    async def aread(self):
+        return await sync_to_async(lambda: self.content)()
+
+    async def aclose(self):
+        pass   # مفيش connection؛ الـ iterator بيخلص مع aiter_bytes
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        resp = self._response
+        data = getattr(resp, "data", None)
+        if data is not None:
+            return data
+        raw = self.content
+        if not raw:
+            raise ValueError("Empty response body")
+        return _json.loads(raw)
+
+
+def _split_path(path, params):
+    parts = urlsplit(path)
+    query = parts.query
+    if params:
+        extra = urlencode(params, doseq=True)
+        query = f"{query}&{extra}" if query else extra
+    return parts.path, query
+
+
+def _build_request(request, method, path, query, headers, body):
+    meta = getattr(request, "META", {}) or {}
+    environ = {
+        "REQUEST_METHOD": method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": meta.get("SERVER_NAME", "localhost"),
+        "SERVER_PORT": meta.get("SERVER_PORT", "80"),
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": meta.get("REMOTE_ADDR", "127.0.0.1"),
+        "wsgi.url_scheme": request.scheme if request is not None else "http",
+        "wsgi.input": io.BytesIO(body),
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    if body:
+        environ["CONTENT_TYPE"] = "application/json"
+    if meta.get("HTTP_HOST"):
+        environ["HTTP_HOST"] = meta["HTTP_HOST"]
+    for name, value in (headers or {}).items():
+        if value is None:
+            continue
+        environ["HTTP_" + name.upper().replace("-", "_")] = str(value)
+    return WSGIRequest(environ)
+
+
+def _prepare(request, method, path, headers, params, json):
+    local_path, query = _split_path(API_PREFIX + path, params)
+    try:
+        match = resolve(local_path)
+    except Resolver404:
+        return None, None
+
+    body = b""
+    if json is not None:
+        body = _json.dumps(json).encode("utf-8")
+
+    inner = _build_request(request, method, local_path, query, headers, body)
+    inner.resolver_match = match
+    return match, inner
+
+
+def _inprocess(request, method, path, headers, params, json):
+    match, inner = _prepare(request, method, path, headers, params, json)
+    if match is None:
+        return ApiResponse(404, content=b'{"detail": "Not found."}')
+    local_path = inner.path
+    try:
+        resp = match.func(inner, *match.args, **match.kwargs)
+    except Exception:
+        # نفس اللي كان هيحصل عبر HTTP: الـ API ترجع 500 والصفحة تتعامل معاها
+        logger.exception("In-process API call failed: %s %s", method, local_path)
+        return ApiResponse(500, content=b'{"detail": "Server error."}')
+    return ApiResponse(resp.status_code, response=resp)
+
+
+def _http(method, path, headers, params, json, timeout, stream):
+    return get_session().request(
+        method, f"{API}{path}",
+        headers=headers, params=params, json=json, timeout=timeout, stream=stream,
+    )
+
+
+def api_request(request, method, path, *, headers=None, params=None, json=None, timeout=None, stream=False):
+    """
+    path نسبي لـ BASE_API_URL، مثال: "/v1/edu/lessons/5/".
+    timeout بيتطبق على الـ http fallback بس.
+    stream=True: اقرا الرد بـ iter_content() (مثلاً SSE).
+    """
+    method = method.upper()
+    if _transport() == "http":
+        return _http(method, path, headers, params, json, timeout, stream)
+    return _inprocess(request, method, path, headers, params, json)
+
+
+def api_get(request, path, **kwargs):
+    return api_request(request, "GET", path, **kwargs)
+
+
+def api_post(request, path, **kwargs):
+    return api_request(request, "POST", path, **kwargs)
+
+
+def api_put(request, path, **kwargs):
+    return api_request(request, "PUT", path, **kwargs)
+
+
+def api_delete(request, path, **kwargs):
+    return api_request(request, "DELETE", path, **kwargs)
+
+
+# ---- async ----
+
+async def _ainprocess(request, method, path, headers, params, json):
+    match, inner = _prepare(request, method, path, headers, params, json)
+    if match is None:
+        return ApiResponse(404, content=b'{"detail": "Not found."}')
+    try:
+        if iscoroutinefunction(match.func):
+            resp = await match.func(inner, *match.args, **match.kwargs)
+        else:
+            resp = await sync_to_async(match.func)(inner, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception("In-process API call failed: %s %s", method, inner.path)
+        return ApiResponse(500, content=b'{"detail": "Server error."}')
+    return ApiResponse(resp.status_code, response=resp)
+
+
+async def aapi_request(request, method, path, *, headers=None, params=None, json=None, timeout=None, stream=False):
+    method = method.upper()
+    if _transport() == "http":
+        client = get_async_client()
+        if stream:
+            req = client.build_request(
+                method, f"{API}{path}",
+                headers=headers, params=params, json=json, timeout=timeout,
+            )
+            return await client.send(req, stream=True)
+        return await client.request(
+            method, f"{API}{path}",
+            headers=headers, params=params, json=json, timeout=timeout,
+        )
+    return await _ainprocess(request, method, path, headers, params, json)
+
+
+async def aapi_get(request, path, **kwargs):
+    return await aapi_request(request, "GET", path, **kwargs)
+
+
+async def aapi_post(request, path, **kwargs):
+    return await aapi_request(request, "POST", path, **kwargs)
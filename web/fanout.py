@@ -0,0 +1,87 @@
+# web/fanout.py
+"""
+تشغيل نداءات الـ API المستقلة لنفس الصفحة بالتوازي.
+
+    results, errors = fan_out({
+        "lesson": lambda: api_get(request, ...),
+        "fav":    lambda: api_get(request, ...),
+    })
+
+- results[name] = القيمة اللى رجعت، errors[name] = الـ exception.
+- أى نداء ما خلصش قبل الـ deadline بيتحط فى errors كـ TimeoutError
+  (الـ thread بيكمل فى الخلفية بس الصفحة مش بتستناه).
+- الـ thread pool واحد لكل worker (مربوط بالـ pid عشان --preload).
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "WEB_FANOUT_WORKERS", 8),
+                    thread_name_prefix="web-fanout",
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def _run(fn):
+    # كل thread ليه DB connection خاص بيه؛ نقفله بعد النداء زى آخر الـ request
+    close_old_connections()
+    try:
+        return fn()
+    finally:
+        close_old_connections()
+
+
+def fan_out(calls, deadline=None):
+    """
+    calls: {name: callable بدون arguments}
+    deadline: أقصى وقت (ثوانى) للمجموعة كلها، الافتراضى WEB_FANOUT_DEADLINE.
+    بيرجّع (results, errors).
+    """
+    if deadline is None:
+        deadline = getattr(settings, "WEB_FANOUT_DEADLINE", 10)
+
+    results, errors = {}, {}
+    if not calls:
+        return results, errors
+
+    # نداء واحد مالوش لازمة للـ pool
+    if len(calls) == 1:
+        (name, fn), = calls.items()
+        try:
+            results[name] = fn()
+        except Exception as e:
+            errors[name] = e
+        return results, errors
+
+    executor = _get_executor()
+    futures = {executor.submit(_run, fn): name for name, fn in calls.items()}
+    done, not_done = wait(futures, timeout=deadline)
+
+    for fut in done:
+        name = futures[fut]
+        try:
+            results[name] = fut.result()
+        except Exception as e:
+            errors[name] = e
+
+    for fut in not_done:
+        fut.cancel()
+        errors[futures[fut]] = TimeoutError(f"'{futures[fut]}' exceeded {deadline}s")
+
+    return results, errors
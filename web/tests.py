@@ -1,3 +1,94 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
 
-# Create your tests here.
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, override_settings
+from rest_framework.response import Response
+
+from web.api_client import ApiResponse, api_get
+from web.fanout import fan_out
+
+
+class FanOutTests(SimpleTestCase):
+    def test_results_keyed_by_name_and_run_in_parallel(self):
+        started = threading.Barrier(3, timeout=2)   # يعدّى بس لو التلاتة شغالين فى نفس الوقت
+
+        def call(value):
+            def fn():
+                started.wait()
+                return value
+            return fn
+
+        results, errors = fan_out({"lesson": call(1), "fav": call(2), "progress": call(3)}, deadline=5)
+        self.assertEqual(results, {"lesson": 1, "fav": 2, "progress": 3})
+        self.assertEqual(errors, {})
+
+    def test_slow_call_times_out_without_holding_the_page(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        t0 = time.monotonic()
+        results, errors = fan_out({"fast": lambda: "ok", "slow": lambda: release.wait(5)}, deadline=0.2)
+        self.assertLess(time.monotonic() - t0, 2)
+        self.assertEqual(results, {"fast": "ok"})
+        self.assertIsInstance(errors["slow"], TimeoutError)
+        self.assertIn("'slow'", str(errors["slow"]))
+
+    def test_exceptions_returned_per_call(self):
+        def boom():
+            raise ValueError("api down")
+
+        results, errors = fan_out({"ok": lambda: 1, "bad": boom}, deadline=5)
+        self.assertEqual(results, {"ok": 1})
+        self.assertIsInstance(errors["bad"], ValueError)
+
+        results, errors = fan_out({"bad": boom})   # نداء واحد من غير الـ pool
+        self.assertEqual(results, {})
+        self.assertEqual(str(errors["bad"]), "api down")
+
+    def test_no_calls(self):
+        self.assertEqual(fan_out({}), ({}, {}))
+
+
+class ApiResponseTests(SimpleTestCase):
+    def test_status_and_ok(self):
+        self.assertTrue(ApiResponse(201, response=HttpResponse(status=201)).ok)
+        self.assertFalse(ApiResponse(404, content=b"{}").ok)
+
+    def test_json_reads_drf_data_without_render(self):
+        resp = Response({"detail": "ok"})
+        self.assertEqual(ApiResponse(200, response=resp).json(), {"detail": "ok"})
+        self.assertFalse(resp.is_rendered)
+
+    def test_json_text_and_content_from_body(self):
+        resp = ApiResponse(200, response=JsonResponse({"name": "أحمد"}))
+        self.assertEqual(resp.json(), {"name": "أحمد"})
+        self.assertIn("name", resp.text)
+        with self.assertRaises(ValueError):
+            ApiResponse(204, content=b"").json()
+
+    def test_iter_content_streams_chunks(self):
+        streaming = ApiResponse(200, response=StreamingHttpResponse(iter([b"data: 1\n\n", b"data: 2\n\n"])))
+        self.assertEqual(list(streaming.iter_content()), [b"data: 1\n\n", b"data: 2\n\n"])
+        self.assertEqual(list(ApiResponse(200, response=HttpResponse(b"whole")).iter_content()), [b"whole"])
+
+    def test_aiter_bytes_streams_async_chunks(self):
+        async def events():
+            for i in range(3):
+                yield f"data: {i}\n\n".encode()
+
+        async def collect(resp):
+            chunks = [chunk async for chunk in resp.aiter_bytes()]
+            await resp.aclose()
+            return chunks
+
+        streaming = ApiResponse(200, response=StreamingHttpResponse(events()))
+        self.assertEqual(asyncio.run(collect(streaming)), [b"data: 0\n\n", b"data: 1\n\n", b"data: 2\n\n"])
+        self.assertEqual(asyncio.run(collect(ApiResponse(200, content=b"whole"))), [b"whole"])
+
+    @override_settings(WEB_API_TRANSPORT="inprocess")
+    def test_unknown_path_is_404(self):
+        resp = api_get(None, "/v1/does-not-exist/")
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.json(), {"detail": "Not found."})
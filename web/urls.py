@@ -101,6 +101,8 @@ urlpatterns = [
     
     # AI
     path("ai/ask/", views.web_ai_ask, name="web_ai_ask"),
+    path("ai/ask/stream/", views.web_ai_ask_stream, name="web_ai_ask_stream"),
+    path("ai/ask/async/", views.web_ai_ask_async, name="web_ai_ask_async"),
 
 
 
@@ -1,14 +1,17 @@
-import uuid, requests
+import uuid
 from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.template.loader import render_to_string
-from django.http import HttpResponse,JsonResponse
+from django.http import HttpResponse,JsonResponse,StreamingHttpResponse
 from django.views.decorators.http import require_POST,require_GET,require_http_methods
 from django.utils import timezone
 from datetime import datetime
 import json
 from django.contrib.auth import authenticate, login, logout
+from .api_client import api_get, api_post, api_put, api_delete, aapi_post
+from asgiref.sync import sync_to_async
+from .fanout import fan_out
 
 
 
@@ -16,9 +19,6 @@ from django.contrib.auth import authenticate, login, logout
 def landing_page(request):
     return render(request,"landing_page.html")
 
-API = settings.BASE_API_URL
-
-
 def _ensure_device_id(request):
     if "device_id" not in request.session:
         request.session["device_id"] = settings.WEB_DEVICE_ID or f"web-{uuid.uuid4()}"
@@ -47,7 +47,7 @@ def register_view(request):
         }
         r = None
         try:
-            r = requests.post(f"{API}/auth/register/", json=payload, timeout=10)
+            r = api_post(request, "/auth/register/", json=payload, timeout=10)
         except Exception:
             messages.error(request, "Could not reach the server.")
             return render(request, "pages/register.html", {"form": payload})
@@ -81,8 +81,9 @@ def login_view(request):
         device_id = _ensure_device_id(request)  # ensure same device ID
 
         try:
-            r = requests.post(
-                f"{API}/auth/login/",
+            r = api_post(
+                request,
+                "/auth/login/",
                 json={"username": username, "password": password, "device_id": device_id},
                 timeout=8,
             )
@@ -133,13 +134,19 @@ def home(request):
     if not _require_auth(request):
         return redirect("web_login")
 
+    headers = _headers(request)
+    results, _ = fan_out({
+        "me": lambda: api_get(request, "/auth/me/", headers=headers, timeout=8),
+        "dashboard": lambda: api_get(request, "/v1/edu/dashboard/home/", headers=headers, timeout=8),
+    })
+
     # ---- 1) بياناتى (اسم + الخطة) من /auth/me/ زى ما هى ----
     me = {}
     try:
-        r = requests.get(f"{API}/auth/me/", headers=_headers(request), timeout=8)
-        if r.status_code == 200:
+        r = results.get("me")
+        if r is not None and r.status_code == 200:
             me = r.json()
-        elif r.status_code == 401:
+        elif r is not None and r.status_code == 401:
             return redirect("web_login")
     except Exception:
         pass
@@ -157,12 +164,8 @@ def home(request):
 
     # ---- 3) نداء واحد للـ dashboard ----
     try:
-        r = requests.get(
-            f"{API}/v1/edu/dashboard/home/",
-            headers=_headers(request),
-            timeout=8,
-        )
-        if r.status_code == 200:
+        r = results.get("dashboard")
+        if r is not None and r.status_code == 200:
             js = r.json()
             streak = js.get("streak", streak)
             study_today_min = js.get("study_today_min", study_today_min)
@@ -173,7 +176,7 @@ def home(request):
             fav_lessons_total = js.get("fav_lessons_total", fav_lessons_total)
             flashcards_reviewed = js.get("flashcards_reviewed", flashcards_reviewed)
             last_lesson = js.get("last_lesson", last_lesson)
-        elif r.status_code == 401:
+        elif r is not None and r.status_code == 401:
             return redirect("web_login")
     except Exception:
         pass
@@ -217,8 +220,9 @@ def web_favorite_lessons(request):
     items = []
 
     try:
-        r = requests.get(
-            f"{API}/v1/edu/favorites/lessons/?limit={page_size}&offset={offset}",
+        r = api_get(
+            request,
+            f"/v1/edu/favorites/lessons/?limit={page_size}&offset={offset}",
             headers=_headers(request),
             timeout=8,
         )
@@ -254,8 +258,9 @@ def web_done_lessons(request):
     # 1) هات IDs الدروس اللى متعلِّم عليها done
     ids = []
     try:
-        r = requests.get(
-            f"{API}/v1/edu/lessons/progress/ids/",
+        r = api_get(
+            request,
+            "/v1/edu/lessons/progress/ids/",
             headers=_headers(request),
             timeout=8,
         )
@@ -267,15 +272,16 @@ def web_done_lessons(request):
 
     lessons = []
 
-    # 2) لو فيه IDs هات تفاصيل كل درس
+    # 2) لو فيه IDs هات تفاصيل كل درس (بالتوازي، والترتيب زى الـ ids)
+    headers = _headers(request)
+    results, _ = fan_out({
+        lid: (lambda lid=lid: api_get(request, f"/v1/edu/lessons/{lid}/", headers=headers, timeout=8))
+        for lid in ids
+    })
     for lid in ids:
         try:
-            lr = requests.get(
-                f"{API}/v1/edu/lessons/{lid}/",
-                headers=_headers(request),
-                timeout=8,
-            )
-            if lr.status_code == 200:
+            lr = results.get(lid)
+            if lr is not None and lr.status_code == 200:
                 lessons.append(lr.json())
         except Exception:
             continue
@@ -306,7 +312,7 @@ def favorite_lesson_toggle(request, lesson_id: int):
     # 1) اعرف هل الدرس مفضّل حاليًا
     is_fav = False
     try:
-        rf = requests.get(f"{API}/v1/edu/favorites/lessons/ids/", headers=headers, timeout=6)
+        rf = api_get(request, "/v1/edu/favorites/lessons/ids/", headers=headers, timeout=6)
         if rf.status_code == 200:
             ids = set(rf.json().get("ids", []))
             is_fav = int(lesson_id) in ids
@@ -317,15 +323,17 @@ def favorite_lesson_toggle(request, lesson_id: int):
     try:
         if is_fav:
             # إزالة
-            requests.delete(
-                f"{API}/v1/edu/favorites/lessons/remove/?lesson={int(lesson_id)}",
+            api_delete(
+                request,
+                f"/v1/edu/favorites/lessons/remove/?lesson={int(lesson_id)}",
                 headers=headers, timeout=6
             )
             is_fav = False
         else:
             # إضافة
-            requests.post(
-                f"{API}/v1/edu/favorites/lessons/add/",
+            api_post(
+                request,
+                "/v1/edu/favorites/lessons/add/",
                 headers=headers, json={"lesson": int(lesson_id)}, timeout=6
             )
             is_fav = True
@@ -353,8 +361,9 @@ def mark_lesson_done(request, lesson_id: int):
         return HttpResponse('<span class="text-danger small">Auth required</span>', status=401)
 
     try:
-        r = requests.post(
-            f"{API}/v1/edu/lessons/{lesson_id}/progress/done/",
+        r = api_post(
+            request,
+            f"/v1/edu/lessons/{lesson_id}/progress/done/",
             headers=_headers(request),
             timeout=8
         )
@@ -406,12 +415,12 @@ def materials_home(request):
         params.append(f"part_type={part_type}")
     qs = "&".join(params)
 
-    url = f"{API}/v1/edu/materials/home/"
+    url = "/v1/edu/materials/home/"
     if qs:
         url = f"{url}?{qs}"
 
     try:
-        r = requests.get(url, headers=headers, timeout=8)
+        r = api_get(request, url, headers=headers, timeout=8)
         if r.status_code == 200:
             js = r.json() or {}
             year_me   = js.get("year_me") or {}
@@ -498,16 +507,26 @@ def materials_lesson(request, lesson_id: int):
 
     headers = _headers(request)
 
+    # التلات نداءات مستقلين عن بعض → بالتوازي
+    results, errors = fan_out({
+        "lesson": lambda: api_get(request, f"/v1/edu/lessons/{lesson_id}/", headers=headers, timeout=10),
+        "fav": lambda: api_get(request, "/v1/edu/favorites/lessons/ids/", headers=headers, timeout=8),
+        "progress": lambda: api_get(
+            request,
+            f"/v1/edu/lessons/progress/count/?lesson_id={lesson_id}",
+            headers=headers, timeout=8
+        ),
+    })
+
     # 1) تفاصيل الدرس
     lesson = None
     limited = False     # لو 402
     block_msg = None    # رسالة المنع عند 402
 
-    try:
-        r = requests.get(f"{API}/v1/edu/lessons/{lesson_id}/", headers=headers, timeout=10)
-    except Exception:
+    if "lesson" in errors:
         messages.error(request, "Unable to reach server.")
         return redirect("web_materials_home")
+    r = results["lesson"]
 
     if r.status_code == 200:
         lesson = r.json() or {}
@@ -529,8 +548,8 @@ def materials_lesson(request, lesson_id: int):
     # 2) حالة المفضلة (IDs)
     favorite_ids = []
     try:
-        rf = requests.get(f"{API}/v1/edu/favorites/lessons/ids/", headers=headers, timeout=8)
-        if rf.status_code == 200:
+        rf = results.get("fav")
+        if rf is not None and rf.status_code == 200:
             favorite_ids = rf.json().get("ids", []) or []
     except Exception:
         pass
@@ -539,11 +558,8 @@ def materials_lesson(request, lesson_id: int):
     # 3) حالة “تم الإنجاز”
     is_done = False
     try:
-        rp = requests.get(
-            f"{API}/v1/edu/lessons/progress/count/?lesson_id={lesson_id}",
-            headers=headers, timeout=8
-        )
-        if rp.status_code == 200:
+        rp = results.get("progress")
+        if rp is not None and rp.status_code == 200:
             is_done = (rp.json().get("count") or 0) > 0
     except Exception:
         pass
@@ -602,10 +618,10 @@ def lesson_questions_list(request, lesson_id: int):
         return HttpResponse(html, status=200)
 
     # من هنا فقط نطلب الـAPI
-    api_url = f"{API}/v1/edu/questions/?lesson_id={lesson_id}&limit={limit}&offset={offset}&question_type={qtype}"
+    api_url = f"/v1/edu/questions/?lesson_id={lesson_id}&limit={limit}&offset={offset}&question_type={qtype}"
 
     try:
-        r = requests.get(api_url, headers=_headers(request), timeout=10)
+        r = api_get(request, api_url, headers=_headers(request), timeout=10)
         if r.status_code != 200:
             html = "<div class='alert alert-secondary'>No questions.</div>" if mode=="panel" else ""
             return HttpResponse(html, status=r.status_code)
@@ -655,8 +671,9 @@ def question_detail_htmx(request, pk: int):
         return HttpResponse("Auth", status=401)
 
     try:
-        r = requests.get(
-            f"{API}/v1/edu/questions/{pk}/",
+        r = api_get(
+            request,
+            f"/v1/edu/questions/{pk}/",
             headers=_headers(request),
             timeout=10,
         )
@@ -696,16 +713,20 @@ def web_question_attempt(request, pk: int):
     if "is_correct" in request.POST:
         payload["is_correct"] = request.POST.get("is_correct") in ("1","true","True")
 
-    try:
-        r = requests.post(f"{API}/v1/edu/questions/{pk}/attempt/",
-                          json=payload, headers=_headers(request), timeout=8)
-    except Exception:
+    # الـ attempt وتفاصيل السؤال (علشان الخيارات للناتج) مع بعض
+    headers = _headers(request)
+    results, errors = fan_out({
+        "attempt": lambda: api_post(request, f"/v1/edu/questions/{pk}/attempt/",
+                                    json=payload, headers=headers, timeout=8),
+        "question": lambda: api_get(request, f"/v1/edu/questions/{pk}/",
+                                    headers=headers, timeout=8),
+    })
+    if "attempt" in errors:
         return HttpResponse('<div class="alert alert-danger">Network error.</div>')
+    r = results["attempt"]
 
-    # هات تفاصيل السؤال علشان الخيارات للناتج
-    rd = requests.get(f"{API}/v1/edu/questions/{pk}/",
-                      headers=_headers(request), timeout=8)
-    q = rd.json() if rd.status_code==200 else {"options":[]}
+    rd = results.get("question")
+    q = rd.json() if rd is not None and rd.status_code==200 else {"options":[]}
 
     if r.status_code not in (200,201):
         return HttpResponse('<div class="alert alert-danger">Submit failed.</div>')
@@ -727,15 +748,19 @@ def web_question_attempt(request, pk: int):
 def web_question_reveal(request, pk: int):
     if not _require_auth(request): return HttpResponse(status=401)
 
-    try:
-        r = requests.get(f"{API}/v1/edu/questions/{pk}/reveal/",
-                         headers=_headers(request), timeout=8)
-    except Exception:
+    headers = _headers(request)
+    results, errors = fan_out({
+        "reveal": lambda: api_get(request, f"/v1/edu/questions/{pk}/reveal/",
+                                  headers=headers, timeout=8),
+        "question": lambda: api_get(request, f"/v1/edu/questions/{pk}/",
+                                    headers=headers, timeout=8),
+    })
+    if "reveal" in errors:
         return HttpResponse('<div class="alert alert-danger">Network error.</div>')
+    r = results["reveal"]
 
-    rd = requests.get(f"{API}/v1/edu/questions/{pk}/",
-                      headers=_headers(request), timeout=8)
-    q = rd.json() if rd.status_code==200 else {"options":[]}
+    rd = results.get("question")
+    q = rd.json() if rd is not None and rd.status_code==200 else {"options":[]}
 
     if r.status_code != 200:
         return HttpResponse('<div class="alert alert-danger">Reveal failed.</div>')
@@ -760,14 +785,20 @@ def web_question_reveal(request, pk: int):
 def web_flashcards_panel(request, lesson_id: int):
     mine = request.GET.get("mine") in ("1", "true", "True")
 
-    url = f"{API}/v1/edu/flashcards/?lesson_id={lesson_id}"
+    url = f"/v1/edu/flashcards/?lesson_id={lesson_id}"
     if mine:
         url += "&mine=1"
 
+    headers = _headers(request)
+    results, _ = fan_out({
+        "flashcards": lambda: api_get(request, url, headers=headers, timeout=8),
+        "me": lambda: api_get(request, "/auth/me/", headers=headers, timeout=8),
+    })
+
     flashcards = []
     try:
-        r = requests.get(url, headers=_headers(request), timeout=8)
-        if r.status_code == 200:
+        r = results.get("flashcards")
+        if r is not None and r.status_code == 200:
             flashcards = r.json() or []
     except Exception:
         flashcards = []
@@ -775,8 +806,8 @@ def web_flashcards_panel(request, lesson_id: int):
     # تحقق من صلاحية إنشاء فلاش كاردز حسب خطة المستخدم
     can_create = False
     try:
-        me_r = requests.get(f"{API}/auth/me/", headers=_headers(request), timeout=8)
-        if me_r.status_code == 200:
+        me_r = results.get("me")
+        if me_r is not None and me_r.status_code == 200:
             me = me_r.json() or {}
             class _MeProxy:
                 pass
@@ -820,7 +851,7 @@ def web_flashcards_create(request, lesson_id: int):
         "owner_type": "user",
     }
     try:
-        r = requests.post(f"{API}/v1/edu/flashcards/", json=payload, headers=_headers(request), timeout=8)
+        r = api_post(request, "/v1/edu/flashcards/", json=payload, headers=_headers(request), timeout=8)
     except Exception:
         return HttpResponse('<div class="alert alert-danger">Network error.</div>', status=502)
 
@@ -845,8 +876,9 @@ def web_flashcards_create(request, lesson_id: int):
 @require_http_methods(["DELETE"])
 def web_flashcard_delete(request, pk: int):
     try:
-        r = requests.delete(
-            f"{API}/v1/edu/flashcards/{pk}/",
+        r = api_delete(
+            request,
+            f"/v1/edu/flashcards/{pk}/",
             headers=_headers(request),
             timeout=8,
         )
@@ -882,8 +914,9 @@ def web_flashcard_update(request, pk: int):
 
     # PUT على الـ API
     try:
-        r = requests.put(
-            f"{API}/v1/edu/flashcards/{pk}/",
+        r = api_put(
+            request,
+            f"/v1/edu/flashcards/{pk}/",
             json=payload,
             headers=_headers(request),
             timeout=8,
@@ -946,8 +979,9 @@ def pomodoro_log(request):
     }
 
     try:
-        r = requests.post(
-            f"{API}/v1/track/sessions/",
+        r = api_post(
+            request,
+            "/v1/track/sessions/",
             headers=_headers(request),
             json=payload,
             timeout=8,
@@ -972,7 +1006,7 @@ def web_questions_browse(request):
     # Try to decide using API session (accurate for token-based auth)
     can_q = False
     try:
-        r = requests.get(f"{API}/auth/me/", headers=_headers(request), timeout=8)
+        r = api_get(request, "/auth/me/", headers=_headers(request), timeout=8)
         if r.status_code == 200:
             me = r.json() or {}
             # Minimal proxy object with just the fields policy needs
@@ -1032,7 +1066,7 @@ def _q_int(v, d=0, lo=None, hi=None):
 def q_nav_semesters(request):
     semesters = []
     try:
-        r = requests.get(f"{API}/v1/edu/semesters/", headers=_headers(request), timeout=8)
+        r = api_get(request, "/v1/edu/semesters/", headers=_headers(request), timeout=8)
         semesters = _json_list(r)
     except Exception:
         semesters = []
@@ -1050,8 +1084,9 @@ def q_nav_modules(request):
     modules = []
     if sem_id:
         try:
-            r = requests.get(
-                f"{API}/v1/edu/modules/?semester_id={sem_id}",
+            r = api_get(
+                request,
+                f"/v1/edu/modules/?semester_id={sem_id}",
                 headers=_headers(request),
                 timeout=8,
             )
@@ -1172,12 +1207,12 @@ def q_panel_years(request):
     if module_id:
         # نحاول نجيبها من الـ API
         try:
-            url = f"{API}/v1/edu/exam-years/?module_id={module_id}"
+            url = f"/v1/edu/exam-years/?module_id={module_id}"
             if source:
                 url += f"&source={source}"
             if kind:
                 url += f"&exam_kind={kind}"
-            r = requests.get(url, headers=_headers(request), timeout=8)
+            r = api_get(request, url, headers=_headers(request), timeout=8)
             data = r.json() if r.status_code == 200 else []
             # نتوقع يرجّع list عادية
             if isinstance(data, list):
@@ -1225,8 +1260,9 @@ def q_panel_subjects(request):
 
     if mid:
         try:
-            r = requests.get(
-                f"{API}/v1/edu/subjects/?module_id={mid}",
+            r = api_get(
+                request,
+                f"/v1/edu/subjects/?module_id={mid}",
                 headers=_headers(request),
                 timeout=8,
             )
@@ -1281,14 +1317,18 @@ def q_panel_chapters(request):
     subject_name = "Chapters"
 
     if subject_id:
+        headers = _headers(request)
+        results, _ = fan_out({
+            "subject": lambda: api_get(request, f"/v1/edu/subjects/{subject_id}/",
+                                       headers=headers, timeout=8),
+            "chapters": lambda: api_get(request, f"/v1/edu/chapters/?subject_id={subject_id}",
+                                        headers=headers, timeout=8),
+        })
+
         # اسم المادة
         try:
-            rs = requests.get(
-                f"{API}/v1/edu/subjects/{subject_id}/",
-                headers=_headers(request),
-                timeout=8,
-            )
-            if rs.status_code == 200:
+            rs = results.get("subject")
+            if rs is not None and rs.status_code == 200:
                 sd = rs.json()
                 subject_name = sd.get("name") or subject_name
         except Exception:
@@ -1296,12 +1336,8 @@ def q_panel_chapters(request):
 
         # chapters
         try:
-            rc = requests.get(
-                f"{API}/v1/edu/chapters/?subject_id={subject_id}",
-                headers=_headers(request),
-                timeout=8,
-            )
-            chapters = _json_list(rc)
+            rc = results.get("chapters")
+            chapters = _json_list(rc) if rc is not None else []
         except Exception:
             chapters = []
 
@@ -1326,14 +1362,20 @@ def q_panel_lessons(request):
     chapter_name = "Lessons"
 
     if chapter_id:
+        url = f"/v1/edu/lessons/?chapter_id={chapter_id}"
+        if part_type in ("theoretical", "practical"):
+            url += f"&part_type={part_type}"
+        headers = _headers(request)
+        results, _ = fan_out({
+            "chapter": lambda: api_get(request, f"/v1/edu/chapters/{chapter_id}/",
+                                       headers=headers, timeout=8),
+            "lessons": lambda: api_get(request, url, headers=headers, timeout=8),
+        })
+
         # اسم الشابتر
         try:
-            rc = requests.get(
-                f"{API}/v1/edu/chapters/{chapter_id}/",
-                headers=_headers(request),
-                timeout=8,
-            )
-            if rc.status_code == 200:
+            rc = results.get("chapter")
+            if rc is not None and rc.status_code == 200:
                 cd = rc.json()
                 chapter_name = cd.get("title") or chapter_name
         except Exception:
@@ -1341,11 +1383,8 @@ def q_panel_lessons(request):
 
         # الدروس
         try:
-            url = f"{API}/v1/edu/lessons/?chapter_id={chapter_id}"
-            if part_type in ("theoretical", "practical"):
-                url += f"&part_type={part_type}"
-            rl = requests.get(url, headers=_headers(request), timeout=8)
-            lessons = _json_list(rl)
+            rl = results.get("lessons")
+            lessons = _json_list(rl) if rl is not None else []
         except Exception:
             lessons = []
 
@@ -1426,7 +1465,7 @@ def web_questions_list(request):
         return HttpResponse(html, status=200)
 
     # 2) لو اختار نوع السؤال → نطلب الـ API عادي
-    base = f"{API}/v1/edu/questions/?limit={limit}&offset={offset}&question_type={qtype}"
+    base = f"/v1/edu/questions/?limit={limit}&offset={offset}&question_type={qtype}"
 
     if subject_id:
         base += f"&subject_id={subject_id}"
@@ -1446,7 +1485,7 @@ def web_questions_list(request):
         base += "&incorrect_only=1"
 
     try:
-        r = requests.get(base, headers=_headers(request), timeout=10)
+        r = api_get(request, base, headers=_headers(request), timeout=10)
         if r.status_code != 200:
             err = "<div class='alert alert-secondary'>No questions.</div>" if mode == "panel" else ""
             return HttpResponse(err, status=200 if mode == "panel" else r.status_code)
@@ -1542,7 +1581,7 @@ def planner_tasks_htmx(request):
     date_str = request.GET.get("date")  # بصيغة YYYY-MM-DD
     tasks = []
     try:
-        r = requests.get(f"{API}/v1/edu/planner/tasks/", headers=_headers(request), timeout=8)
+        r = api_get(request, "/v1/edu/planner/tasks/", headers=_headers(request), timeout=8)
         if r.status_code == 200:
             tasks = r.json() or []
     except Exception:
@@ -1577,8 +1616,9 @@ def planner_task_create_htmx(request):
         payload["due_date"] = due_date
 
     try:
-        r = requests.post(
-            f"{API}/v1/edu/planner/tasks/",
+        r = api_post(
+            request,
+            "/v1/edu/planner/tasks/",
             json=payload,
             headers=_headers(request),
             timeout=8,
@@ -1598,7 +1638,7 @@ def planner_task_toggle_htmx(request, pk):
     # هنجيب التاسك علشان نعرف حالته الحالية
     try:
         # مافيش endpoint get للواحد، فهنجيب الكل ونفلتر
-        r = requests.get(f"{API}/v1/edu/planner/tasks/", headers=_headers(request), timeout=8)
+        r = api_get(request, "/v1/edu/planner/tasks/", headers=_headers(request), timeout=8)
         tasks = r.json() if r.status_code == 200 else []
         task = next((t for t in tasks if t.get("id") == pk), None)
     except Exception:
@@ -1609,13 +1649,13 @@ def planner_task_toggle_htmx(request, pk):
 
     is_done = task.get("is_done")
     url = (
-        f"{API}/v1/edu/planner/tasks/{pk}/undone/"
+        f"/v1/edu/planner/tasks/{pk}/undone/"
         if is_done
-        else f"{API}/v1/edu/planner/tasks/{pk}/done/"
+        else f"/v1/edu/planner/tasks/{pk}/done/"
     )
 
     try:
-        requests.post(url, headers=_headers(request), timeout=8)
+        api_post(request, url, headers=_headers(request), timeout=8)
     except Exception:
         pass
 
@@ -1631,8 +1671,9 @@ def planner_task_delete_htmx(request, pk):
     if not _require_auth(request):
         return HttpResponse("Auth", status=401)
     try:
-        requests.delete(
-            f"{API}/v1/edu/planner/tasks/{pk}/",
+        api_delete(
+            request,
+            f"/v1/edu/planner/tasks/{pk}/",
             headers=_headers(request),
             timeout=8,
         )
@@ -1669,7 +1710,7 @@ def web_profile(request):
 
     me = {}
     try:
-        r = requests.get(f"{API}/auth/me/", headers=_headers(request), timeout=8)
+        r = api_get(request, "/auth/me/", headers=_headers(request), timeout=8)
         if r.status_code == 200:
             me = r.json() or {}
     except Exception:
@@ -1719,22 +1760,29 @@ def web_plans(request):
     if not _require_auth(request):
         return redirect("web_login")
 
-    # 1) هات بيانات اليوزر عشان نعرف هو على انهى خطة
+    # بيانات اليوزر (عشان نعرف هو على انهى خطة) والباقات مع بعض
+    headers = _headers(request)
+    results, _ = fan_out({
+        "me": lambda: api_get(request, "/auth/me/", headers=headers, timeout=8),
+        "plans": lambda: api_get(request, "/plans/", timeout=8),
+    })
+
+    # 1) بيانات اليوزر
     me = {}
     try:
-        r = requests.get(f"{API}/auth/me/", headers=_headers(request), timeout=8)
-        if r.status_code == 200:
+        r = results.get("me")
+        if r is not None and r.status_code == 200:
             me = r.json() or {}
     except Exception:
         me = {}
     me_plan = (me.get("plan") or "").lower()
     me_active = bool(me.get("is_active_subscription"))
 
-    # 2) هات الباقات
+    # 2) الباقات
     plans = []
     try:
-        r = requests.get(f"{API}/plans/", timeout=8)
-        if r.status_code == 200:
+        r = results.get("plans")
+        if r is not None and r.status_code == 200:
             plans = (r.json() or {}).get("plans", []) or []
     except Exception:
         plans = []
@@ -1762,8 +1810,9 @@ def web_plans_purchase(request):
         return HttpResponse("<div class='alert alert-danger'>Plan code is required.</div>", status=400)
 
     try:
-        r = requests.post(
-            f"{API}/subscriptions/purchase/",
+        r = api_post(
+            request,
+            "/subscriptions/purchase/",
             json={"plan_code": plan_code, "coupon_code": coupon},
             headers=_headers(request),
             timeout=10,
@@ -1793,8 +1842,9 @@ def web_plans_start_trial(request):
     plan_code = (request.POST.get("plan_code") or "basic").strip()
 
     try:
-        r = requests.post(
-            f"{API}/subscriptions/start-trial/",
+        r = api_post(
+            request,
+            "/subscriptions/start-trial/",
             json={"plan_code": plan_code},
             headers=_headers(request),
             timeout=10,
@@ -1829,7 +1879,7 @@ def web_payment_page(request):
 
     # هات الباقات من API
     try:
-        r = requests.get(f"{API}/plans/", timeout=8)
+        r = api_get(request, "/plans/", timeout=8)
     except Exception:
         return HttpResponse("Network error", status=502)
 
@@ -1884,8 +1934,9 @@ def web_payment_confirm(request):
     }
 
     try:
-        r = requests.post(
-            f"{API}/payments/create/",
+        r = api_post(
+            request,
+            "/payments/create/",
             json=payload,
             headers=_headers(request),
             timeout=10,
@@ -1933,8 +1984,9 @@ def web_coupon_validate(request):
         return JsonResponse({"ok": False, "message": "Please enter a coupon code."}, status=200)
 
     try:
-        r = requests.get(
-            f"{API}/coupons/validate/",
+        r = api_get(
+            request,
+            "/coupons/validate/",
             params={"code": code, "plan_code": plan_code},
             headers=_headers(request),
             timeout=8,
@@ -1976,7 +2028,7 @@ def fc_nav_semesters(request):
 
     semesters = []
     try:
-        r = requests.get(f"{API}/v1/edu/semesters/", headers=_headers(request), timeout=8)
+        r = api_get(request, "/v1/edu/semesters/", headers=_headers(request), timeout=8)
         if r.status_code == 200:
             semesters = _json_list(r)
     except Exception:
@@ -1997,8 +2049,9 @@ def fc_nav_modules(request):
     modules = []
     if sem_id:
         try:
-            r = requests.get(
-                f"{API}/v1/edu/modules/?semester_id={sem_id}",
+            r = api_get(
+                request,
+                f"/v1/edu/modules/?semester_id={sem_id}",
                 headers=_headers(request),
                 timeout=8,
             )
@@ -2026,8 +2079,9 @@ def fc_panel_subjects(request):
     if module_id:
         # المواد
         try:
-            r = requests.get(
-                f"{API}/v1/edu/subjects/?module_id={module_id}",
+            r = api_get(
+                request,
+                f"/v1/edu/subjects/?module_id={module_id}",
                 headers=_headers(request),
                 timeout=8,
             )
@@ -2060,8 +2114,9 @@ def fc_panel_chapters(request):
 
     if subject_id:
         try:
-            r = requests.get(
-                f"{API}/v1/edu/chapters/?subject_id={subject_id}",
+            r = api_get(
+                request,
+                f"/v1/edu/chapters/?subject_id={subject_id}",
                 headers=_headers(request),
                 timeout=8,
             )
@@ -2101,9 +2156,10 @@ def fc_panel_lessons(request):
     if chapter_id:
         try:
             # نادى على نفس API اللى كنت بتجربه فى البراوزر
-            url = f"{API}/v1/edu/lessons/?chapter_id={chapter_id}"
+            url = f"/v1/edu/lessons/?chapter_id={chapter_id}"
 
-            rl = requests.get(
+            rl = api_get(
+                request,
                 url,
                 headers=_headers(request),
                 timeout=8,
@@ -2154,30 +2210,34 @@ def fc_panel_flashcards(request):
     if not lesson_id:
         return HttpResponse("<div class='alert alert-secondary'>No lesson selected.</div>")
 
+    # الدرس + الفلاش كاردز + /auth/me مع بعض
+    headers = _headers(request)
+    results, errors = fan_out({
+        "lesson": lambda: api_get(request, f"/v1/edu/lessons/{lesson_id}/",
+                                  headers=headers, timeout=8),
+        "flashcards": lambda: api_get(request, f"/v1/edu/flashcards/?lesson_id={lesson_id}",
+                                      headers=headers, timeout=10),
+        "me": lambda: api_get(request, "/auth/me/", headers=headers, timeout=8),
+    })
+
     # اسم الدرس بدل Lesson ID
     lesson_name = "Lesson"
     try:
-        rl = requests.get(
-            f"{API}/v1/edu/lessons/{lesson_id}/",
-            headers=_headers(request),
-            timeout=8,
-        )
-        if rl.status_code == 200:
+        rl = results.get("lesson")
+        if rl is not None and rl.status_code == 200:
             ld = rl.json() or {}
             lesson_name = ld.get("title") or ld.get("name") or lesson_name
     except Exception:
         pass
 
-    # هات الفلاش كاردز من الـ API
+    # الفلاش كاردز
     admin_cards = []
     my_cards = []
 
     try:
-        r = requests.get(
-            f"{API}/v1/edu/flashcards/?lesson_id={lesson_id}",
-            headers=_headers(request),
-            timeout=10,
-        )
+        if "flashcards" in errors:
+            raise errors["flashcards"]
+        r = results["flashcards"]
         if r.status_code == 200:
             items = r.json() or []
             if isinstance(items, dict):
@@ -2193,8 +2253,8 @@ def fc_panel_flashcards(request):
     # Derive plan/subscription from /auth/me for token-only sessions
     can_create = False
     try:
-        me_r = requests.get(f"{API}/auth/me/", headers=_headers(request), timeout=8)
-        if me_r.status_code == 200:
+        me_r = results.get("me")
+        if me_r is not None and me_r.status_code == 200:
             me = me_r.json() or {}
             class _MeProxy:
                 pass
@@ -2233,7 +2293,7 @@ def web_flashcards_create_browse(request, lesson_id: int):
     # Decide eligibility using /auth/me to support token-only sessions
     allowed = False
     try:
-        me_r = requests.get(f"{API}/auth/me/", headers=_headers(request), timeout=8)
+        me_r = api_get(request, "/auth/me/", headers=_headers(request), timeout=8)
         if me_r.status_code == 200:
             me = me_r.json() or {}
             class _MeProxy:
@@ -2275,8 +2335,9 @@ def web_flashcards_create_browse(request, lesson_id: int):
 
     # ننده على API الإنشاء
     try:
-        r = requests.post(
-            f"{API}/v1/edu/flashcards/",
+        r = api_post(
+            request,
+            "/v1/edu/flashcards/",
             json=payload,
             headers=_headers(request),
             timeout=8,
@@ -2335,6 +2396,29 @@ def web_flashcards_create_browse(request, lesson_id: int):
 
 
 
+def _ai_body(request, q):
+    """
+    الواجهة بتبعت conversation_id (المحادثة محفوظة عند الـ API) والسؤال بس؛
+    من غيره بنعدّى الـ history القديمة زى ما هى.
+    """
+    if "conversation_id" in request.POST:
+        return {"q": q, "conversation_id": request.POST.get("conversation_id", "")}
+    try:
+        history = json.loads(request.POST.get("history", "[]"))
+    except Exception:
+        history = []
+    return {"q": q, "history": history}
+
+
+def _ai_headers(headers):
+    """
+    الـ API بيوقف Gemini قبل AI_WEB_BUDGET_MS ويرد ai_unavailable (رسالة لطيفة)،
+    فاحنا بنستنى الميزانية + ثانيتين بدل ما الـ worker يفضل مستنى.
+    """
+    budget_ms = getattr(settings, "AI_WEB_BUDGET_MS", 25000)
+    return {**headers, "X-Request-Budget-Ms": str(budget_ms)}, budget_ms / 1000 + 2
+
+
 def web_ai_ask(request):
     if request.method != "POST":
         return JsonResponse({"ok": False, "error": "Method not allowed"}, status=405)
@@ -2346,30 +2430,60 @@ def web_ai_ask(request):
     if not q:
         return JsonResponse({"ok": False, "error": "Please type your question."}, status=200)
 
-    # استقبل history من الواجهة
-    history_raw = request.POST.get("history", "[]")
+    headers, timeout = _ai_headers(_headers(request))
     try:
-        history = json.loads(history_raw)
+        r = api_post(
+            request,
+            "/v1/ask/simple/",
+            json=_ai_body(request, q),
+            headers=headers,
+            timeout=timeout,
+        )
     except Exception:
-        history = []
+        return JsonResponse({"ok": False, "error": "Network error. Please try again."}, status=200)
+
+    if r.status_code == 200:
+        js = r.json() or {}
+        return JsonResponse({"ok": True, "answer": js.get("answer", ""),
+                             "conversation_id": js.get("conversation_id")}, status=200)
+
+    return JsonResponse({"ok": False, "error": _ai_error_message(r)}, status=200)
+
+
+async def web_ai_ask_async(request):
+    """نسخة ASGI من web_ai_ask: السيشن فى thread ونداء الـ API async."""
+    if request.method != "POST":
+        return JsonResponse({"ok": False, "error": "Method not allowed"}, status=405)
+
+    # الـ session backend بتاعنا DB فلازم تتقرا فى thread
+    if not await sync_to_async(_require_auth)(request):
+        return JsonResponse({"ok": False, "error": "Auth required"}, status=401)
+    headers, timeout = _ai_headers(await sync_to_async(_headers)(request))
+
+    q = (request.POST.get("q") or "").strip()
+    if not q:
+        return JsonResponse({"ok": False, "error": "Please type your question."}, status=200)
 
     try:
-        r = requests.post(
-            f"{API}/v1/ask/simple/",
-            json={
-                "q": q,
-                "history": history   # ⬅️ نضيفها هنا
-            },
-            headers=_headers(request),
-            timeout=30,
+        r = await aapi_post(
+            request,
+            "/v1/ask/simple/async/",
+            json=_ai_body(request, q),
+            headers=headers,
+            timeout=timeout,
         )
     except Exception:
         return JsonResponse({"ok": False, "error": "Network error. Please try again."}, status=200)
 
     if r.status_code == 200:
         js = r.json() or {}
-        return JsonResponse({"ok": True, "answer": js.get("answer", "")}, status=200)
+        return JsonResponse({"ok": True, "answer": js.get("answer", ""),
+                             "conversation_id": js.get("conversation_id")}, status=200)
+
+    return JsonResponse({"ok": False, "error": _ai_error_message(r)}, status=200)
+
 
+def _ai_error_message(r):
     try:
         err = r.json().get("error", {}) if r.content else {}
     except Exception:
@@ -2382,5 +2496,58 @@ def web_ai_ask(request):
         msg = "Your subscription is inactive. Please renew your plan to use AI."
     elif code == "ai_limit":
         msg = "You reached today’s AI limit. Try again tomorrow."
+    elif code == "ai_unavailable":
+        msg = err.get("message") or "The AI tutor is busy right now. Please try again in a minute."
+    return msg
 
-    return JsonResponse({"ok": False, "error": msg}, status=200)
+
+def _sse_error(msg):
+    body = f"event: error\ndata: {json.dumps({'message': msg}, ensure_ascii=False)}\n\n"
+    return HttpResponse(body, content_type="text/event-stream; charset=utf-8")
+
+
+async def web_ai_ask_stream(request):
+    """
+    نفس web_ai_ask بس بيعدّى الـ SSE من /v1/ask/stream/ للمتصفح زى ما هو.
+    async علشان تحت الـ uvicorn worker الـ chunks تطلع أول بأول (الـ sync generator بيتجمع).
+    """
+    if request.method != "POST":
+        return JsonResponse({"ok": False, "error": "Method not allowed"}, status=405)
+
+    if not await sync_to_async(_require_auth)(request):
+        return _sse_error("Auth required")
+
+    q = (request.POST.get("q") or "").strip()
+    if not q:
+        return _sse_error("Please type your question.")
+
+    # من غير Accept: text/event-stream علشان الأخطاء ترجع JSON
+    headers, timeout = _ai_headers(await sync_to_async(_headers)(request))
+    try:
+        r = await aapi_post(
+            request,
+            "/v1/ask/stream/",
+            json=_ai_body(request, q),
+            headers=headers,
+            timeout=timeout,
+            stream=True,
+        )
+    except Exception:
+        return _sse_error("Network error. Please try again.")
+
+    if r.status_code != 200:
+        await r.aread()
+        await r.aclose()
+        return _sse_error(_ai_error_message(r))
+
+    async def relay():
+        try:
+            async for chunk in r.aiter_bytes():
+                yield chunk
+        finally:
+            await r.aclose()
+
+    resp = StreamingHttpResponse(relay(), content_type="text/event-stream; charset=utf-8")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp